@@ -0,0 +1,99 @@
+'''
+Copyright (c) 2020 Attila Szarvas <attila.szarvas@gmail.com>
+
+All rights reserved. Use of this source code is governed the 3-Clause BSD
+License BSD-style license that can be found in the LICENSE file.
+'''
+
+import logging
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def rel_to_py(*paths):
+    return os.path.join(os.path.realpath(os.path.dirname(__file__)), *paths)
+
+
+PROJECT_DIR = rel_to_py("..")
+
+CMAKE_LISTS_HEADER = """
+cmake_minimum_required(VERSION 3.12)
+
+project(bbmp_interop_benchmark)
+
+add_subdirectory("{project_dir}" bbmp_interop)
+"""
+
+
+def create_project(source_dir: str, cmake_lists_body: str, sources: Dict[str, str]):
+    """
+    Writes a CMake project into `source_dir` that adds this repository as a subdirectory, followed by
+    `cmake_lists_body`. `sources` maps file names to their content.
+    """
+    with open(os.path.join(source_dir, "CMakeLists.txt"), "w") as file:
+        file.write(
+            CMAKE_LISTS_HEADER.format(project_dir=PROJECT_DIR.replace("\\", "/"))
+        )
+        file.write(cmake_lists_body)
+
+    for name, content in sources.items():
+        with open(os.path.join(source_dir, name), "w") as file:
+            file.write(content)
+
+
+def configure_and_build(
+    source_dir: str,
+    build_dir: str,
+    cmake_args: List[str] = [],
+    targets: Optional[List[str]] = None,
+):
+    subprocess.run(
+        ["cmake", "-S", source_dir, "-B", build_dir, "-DBUILD_TESTING=OFF", *cmake_args],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    for target in targets or [None]:
+        target_args = ["--target", target] if target else []
+        subprocess.run(
+            ["cmake", "--build", build_dir, "--parallel", *target_args],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+
+
+def time_in_subprocess(setup: str, statement: str, cwd: str, repeat: int) -> List[float]:
+    """
+    Runs `statement` after `setup` in fresh interpreters and returns the wall time of `statement` for each run.
+    A fresh interpreter is needed for measuring anything import related, since extension modules can't be unloaded.
+    """
+    code = f"""
+import sys, time
+sys.path.insert(0, {cwd!r})
+{setup}
+start = time.perf_counter()
+{statement}
+print(time.perf_counter() - start)
+"""
+    timings = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            check=True,
+            cwd=cwd,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def summarize(name: str, timings: List[float]):
+    logger.info(
+        f"{name:<40} min {min(timings) * 1e3:9.3f} ms   median {statistics.median(timings) * 1e3:9.3f} ms"
+    )
@@ -0,0 +1,85 @@
+'''
+Copyright (c) 2020 Attila Szarvas <attila.szarvas@gmail.com>
+
+All rights reserved. Use of this source code is governed the 3-Clause BSD
+License BSD-style license that can be found in the LICENSE file.
+
+Compares applying a Python callback to a 1M element channel through a
+`bbmp::BlockFunction<float>` with different block sizes. A block size of 1
+corresponds to calling the callback for every element, as with a
+`std::function<float(float)>` parameter.
+'''
+
+import argparse
+import logging
+import os
+import tempfile
+
+import bbmp_benchmark_util as util
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+KERNELS_SOURCE = """
+#include "bbmp_interop/types.hpp"
+
+#define EXPORT_TO_PYTHON
+
+EXPORT_TO_PYTHON
+void transformInBlocks(bbmp::OwnedChannelData<float>& data,
+                       const bbmp::BlockFunction<float>& function,
+                       const size_t block_size) {
+  for (int chIx = 0; chIx < data.num_channels(); ++chIx) {
+    const auto values = data.GetWriteChannelPtr(chIx);
+    function.transform(bbmp::Span<const float>(values, data.length()),
+                       bbmp::Span<float>(values, data.length()), block_size);
+  }
+}
+"""
+
+CMAKE_LISTS_BODY = """
+add_library(kernels STATIC kernels.cpp)
+set_target_properties(kernels PROPERTIES POSITION_INDEPENDENT_CODE ON)
+target_link_libraries(kernels PRIVATE bbmp_types)
+
+bbmp_add_python_module(pykernels LINK_LIBRARIES kernels)
+"""
+
+BLOCK_SIZES = [1, 64, 4096, 1 << 20]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--length", type=int, default=1 << 20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--cmake-arg",
+        action="append",
+        default=[],
+        help="Passed on to the CMake configure step, e.g. --cmake-arg=-DPython_ROOT_DIR=...",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as source_dir:
+        util.create_project(source_dir, CMAKE_LISTS_BODY, {"kernels.cpp": KERNELS_SOURCE})
+        build_dir = os.path.join(source_dir, "build")
+        util.configure_and_build(source_dir, build_dir, args.cmake_arg, targets=["pykernels"])
+
+        logger.info(f"numpy.sin on {args.length} float32 values, {args.repeat} runs each")
+        setup = f"import numpy as np\nimport pykernels\ndata = np.ones({args.length}, dtype=np.float32)"
+        for block_size in BLOCK_SIZES:
+            util.summarize(
+                f"block size {block_size}",
+                util.time_in_subprocess(
+                    setup,
+                    f"pykernels.transformInBlocks(data, np.sin, {block_size})",
+                    build_dir,
+                    args.repeat,
+                ),
+            )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(message)s")
+    main()
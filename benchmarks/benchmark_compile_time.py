@@ -0,0 +1,117 @@
+'''
+Copyright (c) 2020 Attila Szarvas <attila.szarvas@gmail.com>
+
+All rights reserved. Use of this source code is governed the 3-Clause BSD
+License BSD-style license that can be found in the LICENSE file.
+
+Compares the time it takes to compile generated modules, and the size of their
+object files, with and without the prebuilt `bbmp_python_conversions` library
+(the BBMP_INTEROP_PREBUILT_CONVERSIONS option).
+'''
+
+import argparse
+import glob
+import logging
+import os
+import subprocess
+import tempfile
+import time
+
+import bbmp_benchmark_util as util
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DTYPES = ["float", "double", "int16_t", "int32_t", "uint8_t"]
+
+
+def generate_source(module_ix: int) -> str:
+    lines = [
+        '#include "bbmp_interop/types.hpp"',
+        "",
+        "#include <cstdint>",
+        "",
+        "#define EXPORT_TO_PYTHON",
+        "",
+    ]
+    for dtype in DTYPES:
+        lines += [
+            "EXPORT_TO_PYTHON",
+            f"void fill_{dtype}_{module_ix}(bbmp::OwnedChannelData<{dtype}> data, const {dtype} value) {{",
+            "  for (int ch = 0; ch < data.num_channels(); ++ch)",
+            "    for (size_t i = 0; i < data.length(); ++i) data.GetWriteChannelPtr(ch)[i] = value;",
+            "}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def generate_project(source_dir: str, num_modules: int):
+    cmake_lists_body = ""
+    sources = {}
+    for i in range(num_modules):
+        sources[f"kernels{i}.cpp"] = generate_source(i)
+        cmake_lists_body += f"""
+add_library(kernels{i} STATIC kernels{i}.cpp)
+set_target_properties(kernels{i} PROPERTIES POSITION_INDEPENDENT_CODE ON)
+target_link_libraries(kernels{i} PRIVATE bbmp_types)
+bbmp_add_python_module(pykernels{i} LINK_LIBRARIES kernels{i})
+"""
+    util.create_project(source_dir, cmake_lists_body, sources)
+
+
+def measure(source_dir: str, num_modules: int, prebuilt: bool, cmake_args):
+    build_dir = os.path.join(source_dir, f"build_prebuilt_{'on' if prebuilt else 'off'}")
+    # Everything that doesn't belong to the generated modules is built upfront
+    # and isn't measured.
+    util.configure_and_build(
+        source_dir,
+        build_dir,
+        [*cmake_args, f"-DBBMP_INTEROP_PREBUILT_CONVERSIONS={'ON' if prebuilt else 'OFF'}"],
+        targets=[f"kernels{i}" for i in range(num_modules)]
+        + (["bbmp_python_conversions"] if prebuilt else []),
+    )
+
+    start = time.perf_counter()
+    for i in range(num_modules):
+        subprocess.run(
+            ["cmake", "--build", build_dir, "--target", f"pykernels{i}"],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+    elapsed = time.perf_counter() - start
+
+    object_files = glob.glob(
+        os.path.join(build_dir, "**", "*_interop.cpp.o*"), recursive=True
+    )
+    object_size = sum(os.path.getsize(f) for f in object_files)
+    return elapsed, object_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--modules", type=int, default=8)
+    parser.add_argument(
+        "--cmake-arg",
+        action="append",
+        default=[],
+        help="Passed on to the CMake configure step, e.g. --cmake-arg=-DPython_ROOT_DIR=...",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as source_dir:
+        generate_project(source_dir, args.modules)
+        logger.info(f"Compiling {args.modules} modules serially, {len(DTYPES)} dtypes each")
+        for prebuilt in [False, True]:
+            elapsed, object_size = measure(
+                source_dir, args.modules, prebuilt, args.cmake_arg
+            )
+            logger.info(
+                f"prebuilt conversions {'ON ' if prebuilt else 'OFF'}   "
+                f"{elapsed:7.2f} s   {elapsed / args.modules:6.2f} s/module   "
+                f"interop objects {object_size / 1024:9.1f} KiB"
+            )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(message)s")
+    main()
@@ -0,0 +1,101 @@
+'''
+Copyright (c) 2020 Attila Szarvas <attila.szarvas@gmail.com>
+
+All rights reserved. Use of this source code is governed the 3-Clause BSD
+License BSD-style license that can be found in the LICENSE file.
+
+Compares scaling a float64 channel in place with a float32 kernel, by
+converting it with `astype` in Python and assigning the result back, against
+a kernel exported with `EXPORT_TO_PYTHON_CONVERTING`, which converts into a
+reused scratch buffer and copies the result back. Passing float32 data
+directly is included as the baseline.
+'''
+
+import argparse
+import logging
+import os
+import tempfile
+
+import bbmp_benchmark_util as util
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+KERNELS_SOURCE = """
+#include "bbmp_interop/types.hpp"
+
+#define EXPORT_TO_PYTHON
+#define EXPORT_TO_PYTHON_CONVERTING
+
+namespace {
+void scaleChannels(bbmp::OwnedChannelData<float>& data, const float factor) {
+  for (int chIx = 0; chIx < data.num_channels(); ++chIx) {
+    const auto values = data.GetWriteChannelPtr(chIx);
+    for (size_t i = 0; i < data.length(); ++i) values[i] *= factor;
+  }
+}
+}  // namespace
+
+EXPORT_TO_PYTHON
+void scale(bbmp::OwnedChannelData<float>& data, const float factor) {
+  scaleChannels(data, factor);
+}
+
+EXPORT_TO_PYTHON_CONVERTING
+void scaleConverting(bbmp::OwnedChannelData<float>& data, const float factor) {
+  scaleChannels(data, factor);
+}
+"""
+
+CMAKE_LISTS_BODY = """
+add_library(kernels STATIC kernels.cpp)
+set_target_properties(kernels PROPERTIES POSITION_INDEPENDENT_CODE ON)
+target_link_libraries(kernels PRIVATE bbmp_types)
+
+bbmp_add_python_module(pykernels LINK_LIBRARIES kernels)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--length", type=int, default=1 << 20)
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--cmake-arg",
+        action="append",
+        default=[],
+        help="Passed on to the CMake configure step, e.g. --cmake-arg=-DPython_ROOT_DIR=...",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as source_dir:
+        util.create_project(source_dir, CMAKE_LISTS_BODY, {"kernels.cpp": KERNELS_SOURCE})
+        build_dir = os.path.join(source_dir, "build")
+        util.configure_and_build(source_dir, build_dir, args.cmake_arg, targets=["pykernels"])
+
+        logger.info(f"{args.calls} calls scaling {args.length} values in place, {args.repeat} runs each")
+        setup = (
+            "import numpy as np\nimport pykernels\n"
+            f"data = np.ones({args.length})\nsingle = np.ones({args.length}, dtype=np.float32)"
+        )
+        calls = {
+            "float32 argument": ["pykernels.scale(single, 1.0)"],
+            "astype and assign back": [
+                "converted = data.astype(np.float32)",
+                "pykernels.scale(converted, 1.0)",
+                "data[:] = converted",
+            ],
+            "EXPORT_TO_PYTHON_CONVERTING": ["pykernels.scaleConverting(data, 1.0)"],
+        }
+        for name, lines in calls.items():
+            statement = f"for _ in range({args.calls}):\n" + "\n".join(f"    {l}" for l in lines)
+            util.summarize(
+                name, util.time_in_subprocess(setup, statement, build_dir, args.repeat)
+            )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(message)s")
+    main()
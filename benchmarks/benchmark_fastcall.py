@@ -0,0 +1,93 @@
+'''
+Copyright (c) 2020 Attila Szarvas <attila.szarvas@gmail.com>
+
+All rights reserved. Use of this source code is governed the 3-Clause BSD
+License BSD-style license that can be found in the LICENSE file.
+
+Compares the per-call overhead of tiny exported functions called through the
+generated `METH_FASTCALL` functions, against the pybind11 functions created by
+`m.def`, which the fast path keeps as its fallback in `__self__`.
+'''
+
+import argparse
+import logging
+import os
+import tempfile
+
+import bbmp_benchmark_util as util
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+KERNELS_SOURCE = """
+#include <string>
+
+#define EXPORT_TO_PYTHON
+
+EXPORT_TO_PYTHON
+int eight() { return 8; }
+
+EXPORT_TO_PYTHON
+double mix(const double a, const double b, const int weight) {
+  return a + weight * b;
+}
+
+EXPORT_TO_PYTHON
+std::string hello() { return "Hello from C++"; }
+"""
+
+CMAKE_LISTS_BODY = """
+add_library(kernels STATIC kernels.cpp)
+set_target_properties(kernels PROPERTIES POSITION_INDEPENDENT_CODE ON)
+
+bbmp_add_python_module(pykernels LINK_LIBRARIES kernels)
+"""
+
+CALLS = {
+    "eight()": "eight()",
+    "mix(1.0, 2.0, 3)": "mix(1.0, 2.0, 3)",
+    "hello()": "hello()",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--cmake-arg",
+        action="append",
+        default=[],
+        help="Passed on to the CMake configure step, e.g. --cmake-arg=-DPython_ROOT_DIR=...",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as source_dir:
+        util.create_project(source_dir, CMAKE_LISTS_BODY, {"kernels.cpp": KERNELS_SOURCE})
+        build_dir = os.path.join(source_dir, "build")
+        util.configure_and_build(source_dir, build_dir, args.cmake_arg, targets=["pykernels"])
+
+        logger.info(f"{args.calls} calls, {args.repeat} runs each")
+        for name, call in CALLS.items():
+            function_name = call.split("(")[0]
+            setup = (
+                f"import pykernels\n"
+                f"fast = pykernels.{function_name}\n"
+                f"pybind11_function = fast.__self__"
+            )
+            for label, function in [("METH_FASTCALL", "fast"), ("pybind11", "pybind11_function")]:
+                util.summarize(
+                    f"{name} {label}",
+                    util.time_in_subprocess(
+                        setup,
+                        f"for _ in range({args.calls}): {call.replace(function_name, function, 1)}",
+                        build_dir,
+                        args.repeat,
+                    ),
+                )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(message)s")
+    main()
@@ -0,0 +1,93 @@
+'''
+Copyright (c) 2020 Attila Szarvas <attila.szarvas@gmail.com>
+
+All rights reserved. Use of this source code is governed the 3-Clause BSD
+License BSD-style license that can be found in the LICENSE file.
+
+Compares the import time of a generated module with many exported functions in
+the flat layout (`mod.ns__function`) against the NAMESPACE_SUBMODULES layout
+(`mod.ns.function`), in which functions are registered on first access.
+'''
+
+import argparse
+import logging
+import os
+import tempfile
+
+import bbmp_benchmark_util as util
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def generate_source(num_functions: int, num_namespaces: int) -> str:
+    lines = ['#include "bbmp_interop/types.hpp"', "", "#define EXPORT_TO_PYTHON", ""]
+    for ns in range(num_namespaces):
+        lines.append(f"namespace namespace{ns} {{")
+        for fn in range(ns, num_functions, num_namespaces):
+            lines += [
+                "EXPORT_TO_PYTHON",
+                f"int function{fn}(int value, double factor) {{ return static_cast<int>(value * factor) + {fn}; }}",
+            ]
+        lines.append(f"}}  // namespace namespace{ns}")
+    return "\n".join(lines) + "\n"
+
+
+CMAKE_LISTS_BODY = """
+add_library(kernels STATIC kernels.cpp)
+set_target_properties(kernels PROPERTIES POSITION_INDEPENDENT_CODE ON)
+target_link_libraries(kernels PRIVATE bbmp_types)
+
+bbmp_add_python_module(pyflat LINK_LIBRARIES kernels)
+bbmp_add_python_module(pysubmodules LINK_LIBRARIES kernels NAMESPACE_SUBMODULES)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--functions", type=int, default=2000)
+    parser.add_argument("--namespaces", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument(
+        "--cmake-arg",
+        action="append",
+        default=[],
+        help="Passed on to the CMake configure step, e.g. --cmake-arg=-DPython_ROOT_DIR=...",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as source_dir:
+        util.create_project(
+            source_dir,
+            CMAKE_LISTS_BODY,
+            {"kernels.cpp": generate_source(args.functions, args.namespaces)},
+        )
+        build_dir = os.path.join(source_dir, "build")
+        util.configure_and_build(
+            source_dir, build_dir, args.cmake_arg, targets=["pyflat", "pysubmodules"]
+        )
+
+        logger.info(
+            f"Importing {args.functions} functions in {args.namespaces} namespaces, {args.repeat} runs each"
+        )
+        util.summarize(
+            "flat layout", util.time_in_subprocess("", "import pyflat", build_dir, args.repeat)
+        )
+        util.summarize(
+            "namespace submodules",
+            util.time_in_subprocess("", "import pysubmodules", build_dir, args.repeat),
+        )
+        util.summarize(
+            "namespace submodules, one namespace used",
+            util.time_in_subprocess(
+                "",
+                "import pysubmodules; pysubmodules.namespace0.function0",
+                build_dir,
+                args.repeat,
+            ),
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(message)s")
+    main()
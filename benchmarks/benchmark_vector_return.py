@@ -0,0 +1,115 @@
+'''
+Copyright (c) 2020 Attila Szarvas <attila.szarvas@gmail.com>
+
+All rights reserved. Use of this source code is governed the 3-Clause BSD
+License BSD-style license that can be found in the LICENSE file.
+
+Compares returning a large `std::vector<float>` from a generated module, which
+moves it into an ndarray, against binding the same function by hand with
+pybind11's `stl.h`, which converts it to a list of Python floats.
+'''
+
+import argparse
+import logging
+import os
+import tempfile
+
+import bbmp_benchmark_util as util
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+KERNELS_SOURCE = """
+#include <cstddef>
+#include <vector>
+
+#define EXPORT_TO_PYTHON
+
+EXPORT_TO_PYTHON
+std::vector<float> makeRamp(const size_t length) {
+  std::vector<float> ramp(length);
+  for (size_t i = 0; i < length; ++i) ramp[i] = static_cast<float>(i);
+  return ramp;
+}
+"""
+
+STL_MODULE_SOURCE = """
+#include <cstddef>
+#include <vector>
+
+#include "pybind11/pybind11.h"
+#include "pybind11/stl.h"
+
+std::vector<float> makeRamp(const size_t length);
+
+PYBIND11_MODULE(pystl, m) { m.def("makeRamp", &makeRamp); }
+"""
+
+CMAKE_LISTS_BODY = """
+add_library(kernels STATIC kernels.cpp)
+set_target_properties(kernels PROPERTIES POSITION_INDEPENDENT_CODE ON)
+
+bbmp_add_python_module(pyndarray LINK_LIBRARIES kernels)
+
+add_library(pystl SHARED stl_module.cpp)
+if(UNIX)
+  set_target_properties(pystl PROPERTIES PREFIX "")
+elseif(WIN32)
+  set_target_properties(pystl PROPERTIES SUFFIX ".pyd")
+endif()
+target_link_libraries(pystl PRIVATE kernels bbmp_python_conversions)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--length", type=int, default=10_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--cmake-arg",
+        action="append",
+        default=[],
+        help="Passed on to the CMake configure step, e.g. --cmake-arg=-DPython_ROOT_DIR=...",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as source_dir:
+        util.create_project(
+            source_dir,
+            CMAKE_LISTS_BODY,
+            {"kernels.cpp": KERNELS_SOURCE, "stl_module.cpp": STL_MODULE_SOURCE},
+        )
+        build_dir = os.path.join(source_dir, "build")
+        util.configure_and_build(
+            source_dir, build_dir, args.cmake_arg, targets=["pyndarray", "pystl"]
+        )
+
+        logger.info(f"Returning {args.length} floats, {args.repeat} runs each")
+        setup = "import numpy as np, pyndarray, pystl"
+        util.summarize(
+            "ndarray owning the vector",
+            util.time_in_subprocess(
+                setup, f"pyndarray.makeRamp({args.length})", build_dir, args.repeat
+            ),
+        )
+        util.summarize(
+            "stl.h list",
+            util.time_in_subprocess(
+                setup, f"pystl.makeRamp({args.length})", build_dir, args.repeat
+            ),
+        )
+        util.summarize(
+            "stl.h list converted to ndarray",
+            util.time_in_subprocess(
+                setup,
+                f"np.asarray(pystl.makeRamp({args.length}), dtype=np.float32)",
+                build_dir,
+                args.repeat,
+            ),
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(message)s")
+    main()
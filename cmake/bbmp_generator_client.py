@@ -0,0 +1,167 @@
+'''
+Copyright (c) 2020 Attila Szarvas <attila.szarvas@gmail.com>
+
+All rights reserved. Use of this source code is governed the 3-Clause BSD
+License BSD-style license that can be found in the LICENSE file.
+
+Lightweight client of `bbmp_generator_server.py`. It forwards the command line
+of `generate_cpp_to_py_bindings.py` to a long-lived generator process, so that
+the build doesn't pay for starting the generator and loading its cache for
+every module.
+
+Usage:
+    python bbmp_generator_client.py --server_dir DIR [--idle_timeout SECONDS] -- GENERATOR_ARGUMENTS...
+
+If the server can't be reached, a new one is started in the background for the
+next invocation, and the generator runs in this process instead.
+'''
+
+import json
+import os
+import socket
+import sys
+import time
+from typing import List, Optional
+
+ADDRESS_FILE_NAME = ".tmp.bbmp_generator_server.address"
+STARTUP_LOCK_FILE_NAME = ".tmp.bbmp_generator_server.starting"
+CONNECT_TIMEOUT = 1.0
+RESPONSE_TIMEOUT = 600.0
+DEFAULT_IDLE_TIMEOUT = 600.0
+
+# A server that is still starting up after this many seconds is considered
+# dead, and another one may be started.
+STARTUP_LOCK_TIMEOUT = 10.0
+
+
+def get_address_file_path(server_dir: str):
+    return os.path.join(server_dir, ADDRESS_FILE_NAME)
+
+
+def read_address(server_dir: str) -> Optional[dict]:
+    try:
+        with open(get_address_file_path(server_dir), "r") as address_file:
+            return json.load(address_file)
+    except (OSError, ValueError):
+        return None
+
+
+def request_generation(
+    server_dir: str, generator_argv: List[str], cwd: Optional[str] = None
+) -> Optional[dict]:
+    """
+    :return: dict(returncode=int, output=str) with the result of the generator, or None if the server couldn't
+             be reached or refused to handle the request.
+    """
+    address = read_address(server_dir)
+    if address is None:
+        return None
+
+    request = {
+        "token": address["token"],
+        "cwd": cwd if cwd is not None else os.getcwd(),
+        "argv": generator_argv,
+    }
+
+    try:
+        with socket.create_connection(
+            ("127.0.0.1", address["port"]), timeout=CONNECT_TIMEOUT
+        ) as connection:
+            connection.settimeout(RESPONSE_TIMEOUT)
+            connection.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            with connection.makefile("rb") as response_stream:
+                response = json.loads(response_stream.readline().decode("utf-8"))
+    except (OSError, ValueError):
+        return None
+
+    if response.get("returncode") is None:
+        return None
+
+    return response
+
+
+def start_server(server_dir: str, idle_timeout: float):
+    """Starts a detached server process, unless another client is already starting one."""
+    lock_path = os.path.join(server_dir, STARTUP_LOCK_FILE_NAME)
+    try:
+        if time.time() - os.path.getmtime(lock_path) > STARTUP_LOCK_TIMEOUT:
+            os.remove(lock_path)
+    except OSError:
+        pass
+
+    try:
+        os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except OSError:
+        return
+
+    import subprocess
+
+    server_script = os.path.join(
+        os.path.dirname(os.path.realpath(__file__)), "bbmp_generator_server.py"
+    )
+    command = [
+        sys.executable,
+        server_script,
+        "--server_dir",
+        server_dir,
+        "--idle_timeout",
+        str(idle_timeout),
+    ]
+    if sys.platform == "win32":
+        process_options = {
+            "creationflags": subprocess.DETACHED_PROCESS
+            | subprocess.CREATE_NEW_PROCESS_GROUP
+        }
+    else:
+        process_options = {"start_new_session": True}
+
+    subprocess.Popen(
+        command,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        close_fds=True,
+        **process_options,
+    )
+
+
+def run_in_process(generator_argv: List[str]):
+    import logging
+
+    sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+    import generate_cpp_to_py_bindings as generator
+
+    logging.basicConfig()
+    generator.main(generator_argv)
+
+
+def parse_arguments(argv: List[str]):
+    """argparse is avoided on purpose, the client should start as fast as possible."""
+    separator = argv.index("--") if "--" in argv else len(argv)
+    client_argv, generator_argv = argv[:separator], argv[separator + 1 :]
+    options = dict(zip(client_argv[::2], client_argv[1::2]))
+    if "--server_dir" not in options:
+        sys.exit(__doc__)
+
+    return (
+        options["--server_dir"],
+        float(options.get("--idle_timeout", DEFAULT_IDLE_TIMEOUT)),
+        generator_argv,
+    )
+
+
+def main(argv: List[str]):
+    server_dir, idle_timeout, generator_argv = parse_arguments(argv)
+
+    response = request_generation(server_dir, generator_argv)
+    if response is None:
+        start_server(server_dir, idle_timeout)
+        run_in_process(generator_argv)
+        return 0
+
+    sys.stderr.write(response["output"])
+    return response["returncode"]
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,209 @@
+'''
+Copyright (c) 2020 Attila Szarvas <attila.szarvas@gmail.com>
+
+All rights reserved. Use of this source code is governed the 3-Clause BSD
+License BSD-style license that can be found in the LICENSE file.
+
+Long-lived process running `generate_cpp_to_py_bindings.py` on behalf of
+`bbmp_generator_client.py`. It keeps the changes cache of each build directory
+in memory, i.e. the parsed function signatures and `CodeSections` of every
+source, and only reloads it from disk if it was modified by someone else.
+
+The server listens on a random port of the loopback interface, which it
+publishes together with an access token in an address file inside the server
+directory. It exits when it has been idle for `--idle_timeout` seconds, when
+another server took over the address file, or when the generator scripts
+changed.
+'''
+
+import io
+import json
+import logging
+import os
+import secrets
+import socket
+import sys
+import time
+import traceback
+from typing import Dict, Optional
+
+import bbmp_generator_client as client
+import generate_cpp_to_py_bindings as generator
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+POLL_INTERVAL = 1.0
+
+
+def get_modification_time(path: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+class GeneratorServer:
+    def __init__(self, server_dir: str, idle_timeout: float):
+        self.server_dir = server_dir
+        self.idle_timeout = idle_timeout
+        self.token = secrets.token_hex(16)
+        self.caches: Dict[str, generator.ChangesCache] = {}
+        self.cache_modification_times: Dict[str, Optional[float]] = {}
+
+        self.scripts = [
+            os.path.realpath(generator.__file__),
+            os.path.realpath(client.__file__),
+            os.path.realpath(__file__),
+        ]
+        self.script_modification_times = [
+            get_modification_time(s) for s in self.scripts
+        ]
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.listen(64)
+        self.socket.settimeout(POLL_INTERVAL)
+        self.port = self.socket.getsockname()[1]
+
+    def publish_address(self):
+        address_file_path = client.get_address_file_path(self.server_dir)
+        temporary_path = f"{address_file_path}.{os.getpid()}"
+        file_descriptor = os.open(
+            temporary_path, os.O_CREAT | os.O_TRUNC | os.O_WRONLY, 0o600
+        )
+        with os.fdopen(file_descriptor, "w") as address_file:
+            json.dump(
+                {"port": self.port, "token": self.token, "pid": os.getpid()},
+                address_file,
+            )
+        os.replace(temporary_path, address_file_path)
+
+        try:
+            os.remove(os.path.join(self.server_dir, client.STARTUP_LOCK_FILE_NAME))
+        except OSError:
+            pass
+
+    def owns_address_file(self):
+        address = client.read_address(self.server_dir)
+        return address is not None and address.get("token") == self.token
+
+    def scripts_changed(self):
+        return self.script_modification_times != [
+            get_modification_time(s) for s in self.scripts
+        ]
+
+    def get_changes_cache(self, working_directory: str) -> generator.ChangesCache:
+        """Returns the in-memory cache of a build directory, reloading it if the file on disk was written by
+           another process, e.g. the in-process fallback of a client.
+        """
+        path = generator.get_changes_cache_path(working_directory)
+        modification_time = get_modification_time(path)
+        if (
+            path not in self.caches
+            or self.cache_modification_times[path] != modification_time
+        ):
+            self.caches[path] = generator.ChangesCache(path)
+            self.cache_modification_times[path] = modification_time
+
+        return self.caches[path]
+
+    def handle_request(self, request) -> dict:
+        if not (
+            isinstance(request, dict)
+            and isinstance(request.get("token"), str)
+            and isinstance(request.get("cwd"), str)
+            and isinstance(request.get("argv"), list)
+        ):
+            return {"returncode": None, "output": "malformed request"}
+
+        if not secrets.compare_digest(request["token"], self.token):
+            return {"returncode": None, "output": "invalid token"}
+
+        # A client only falls back to running the generator itself, if the
+        # returncode is None.
+        if self.scripts_changed():
+            return {"returncode": None, "output": "generator changed"}
+
+        cwd = request["cwd"]
+        output = io.StringIO()
+        log_handler = logging.StreamHandler(output)
+        generator.logger.addHandler(log_handler)
+        try:
+            os.chdir(cwd)
+            changes_cache = self.get_changes_cache(cwd)
+            generator.generate(generator.parse_arguments(request["argv"]), changes_cache)
+            self.cache_modification_times[changes_cache.path] = get_modification_time(
+                changes_cache.path
+            )
+            returncode = 0
+        except SystemExit as e:
+            # argparse exits on invalid arguments
+            returncode = e.code if isinstance(e.code, int) else 1
+        except Exception:
+            output.write(traceback.format_exc())
+            returncode = 1
+
+            # The in-memory cache may have been left in an inconsistent state
+            self.caches.pop(generator.get_changes_cache_path(cwd), None)
+        finally:
+            generator.logger.removeHandler(log_handler)
+
+        return {"returncode": returncode, "output": output.getvalue()}
+
+    def handle_connection(self, connection: socket.socket):
+        connection.settimeout(client.RESPONSE_TIMEOUT)
+        with connection.makefile("rb") as request_stream:
+            request = json.loads(request_stream.readline().decode("utf-8"))
+        try:
+            response = self.handle_request(request)
+        except Exception:
+            # A failing request mustn't stop the server for the other clients
+            logger.warning(f"bbmp_generator_server: failed request:\n{traceback.format_exc()}")
+            response = {"returncode": None, "output": "internal server error"}
+        connection.sendall(json.dumps(response).encode("utf-8") + b"\n")
+
+    def serve_forever(self):
+        self.publish_address()
+        last_activity = time.monotonic()
+        try:
+            while True:
+                try:
+                    connection, _ = self.socket.accept()
+                except socket.timeout:
+                    if (
+                        time.monotonic() - last_activity > self.idle_timeout
+                        or not self.owns_address_file()
+                        or self.scripts_changed()
+                    ):
+                        break
+                    continue
+
+                with connection:
+                    try:
+                        self.handle_connection(connection)
+                    except (OSError, ValueError) as e:
+                        logger.warning(f"bbmp_generator_server: dropped request: {e}")
+                last_activity = time.monotonic()
+        finally:
+            self.socket.close()
+            if self.owns_address_file():
+                os.remove(client.get_address_file_path(self.server_dir))
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server_dir", type=str, required=True)
+    parser.add_argument(
+        "--idle_timeout", type=float, default=client.DEFAULT_IDLE_TIMEOUT
+    )
+    args = parser.parse_args()
+
+    GeneratorServer(args.server_dir, args.idle_timeout).serve_forever()
+
+
+if __name__ == "__main__":
+    logging.basicConfig()
+    main()
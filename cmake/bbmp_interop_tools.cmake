@@ -7,12 +7,43 @@ set(BBMP_INTEROP_TOOLS_PATH
     ${CMAKE_CURRENT_LIST_DIR}
     CACHE INTERNAL "")
 
+option(
+  BBMP_INTEROP_PREBUILT_CONVERSIONS
+  "Compile the ndarray conversions once into a static library, instead of in every Python module"
+  ON)
+
+option(
+  BBMP_INTEROP_GENERATOR_SERVER
+  "Run the binding generator in a long-lived background process shared by all Python modules"
+  OFF)
+set(BBMP_INTEROP_GENERATOR_SERVER_IDLE_TIMEOUT
+    600
+    CACHE STRING
+          "Seconds after which an idle binding generator server shuts down")
+
+set(BBMP_INTEROP_GENERATOR_REPORT_DIR
+    ""
+    CACHE
+      PATH
+      "Directory, into which each invocation of the binding generator writes a JSON report of its timings and cache statistics"
+)
+
+set(BBMP_INTEROP_PGO
+    OFF
+    CACHE
+      STRING
+      "Profile-guided optimization stage of the Python modules with a PGO_TRAINING_SCRIPT: OFF, GENERATE or USE"
+)
+set_property(CACHE BBMP_INTEROP_PGO PROPERTY STRINGS OFF GENERATE USE)
+
 macro(SETUP_VARIABLES)
-  set(BBMP_CONVERSIONS_TARGET_NAME "bbmp_python_conversion")
+  set(BBMP_CONVERSIONS_TARGET_NAME "bbmp_python_conversions")
 
   if(NOT BBMP_INTEROP_INSTALLED)
     set(PYBIND11_INCLUDE_DIR
         "${BBMP_INTEROP_TOOLS_PATH}/../extern/pybind11/include")
+    set(BBMP_CONVERSIONS_SOURCE
+        "${BBMP_INTEROP_TOOLS_PATH}/../src/bbmp_interop/conversions.cpp")
     set(BBMP_TYPES_TARGET_NAME bbmp_types)
   else()
     set(BBMP_TYPES_TARGET_NAME bbmp::bbmp_types)
@@ -30,30 +61,185 @@ function(CREATE_BBMP_PYTHON_CONVERSIONS_TARGET)
   find_package(Python ${Python_VERSION} REQUIRED COMPONENTS Interpreter
                                                             Development NumPy)
 
+  set(Python_EXECUTABLE
+      ${Python_EXECUTABLE}
+      PARENT_SCOPE)
+
+  # Every call to bbmp_add_python_module shares the same conversions target
+  if(TARGET ${BBMP_CONVERSIONS_TARGET_NAME})
+    return()
+  endif()
+
   message(STATUS "bbmp_interop is linking to the Python environment belonging to ${Python_EXECUTABLE}")
 
   add_library(extern_pybind11 INTERFACE)
   target_include_directories(extern_pybind11
                              INTERFACE "${PYBIND11_INCLUDE_DIR}")
 
-  add_library(${BBMP_CONVERSIONS_TARGET_NAME} INTERFACE)
+  if(BBMP_INTEROP_PREBUILT_CONVERSIONS)
+    add_library(${BBMP_CONVERSIONS_TARGET_NAME} STATIC
+                "${BBMP_CONVERSIONS_SOURCE}")
+    # INTERFACE libraries don't accept the visibility properties before
+    # CMake 3.19, but they are compiled with the module's anyway
+    set_target_properties(
+      ${BBMP_CONVERSIONS_TARGET_NAME}
+      PROPERTIES POSITION_INDEPENDENT_CODE ON CXX_VISIBILITY_PRESET hidden
+                 VISIBILITY_INLINES_HIDDEN ON)
+    target_compile_definitions(${BBMP_CONVERSIONS_TARGET_NAME}
+                               PUBLIC BBMP_INTEROP_PREBUILT_CONVERSIONS)
+    set(LINK_SCOPE PUBLIC)
+  else()
+    add_library(${BBMP_CONVERSIONS_TARGET_NAME} INTERFACE)
+    set(LINK_SCOPE INTERFACE)
+  endif()
   set_target_properties(${BBMP_CONVERSIONS_TARGET_NAME}
                         PROPERTIES PUBLIC_HEADER conversions.hpp)
-  target_link_libraries(${BBMP_CONVERSIONS_TARGET_NAME} INTERFACE Python::Module
-                                                                  Python::NumPy)
-  target_link_libraries(${BBMP_CONVERSIONS_TARGET_NAME}
-                        INTERFACE extern_pybind11)
+  target_link_libraries(${BBMP_CONVERSIONS_TARGET_NAME} ${LINK_SCOPE}
+                        Python::Module Python::NumPy)
+  target_link_libraries(${BBMP_CONVERSIONS_TARGET_NAME} ${LINK_SCOPE}
+                        extern_pybind11 ${BBMP_TYPES_TARGET_NAME})
+endfunction()
 
-  set(Python_EXECUTABLE
-      ${Python_EXECUTABLE}
-      PARENT_SCOPE)
+# Applies the IPO and PGO options of bbmp_add_python_module to the module and
+# to the libraries of this project that it links, so that the wrappers can be
+# inlined into the exported functions. Libraries shared by multiple modules are
+# only set up once.
+function(SETUP_OPTIMIZATION MODULE_TARGET IPO TRAINING_SCRIPT)
+  set(OPTIMIZED_TARGETS ${MODULE_TARGET})
+  foreach(LIB ${ARGN})
+    if(TARGET ${LIB})
+      get_target_property(LIB_IMPORTED ${LIB} IMPORTED)
+      get_target_property(LIB_TYPE ${LIB} TYPE)
+      if(NOT LIB_IMPORTED AND NOT LIB_TYPE STREQUAL "INTERFACE_LIBRARY")
+        list(APPEND OPTIMIZED_TARGETS ${LIB})
+      endif()
+    endif()
+  endforeach()
+
+  if(IPO)
+    include(CheckIPOSupported)
+    check_ipo_supported(RESULT IPO_SUPPORTED OUTPUT IPO_ERROR LANGUAGES CXX)
+    if(IPO_SUPPORTED)
+      set_target_properties(${OPTIMIZED_TARGETS}
+                            PROPERTIES INTERPROCEDURAL_OPTIMIZATION ON)
+    else()
+      message(WARNING "IPO is not supported, building ${MODULE_TARGET} "
+                      "without it: ${IPO_ERROR}")
+    endif()
+  endif()
+
+  if(NOT TRAINING_SCRIPT OR BBMP_INTEROP_PGO STREQUAL "OFF")
+    return()
+  endif()
+  if(NOT CMAKE_CXX_COMPILER_ID MATCHES "GNU|Clang")
+    message(WARNING "Profile-guided optimization of ${MODULE_TARGET} is only "
+                    "supported with GCC and Clang")
+    return()
+  endif()
+
+  # All modules share the profile directory, so that libraries linked by
+  # multiple modules are trained by all of their scripts
+  set(PGO_DIR "${CMAKE_BINARY_DIR}/bbmp_pgo")
+  if(BBMP_INTEROP_PGO STREQUAL "GENERATE")
+    set(PGO_FLAG "-fprofile-generate=${PGO_DIR}")
+  elseif(BBMP_INTEROP_PGO STREQUAL "USE")
+    if(CMAKE_CXX_COMPILER_ID MATCHES "Clang")
+      set(PGO_FLAG "-fprofile-use=${PGO_DIR}/default.profdata")
+    else()
+      set(PGO_FLAG "-fprofile-use=${PGO_DIR}" "-Wno-missing-profile")
+    endif()
+  else()
+    message(FATAL_ERROR "BBMP_INTEROP_PGO must be OFF, GENERATE or USE")
+  endif()
+
+  foreach(TARGET_TO_OPTIMIZE ${OPTIMIZED_TARGETS})
+    get_target_property(ALREADY_SET_UP ${TARGET_TO_OPTIMIZE}
+                        BBMP_INTEROP_PGO_SET_UP)
+    if(NOT ALREADY_SET_UP)
+      target_compile_options(${TARGET_TO_OPTIMIZE} PRIVATE ${PGO_FLAG})
+      # target_link_options requires CMake 3.13
+      string(REPLACE ";" " " PGO_LINK_FLAGS "${PGO_FLAG}")
+      set_property(
+        TARGET ${TARGET_TO_OPTIMIZE}
+        APPEND_STRING
+        PROPERTY LINK_FLAGS " ${PGO_LINK_FLAGS}")
+      set_target_properties(${TARGET_TO_OPTIMIZE}
+                            PROPERTIES BBMP_INTEROP_PGO_SET_UP ON)
+    endif()
+  endforeach()
+
+  if(NOT BBMP_INTEROP_PGO STREQUAL "GENERATE")
+    return()
+  endif()
+
+  # bbmp_pgo_training runs the training scripts of all modules, and merges the
+  # raw profiles written by Clang
+  get_filename_component(TRAINING_SCRIPT_REALPATH "${TRAINING_SCRIPT}" REALPATH)
+  add_custom_target(
+    ${MODULE_TARGET}_pgo_training
+    COMMAND
+      ${CMAKE_COMMAND} -E env
+      "PYTHONPATH=$<TARGET_FILE_DIR:${MODULE_TARGET}>" "${Python_EXECUTABLE}"
+      "${TRAINING_SCRIPT_REALPATH}"
+    WORKING_DIRECTORY ${CMAKE_CURRENT_BINARY_DIR}
+    DEPENDS ${MODULE_TARGET})
+
+  if(NOT TARGET bbmp_pgo_training)
+    set(MERGE_COMMAND "")
+    if(CMAKE_CXX_COMPILER_ID MATCHES "Clang")
+      get_filename_component(COMPILER_DIR "${CMAKE_CXX_COMPILER}" DIRECTORY)
+      string(REGEX MATCH "^[0-9]+" COMPILER_MAJOR_VERSION
+                   "${CMAKE_CXX_COMPILER_VERSION}")
+      find_program(
+        BBMP_INTEROP_LLVM_PROFDATA
+        NAMES llvm-profdata llvm-profdata-${COMPILER_MAJOR_VERSION}
+        HINTS "${COMPILER_DIR}")
+      if(NOT BBMP_INTEROP_LLVM_PROFDATA)
+        message(FATAL_ERROR "llvm-profdata is required for the profile-guided "
+                            "optimization with Clang")
+      endif()
+      set(MERGE_COMMAND
+          COMMAND "${BBMP_INTEROP_LLVM_PROFDATA}" merge
+          "-output=${PGO_DIR}/default.profdata" "${PGO_DIR}")
+    endif()
+    add_custom_target(bbmp_pgo_training ${MERGE_COMMAND})
+  endif()
+  add_dependencies(bbmp_pgo_training ${MODULE_TARGET}_pgo_training)
 endfunction()
 
+# Sets GENERATOR_COMMAND to the command line that runs the binding generator
+# without its arguments. Python_EXECUTABLE must be set.
+macro(SETUP_GENERATOR_COMMAND)
+  if(BBMP_INTEROP_GENERATOR_SERVER)
+    set(GENERATOR_COMMAND
+        "${Python_EXECUTABLE}" "${BBMP_INTEROP_TOOLS_PATH}/bbmp_generator_client.py"
+        --server_dir "${CMAKE_BINARY_DIR}" --idle_timeout
+        "${BBMP_INTEROP_GENERATOR_SERVER_IDLE_TIMEOUT}" --)
+  else()
+    set(GENERATOR_COMMAND
+        "${Python_EXECUTABLE}"
+        "${BBMP_INTEROP_TOOLS_PATH}/generate_cpp_to_py_bindings.py")
+  endif()
+endmacro()
+
+# Sets GENERATOR_REPORT_OPTION to the --report argument of the generator, if
+# BBMP_INTEROP_GENERATOR_REPORT_DIR is set. The report is named after
+# REPORT_NAME.
+macro(GET_GENERATOR_REPORT_OPTION REPORT_NAME)
+  set(GENERATOR_REPORT_OPTION "")
+  if(BBMP_INTEROP_GENERATOR_REPORT_DIR)
+    file(MAKE_DIRECTORY "${BBMP_INTEROP_GENERATOR_REPORT_DIR}")
+    set(GENERATOR_REPORT_OPTION --report
+                                "${BBMP_INTEROP_GENERATOR_REPORT_DIR}/${REPORT_NAME}.json")
+  endif()
+endmacro()
+
 function(BBMP_ADD_PYTHON_MODULE INTEROP_LIBRARY_TARGET)
   cmake_parse_arguments(
     ADD_PYTHON_MODULE_ARGS
-    "" # list of names of the boolean arguments
-    "" # list of names of mono-valued arguments
+    "NAMESPACE_SUBMODULES;SHARED_MEMORY_HELPER;C_ABI;MEMORY_ACCOUNTING;MULTI_PHASE_INIT;IPO"
+    # list of names of the boolean arguments
+    "PGO_TRAINING_SCRIPT" # list of names of mono-valued arguments
     "LINK_LIBRARIES" # list of names of multi-valued arguments
     ${ARGN})
 
@@ -61,8 +247,6 @@ function(BBMP_ADD_PYTHON_MODULE INTEROP_LIBRARY_TARGET)
 
   set(INTEROP_CPP
       "${CMAKE_CURRENT_BINARY_DIR}/${INTEROP_LIBRARY_TARGET}_interop.cpp")
-  set(BINDING_GENERATOR_SCRIPT_PATH
-      "${BBMP_INTEROP_TOOLS_PATH}/generate_cpp_to_py_bindings.py")
 
   create_bbmp_python_conversions_target()
 
@@ -76,25 +260,256 @@ function(BBMP_ADD_PYTHON_MODULE INTEROP_LIBRARY_TARGET)
                         PRIVATE ${BBMP_TYPES_TARGET_NAME})
   target_link_libraries(${INTEROP_LIBRARY_TARGET}
                         PRIVATE ${BBMP_CONVERSIONS_TARGET_NAME})
+  # Only PyInit_<module> and the accessors of the singletons shared with
+  # linked shared libraries (BBMP_INTEROP_API) need to be exported
+  set_target_properties(
+    ${INTEROP_LIBRARY_TARGET} PROPERTIES CXX_VISIBILITY_PRESET hidden
+                                         VISIBILITY_INLINES_HIDDEN ON)
+
+  # Makes `import bbmp_shared_memory` available next to the module
+  if(ADD_PYTHON_MODULE_ARGS_SHARED_MEMORY_HELPER)
+    add_custom_command(
+      TARGET ${INTEROP_LIBRARY_TARGET}
+      POST_BUILD
+      COMMAND
+        ${CMAKE_COMMAND} -E copy_if_different
+        "${BBMP_INTEROP_TOOLS_PATH}/bbmp_shared_memory.py"
+        "$<TARGET_FILE_DIR:${INTEROP_LIBRARY_TARGET}>")
+  endif()
 
   set(SOURCES_TO_INSPECT "")
+  set(SOURCE_PATHS "")
+  set(EXPORT_MANIFESTS "")
   foreach(LIB ${ADD_PYTHON_MODULE_ARGS_LINK_LIBRARIES})
     target_link_libraries(${INTEROP_LIBRARY_TARGET} PRIVATE ${LIB})
-    get_target_property(LIB_SOURCES ${LIB} SOURCES)
+    get_target_property(LIB_IMPORTED ${LIB} IMPORTED)
+    if(LIB_IMPORTED)
+      # Prebuilt libraries have no sources to inspect. Their exports are read
+      # from the manifest written by bbmp_add_export_manifest(), if any.
+      get_target_property(LIB_SOURCES ${LIB} BBMP_INTEROP_EXPORT_MANIFEST)
+      if(NOT LIB_SOURCES)
+        continue()
+      endif()
+      list(APPEND EXPORT_MANIFESTS "${LIB_SOURCES}")
+    else()
+      get_target_property(LIB_SOURCES ${LIB} SOURCES)
+    endif()
     foreach(SOURCE_FILE ${LIB_SOURCES})
       get_filename_component(SOURCE_FILE_REALPATH ${SOURCE_FILE} REALPATH)
       list(APPEND SOURCES_TO_INSPECT \"${SOURCE_FILE_REALPATH}\")
+      list(APPEND SOURCE_PATHS "${SOURCE_FILE_REALPATH}")
     endforeach()
   endforeach()
 
+  setup_optimization(
+    ${INTEROP_LIBRARY_TARGET} "${ADD_PYTHON_MODULE_ARGS_IPO}"
+    "${ADD_PYTHON_MODULE_ARGS_PGO_TRAINING_SCRIPT}"
+    ${ADD_PYTHON_MODULE_ARGS_LINK_LIBRARIES})
+
   get_filename_component(INTEROP_CPP_REALPATH "${INTEROP_CPP}" REALPATH)
 
+  get_property(BATCH_ACTIVE DIRECTORY PROPERTY BBMP_INTEROP_BATCH_ACTIVE)
+  if(BATCH_ACTIVE)
+    # The module is generated by the single generator step that
+    # bbmp_end_python_module_batch() adds for the whole directory.
+    if(SOURCE_PATHS)
+      string(REPLACE ";" "\", \"" SOURCES_JSON "\"${SOURCE_PATHS}\"")
+    else()
+      # Libraries without sources, e.g. imported ones without an export
+      # manifest, don't add any
+      set(SOURCES_JSON "")
+    endif()
+    if(ADD_PYTHON_MODULE_ARGS_NAMESPACE_SUBMODULES)
+      set(NAMESPACE_SUBMODULES_JSON true)
+    else()
+      set(NAMESPACE_SUBMODULES_JSON false)
+    endif()
+    if(ADD_PYTHON_MODULE_ARGS_C_ABI)
+      set(C_ABI_JSON true)
+    else()
+      set(C_ABI_JSON false)
+    endif()
+    if(ADD_PYTHON_MODULE_ARGS_MEMORY_ACCOUNTING)
+      set(MEMORY_ACCOUNTING_JSON true)
+    else()
+      set(MEMORY_ACCOUNTING_JSON false)
+    endif()
+    if(ADD_PYTHON_MODULE_ARGS_MULTI_PHASE_INIT)
+      set(MULTI_PHASE_INIT_JSON true)
+    else()
+      set(MULTI_PHASE_INIT_JSON false)
+    endif()
+    set_property(
+      DIRECTORY
+      APPEND
+      PROPERTY
+        BBMP_INTEROP_BATCH_MODULES
+        "{\"module_name\": \"${INTEROP_LIBRARY_TARGET}\", \"output\": \"${INTEROP_CPP_REALPATH}\", \"sources\": [${SOURCES_JSON}], \"namespace_submodules\": ${NAMESPACE_SUBMODULES_JSON}, \"c_abi\": ${C_ABI_JSON}, \"memory_accounting\": ${MEMORY_ACCOUNTING_JSON}, \"multi_phase_init\": ${MULTI_PHASE_INIT_JSON}}"
+    )
+    set_property(DIRECTORY APPEND PROPERTY BBMP_INTEROP_BATCH_TARGETS
+                                           ${INTEROP_LIBRARY_TARGET})
+    set_property(DIRECTORY APPEND PROPERTY BBMP_INTEROP_BATCH_OUTPUTS
+                                           "${INTEROP_CPP}")
+    set_property(
+      DIRECTORY APPEND PROPERTY BBMP_INTEROP_BATCH_DEPENDS
+                                ${ADD_PYTHON_MODULE_ARGS_LINK_LIBRARIES}
+                                ${EXPORT_MANIFESTS})
+    return()
+  endif()
+
+  setup_generator_command()
+
+  set(GENERATOR_OPTIONS "")
+  if(ADD_PYTHON_MODULE_ARGS_NAMESPACE_SUBMODULES)
+    list(APPEND GENERATOR_OPTIONS --namespace_submodules)
+  endif()
+  if(ADD_PYTHON_MODULE_ARGS_C_ABI)
+    list(APPEND GENERATOR_OPTIONS --c_abi)
+  endif()
+  if(ADD_PYTHON_MODULE_ARGS_MEMORY_ACCOUNTING)
+    list(APPEND GENERATOR_OPTIONS --memory_accounting)
+  endif()
+  if(ADD_PYTHON_MODULE_ARGS_MULTI_PHASE_INIT)
+    list(APPEND GENERATOR_OPTIONS --multi_phase_init)
+  endif()
+  get_generator_report_option(${INTEROP_LIBRARY_TARGET})
+
   add_custom_command(
     OUTPUT "${INTEROP_CPP}"
     COMMAND
-      "${Python_EXECUTABLE}" "${BINDING_GENERATOR_SCRIPT_PATH}" --output
+      ${GENERATOR_COMMAND} --output
       "${INTEROP_CPP_REALPATH}" --sources "${SOURCES_TO_INSPECT}" --module_name
-      "${INTEROP_LIBRARY_TARGET}"
+      "${INTEROP_LIBRARY_TARGET}" ${GENERATOR_OPTIONS}
+      ${GENERATOR_REPORT_OPTION}
     WORKING_DIRECTORY ${CMAKE_CURRENT_BINARY_DIR}
-    DEPENDS ${ADD_PYTHON_MODULE_ARGS_LINK_LIBRARIES})
+    DEPENDS ${ADD_PYTHON_MODULE_ARGS_LINK_LIBRARIES} ${EXPORT_MANIFESTS})
+endfunction()
+
+#[===========================================================================[
+Writes the signatures of the functions exported by LIBRARY_TARGET into
+<LIBRARY_TARGET>.bbmp_exports.json in the current binary directory. Python
+modules of projects linking the installed library are generated from this
+manifest, without the sources of the library.
+
+  bbmp_add_export_manifest(foo INSTALL_DESTINATION lib/cmake/foo
+                           NAMESPACE foo::)
+
+With INSTALL_DESTINATION the manifest is installed there along with
+foo-bbmp-exports.cmake, which points the BBMP_INTEROP_EXPORT_MANIFEST property
+of the imported target foo::foo to it. Include it in the package config file
+after the imported targets are defined:
+
+  include("${CMAKE_CURRENT_LIST_DIR}/foo-targets.cmake")
+  include("${CMAKE_CURRENT_LIST_DIR}/foo-bbmp-exports.cmake")
+
+bbmp_add_python_module() reads the manifest of imported targets having this
+property.
+#]===========================================================================]
+function(BBMP_ADD_EXPORT_MANIFEST LIBRARY_TARGET)
+  cmake_parse_arguments(
+    ADD_EXPORT_MANIFEST_ARGS
+    "" # list of names of the boolean arguments
+    "INSTALL_DESTINATION;NAMESPACE" # list of names of mono-valued arguments
+    "" # list of names of multi-valued arguments
+    ${ARGN})
+
+  if(NOT Python_EXECUTABLE)
+    if(Python_ROOT_DIR)
+      set(Python_FIND_STRATEGY LOCATION)
+    else()
+      set(Python_FIND_STRATEGY VERSION)
+    endif()
+    find_package(Python ${Python_VERSION} REQUIRED COMPONENTS Interpreter)
+  endif()
+  setup_generator_command()
+
+  set(SOURCES_TO_INSPECT "")
+  set(SOURCE_PATHS "")
+  get_target_property(LIB_SOURCES ${LIBRARY_TARGET} SOURCES)
+  get_target_property(LIB_SOURCE_DIR ${LIBRARY_TARGET} SOURCE_DIR)
+  foreach(SOURCE_FILE ${LIB_SOURCES})
+    get_filename_component(SOURCE_FILE_REALPATH ${SOURCE_FILE} REALPATH
+                           BASE_DIR "${LIB_SOURCE_DIR}")
+    list(APPEND SOURCES_TO_INSPECT \"${SOURCE_FILE_REALPATH}\")
+    list(APPEND SOURCE_PATHS "${SOURCE_FILE_REALPATH}")
+  endforeach()
+
+  set(EXPORT_MANIFEST
+      "${CMAKE_CURRENT_BINARY_DIR}/${LIBRARY_TARGET}.bbmp_exports.json")
+  add_custom_command(
+    OUTPUT "${EXPORT_MANIFEST}"
+    COMMAND
+      ${GENERATOR_COMMAND} --export_manifest "${EXPORT_MANIFEST}" --sources
+      "${SOURCES_TO_INSPECT}" --library_name "${LIBRARY_TARGET}"
+    WORKING_DIRECTORY ${CMAKE_CURRENT_BINARY_DIR}
+    DEPENDS ${SOURCE_PATHS})
+  add_custom_target(${LIBRARY_TARGET}_bbmp_exports ALL
+                    DEPENDS "${EXPORT_MANIFEST}")
+
+  if(ADD_EXPORT_MANIFEST_ARGS_INSTALL_DESTINATION)
+    set(EXPORTS_SCRIPT
+        "${CMAKE_CURRENT_BINARY_DIR}/${LIBRARY_TARGET}-bbmp-exports.cmake")
+    file(
+      WRITE "${EXPORTS_SCRIPT}"
+      "set_property(\n  TARGET ${ADD_EXPORT_MANIFEST_ARGS_NAMESPACE}${LIBRARY_TARGET}\n  PROPERTY BBMP_INTEROP_EXPORT_MANIFEST\n           \"\${CMAKE_CURRENT_LIST_DIR}/${LIBRARY_TARGET}.bbmp_exports.json\")\n"
+    )
+    install(FILES "${EXPORT_MANIFEST}" "${EXPORTS_SCRIPT}"
+            DESTINATION ${ADD_EXPORT_MANIFEST_ARGS_INSTALL_DESTINATION})
+  endif()
+endfunction()
+
+#[===========================================================================[
+Python modules added between these two calls in the same directory are
+generated by a single invocation of the binding generator, which parses
+sources shared by multiple modules only once.
+
+  bbmp_begin_python_module_batch()
+  bbmp_add_python_module(pyfoo LINK_LIBRARIES foo)
+  bbmp_add_python_module(pybar LINK_LIBRARIES foo bar)
+  bbmp_end_python_module_batch()
+#]===========================================================================]
+function(BBMP_BEGIN_PYTHON_MODULE_BATCH)
+  set_property(DIRECTORY PROPERTY BBMP_INTEROP_BATCH_ACTIVE ON)
+  foreach(PROPERTY MODULES TARGETS OUTPUTS DEPENDS)
+    set_property(DIRECTORY PROPERTY BBMP_INTEROP_BATCH_${PROPERTY} "")
+  endforeach()
+endfunction()
+
+function(BBMP_END_PYTHON_MODULE_BATCH)
+  set_property(DIRECTORY PROPERTY BBMP_INTEROP_BATCH_ACTIVE OFF)
+  foreach(PROPERTY MODULES TARGETS OUTPUTS DEPENDS)
+    get_property(BATCH_${PROPERTY} DIRECTORY
+                 PROPERTY BBMP_INTEROP_BATCH_${PROPERTY})
+  endforeach()
+
+  if(NOT BATCH_TARGETS)
+    return()
+  endif()
+
+  create_bbmp_python_conversions_target()
+  setup_generator_command()
+
+  list(GET BATCH_TARGETS 0 FIRST_TARGET)
+  get_generator_report_option(${FIRST_TARGET}_batch)
+  set(MANIFEST
+      "${CMAKE_CURRENT_BINARY_DIR}/${FIRST_TARGET}_batch_manifest.json")
+  string(REPLACE ";" ",\n    " MODULES_JSON "${BATCH_MODULES}")
+  file(
+    GENERATE
+    OUTPUT "${MANIFEST}"
+    CONTENT "{\n  \"modules\": [\n    ${MODULES_JSON}\n  ]\n}\n")
+
+  add_custom_command(
+    OUTPUT ${BATCH_OUTPUTS}
+    COMMAND ${GENERATOR_COMMAND} --manifest "${MANIFEST}"
+            ${GENERATOR_REPORT_OPTION}
+    WORKING_DIRECTORY ${CMAKE_CURRENT_BINARY_DIR}
+    DEPENDS ${BATCH_DEPENDS} "${MANIFEST}")
+
+  # The modules depend on a single target running the command, otherwise
+  # Makefile generators could run it once for each module in parallel.
+  add_custom_target(${FIRST_TARGET}_batch_generation DEPENDS ${BATCH_OUTPUTS})
+  foreach(TARGET ${BATCH_TARGETS})
+    add_dependencies(${TARGET} ${FIRST_TARGET}_batch_generation)
+  endforeach()
 endfunction()
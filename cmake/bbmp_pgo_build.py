@@ -0,0 +1,71 @@
+'''
+Copyright (c) 2020 Attila Szarvas <attila.szarvas@gmail.com>
+
+All rights reserved. Use of this source code is governed the 3-Clause BSD
+License BSD-style license that can be found in the LICENSE file.
+
+Two-stage profile-guided optimization of the Python modules, that were added
+with a PGO_TRAINING_SCRIPT. The already configured build directory is switched
+to instrumented builds, the training scripts run against the instrumented
+modules, and then the modules are built again using the recorded profiles.
+
+Usage:
+    python bbmp_pgo_build.py --build_dir DIR [--config Release] [--parallel N]
+
+The build directory stays configured with BBMP_INTEROP_PGO=USE, so later builds
+keep using the profiles, until they are recorded again with this script or
+BBMP_INTEROP_PGO is set to OFF.
+'''
+
+import argparse
+import logging
+import os
+import shutil
+import subprocess
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+PROFILE_DIRECTORY_NAME = "bbmp_pgo"
+
+
+def run(command: List[str]):
+    logger.info(" ".join(command))
+    subprocess.run(command, check=True)
+
+
+def configure(build_dir: str, stage: str):
+    run(["cmake", f"-DBBMP_INTEROP_PGO={stage}", build_dir])
+
+
+def build(build_dir: str, config: Optional[str], parallel: Optional[int], target: Optional[str] = None):
+    command = ["cmake", "--build", build_dir]
+    if target is not None:
+        command += ["--target", target]
+    if config is not None:
+        command += ["--config", config]
+    if parallel is not None:
+        command += ["--parallel", str(parallel)]
+    run(command)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--build_dir", type=str, required=True, help="A build directory configured by CMake")
+    parser.add_argument("--config", type=str, help="Configuration of multi-config generators, e.g. Release")
+    parser.add_argument("--parallel", type=int, help="Parallel jobs of the builds")
+    args = parser.parse_args(argv)
+
+    # Counters of earlier trainings would be merged into the new profile
+    shutil.rmtree(os.path.join(args.build_dir, PROFILE_DIRECTORY_NAME), ignore_errors=True)
+
+    configure(args.build_dir, "GENERATE")
+    build(args.build_dir, args.config, args.parallel, "bbmp_pgo_training")
+    configure(args.build_dir, "USE")
+    build(args.build_dir, args.config, args.parallel)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(message)s")
+    main()
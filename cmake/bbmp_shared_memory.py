@@ -0,0 +1,137 @@
+'''
+Copyright (c) 2020 Attila Szarvas <attila.szarvas@gmail.com>
+
+All rights reserved. Use of this source code is governed the 3-Clause BSD
+License BSD-style license that can be found in the LICENSE file.
+
+Passes ndarrays to exported functions running in `multiprocessing` workers
+without copying their data.
+
+    with SharedMemoryPool() as shared_memory, multiprocessing.Pool() as pool:
+        data = shared_memory.copy(np.ones((4, 48000), dtype=np.float32))
+        pool.map(worker, [data[i:i + 1] for i in range(4)])
+
+`SharedNdarray` is an ndarray in a named shared memory block, that pickles as
+the name of the block and the position of the array in it. Unpickling it in
+a worker maps the same block, so exported functions taking
+`bbmp::OwnedChannelData<T>` operate on the shared memory directly, and their
+modifications are visible to every process.
+'''
+
+import logging
+import weakref
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+# Blocks mapped into this process, either created by a `SharedMemoryPool` or
+# attached to when unpickling a `SharedNdarray`.
+_mapped_blocks: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    block = _mapped_blocks.get(name)
+    if block is None:
+        try:
+            # Only the process that created the block may unlink it
+            block = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            block = shared_memory.SharedMemory(name=name)
+        _mapped_blocks[name] = block
+    return block
+
+
+def _get_block_address(block: shared_memory.SharedMemory) -> int:
+    return np.frombuffer(block.buf, dtype=np.uint8).__array_interface__["data"][0]
+
+
+def _rebuild_shared_ndarray(name: str, shape, dtype: str, strides, offset: int):
+    block = _attach(name)
+    array = np.ndarray(
+        shape, dtype=dtype, buffer=block.buf, offset=offset, strides=strides
+    ).view(SharedNdarray)
+    array._bbmp_block = block
+    return array
+
+
+class SharedNdarray(np.ndarray):
+    """An ndarray in a shared memory block. Views of it, like slices, are also `SharedNdarray`s and pickle without
+       their data.
+    """
+
+    def __array_finalize__(self, obj):
+        self._bbmp_block: Optional[shared_memory.SharedMemory] = getattr(
+            obj, "_bbmp_block", None
+        )
+
+    def __reduce__(self):
+        block = self._bbmp_block
+        if block is not None:
+            offset = self.__array_interface__["data"][0] - _get_block_address(block)
+            # Results of computations on a `SharedNdarray`, e.g. `data + 1`, are
+            # `SharedNdarray`s too, but their data is not in the block.
+            if 0 <= offset and offset + self.nbytes <= block.size:
+                return (
+                    _rebuild_shared_ndarray,
+                    (block.name, self.shape, self.dtype.str, self.strides, offset),
+                )
+
+        return np.array(self).__reduce__()
+
+
+def _release_blocks(blocks: List[shared_memory.SharedMemory]):
+    for block in blocks:
+        _mapped_blocks.pop(block.name, None)
+        try:
+            block.close()
+        except BufferError:
+            # Arrays in this process still refer to the block. The memory is
+            # freed once they and every other process release it.
+            logger.debug(f"shared memory block {block.name} is still in use")
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+    blocks.clear()
+
+
+class SharedMemoryPool:
+    """Allocates named shared memory blocks in the parent process. The blocks are unlinked by `close()`, at the end
+       of a `with` statement, or when the pool is garbage collected.
+
+       Close the pool after the worker processes using its arrays are done, e.g. after `multiprocessing.Pool.join()`
+       or at the end of the `with` statement of the `multiprocessing.Pool`.
+    """
+
+    def __init__(self):
+        self._blocks: List[shared_memory.SharedMemory] = []
+        self._finalizer = weakref.finalize(self, _release_blocks, self._blocks)
+
+    def empty(self, shape, dtype=np.float32) -> SharedNdarray:
+        dtype = np.dtype(dtype)
+        size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        block = shared_memory.SharedMemory(create=True, size=size)
+        self._blocks.append(block)
+        _mapped_blocks[block.name] = block
+
+        return _rebuild_shared_ndarray(block.name, shape, dtype.str, None, 0)
+
+    def copy(self, ndarray: np.ndarray) -> SharedNdarray:
+        """Returns a C contiguous copy of `ndarray` in shared memory."""
+        shared_ndarray = self.empty(ndarray.shape, ndarray.dtype)
+        shared_ndarray[...] = ndarray
+        return shared_ndarray
+
+    def close(self):
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
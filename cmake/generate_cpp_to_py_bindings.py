@@ -5,11 +5,14 @@ All rights reserved. Use of this source code is governed the 3-Clause BSD
 License BSD-style license that can be found in the LICENSE file.
 '''
 
+import contextlib
+import io
 import logging
 import os
 import pathlib
 import pickle
 import re
+import time
 from string import Template
 from typing import Any, Dict, List, Optional, TextIO, Tuple, Union
 
@@ -18,31 +21,76 @@ logger.setLevel(logging.INFO)
 
 
 NAME_OF_THIS_FILE = pathlib.PurePath(__file__).name
-CHANGES_CACHE_PATH = os.path.join(os.getcwd(), f".tmp.{NAME_OF_THIS_FILE}.cache")
+
+
+def get_changes_cache_path(working_directory: str):
+    return os.path.join(working_directory, f".tmp.{NAME_OF_THIS_FILE}.cache")
+
+
+CHANGES_CACHE_PATH = get_changes_cache_path(os.getcwd())
 INTERMEDIATE_CACHE_PATH = os.path.join(
     os.getcwd(), f"{NAME_OF_THIS_FILE}.intermediate.cache"
 )
 EXPORT_ANNOTATION = "EXPORT_TO_PYTHON"
+TYPED_EXPORT_ANNOTATION = f"{EXPORT_ANNOTATION}_TYPES"
+CONVERTING_EXPORT_ANNOTATION = f"{EXPORT_ANNOTATION}_CONVERTING"
+
+
+def count_braces(line: str, in_block_comment: bool) -> Tuple[int, bool]:
+    """Returns tuple(change_in_brace_depth, in_block_comment_at_the_end_of_the_line).
+
+       Braces inside string and character literals and comments don't count.
+    """
+    depth_change = 0
+    quote = None
+    i = 0
+    while i < len(line):
+        c = line[i]
+        if in_block_comment:
+            if line.startswith("*/", i):
+                in_block_comment = False
+                i += 1
+        elif quote is not None:
+            if c == "\\":
+                i += 1
+            elif c == quote:
+                quote = None
+        elif line.startswith("//", i):
+            break
+        elif line.startswith("/*", i):
+            in_block_comment = True
+            i += 1
+        elif c in "\"'":
+            quote = c
+        elif c == "{":
+            depth_change += 1
+        elif c == "}":
+            depth_change -= 1
+        i += 1
+
+    return depth_change, in_block_comment
 
 
 def cpp_indent(code, spaces):
-    indented_code = ""
+    """Indents every line by the brace depth at its beginning, in a single pass over the code. Lines starting with
+       closing braces are indented at the depth they close to.
+    """
+    indented_lines = []
 
     level = 0
+    in_block_comment = False
     for line in code.splitlines():
-        if "}" not in line:
-            indented_code += f'{"".join([" "] * level * spaces)}{line}\n'
-
-        if "{" in line:
-            level += 1
+        line = line.strip()
+        line_level = level
+        if not in_block_comment:
+            line_level -= len(line) - len(line.lstrip("}"))
 
-        if "}" in line:
-            level -= 1
+        indented_lines.append(f'{" " * max(line_level, 0) * spaces}{line}\n' if line else "\n")
 
-        if "}" in line:
-            indented_code += f'{"".join([" "] * level * spaces)}{line}\n'
+        depth_change, in_block_comment = count_braces(line, in_block_comment)
+        level = max(level + depth_change, 0)
 
-    return indented_code
+    return "".join(indented_lines)
 
 
 def load_json_maybe(path):
@@ -56,10 +104,19 @@ def load_json_maybe(path):
 class ChangesCache:
     def __init__(self, path):
         self.path = path
+        start = time.perf_counter()
         self.cache: Dict[str, Any] = load_json_maybe(path)
 
+        # Reported by the first invocation using the cache. The generator server
+        # keeps caches in memory between invocations.
+        self.load_seconds = time.perf_counter() - start
+
+        # Whether the cache has been modified since it was loaded or saved
+        self.dirty = False
+
     def erase(self):
         self.cache = {}
+        self.dirty = True
 
     def get_changed_file_paths(self, file_paths: List[str]):
         changed_file_paths = []
@@ -81,16 +138,18 @@ class ChangesCache:
         if path not in self.cache.keys():
             self.cache[path] = {}
         self.cache[path]["last_modification_time"] = os.path.getmtime(path)
+        self.dirty = True
 
-    def store_data(self, path, data):
+    def store_data(self, path, data, key="data"):
         if path not in self.cache.keys():
             self.cache[path] = {}
-        self.cache[path]["data"] = data
+        self.cache[path][key] = data
+        self.dirty = True
 
-    def get_data(self, path):
+    def get_data(self, path, key="data"):
         data = None
         try:
-            data = self.cache[path]["data"]
+            data = self.cache[path][key]
         except:
             pass
 
@@ -111,6 +170,30 @@ class ChangesCache:
         )
         with open(self.path, "wb") as file:
             pickle.dump(self.cache, file)
+        self.dirty = False
+
+
+TYPED_EXPORT_REGEX = re.compile(
+    rf"^{TYPED_EXPORT_ANNOTATION}\s*\(([^)]*)\)\s*template\s*<\s*(?:typename|class)\s+([a-zA-Z0-9_]+)\s*>\s*(.*)$",
+    re.DOTALL,
+)
+
+
+def split_outside_angle_brackets(code: str) -> List[str]:
+    """Splits at whitespace like `str.split()`, except within template arguments, e.g. `bbmp::Span<const uint8_t>`."""
+    tokens = [""]
+    depth = 0
+    for c in code:
+        if c.isspace() and depth == 0:
+            if tokens[-1]:
+                tokens.append("")
+            continue
+        if c == "<":
+            depth += 1
+        elif c == ">":
+            depth = max(depth - 1, 0)
+        tokens[-1] += c
+    return [t for t in tokens if t]
 
 
 class FunctionSignature:
@@ -121,17 +204,38 @@ class FunctionSignature:
         self.parameters: Tuple[str, str] = []
         self.specifiers: List[str] = []
 
+        # Set for function templates annotated with `EXPORT_TO_PYTHON_TYPES(...)`
+        self.template_parameter: Optional[str] = None
+        self.template_types: List[str] = []
+
+        # Set for functions annotated with `EXPORT_TO_PYTHON_CONVERTING`, whose
+        # `bbmp::OwnedChannelData<T>` parameters accept any dtype and layout
+        self.convert_dtypes = False
+        if signature_str.strip().startswith(CONVERTING_EXPORT_ANNOTATION):
+            self.convert_dtypes = True
+            signature_str = signature_str.strip()[len(CONVERTING_EXPORT_ANNOTATION) :]
+
+        typed_export_match = TYPED_EXPORT_REGEX.match(signature_str.strip())
+        if typed_export_match is not None:
+            template_types, self.template_parameter, signature_str = (
+                typed_export_match.groups()
+            )
+            self.template_types = [
+                t.strip() for t in template_types.split(",") if t.strip()
+            ]
+
         return_type_and_name, _, rest = signature_str.partition("(")
         return_type_and_name_tokens = return_type_and_name.split()
         self.return_type = " ".join(return_type_and_name_tokens[:-1])
         self.name = return_type_and_name_tokens[-1]
         parameters_string, _, decorators = rest.partition(")")
         for type_and_maybe_name_str in parameters_string.split(","):
-            base_type_and_maybe_name = (
+            if not type_and_maybe_name_str.strip():
+                continue
+            base_type_and_maybe_name = split_outside_angle_brackets(
                 type_and_maybe_name_str.replace("const", "")
                 .replace("*", "")
                 .replace("&", "")
-                .split()
             )
             name = None
             if len(base_type_and_maybe_name) > 1:
@@ -154,7 +258,21 @@ class FunctionSignature:
         def get_parameter_str(p: Tuple[str, Optional[str]]):
             return f"{p[0]} {p[1]}" if p[1] else p[0]
 
-        return f"{self.return_type} {self.name}({', '.join([get_parameter_str(p) for p in self.parameters])}) {' '.join(self.specifiers)}".strip()
+        signature = f"{self.return_type} {self.name}({', '.join([get_parameter_str(p) for p in self.parameters])}) {' '.join(self.specifiers)}".strip()
+        if self.template_parameter is not None:
+            signature = f"template <typename {self.template_parameter}> {signature}"
+
+        return signature
+
+    def get_instantiation_signature(self, template_type: str):
+        """Explicit instantiation of a function template for one of its `template_types`, without the leading
+           `template` keyword.
+        """
+        substitute = lambda s: re.sub(
+            rf"\b{self.template_parameter}\b", template_type, s
+        )
+        parameters = ", ".join([substitute(p[0]) for p in self.parameters])
+        return f"{substitute(self.return_type)} {self.name}<{template_type}>({parameters})"
 
     def get_fully_qualified_name(self):
         if self.namespace is None:
@@ -244,6 +362,14 @@ def extract_function_signatures_from_cpp(
                 break
 
             start = annotation_start + len(EXPORT_ANNOTATION)
+
+            # The list of types and the conversion annotation are kept as part
+            # of the signature, they are parsed by `FunctionSignature`
+            if code.startswith(TYPED_EXPORT_ANNOTATION, annotation_start) or code.startswith(
+                CONVERTING_EXPORT_ANNOTATION, annotation_start
+            ):
+                start = annotation_start
+
             first_bracket = code.find("{", start)
             first_semicolon = code.find(";", start)
             end = None
@@ -262,11 +388,92 @@ def extract_function_signatures_from_cpp(
     return functions
 
 
+OUT_CHANNEL_DATA_TYPE = "bbmp::OutChannelData"
+
+
+def is_out_parameter(parameter_type: str) -> bool:
+    return OUT_CHANNEL_DATA_TYPE in parameter_type
+
+
+ARITHMETIC_VECTOR_REGEX = re.compile(
+    r"^(?:const\s+)?std::vector<\s*(float|double|(?:u?int(?:8|16|32|64)_t))\s*>$"
+)
+
+
+def is_arithmetic_vector(return_type: str) -> bool:
+    """`std::vector`s of arithmetic types are returned as ndarrays taking ownership of the vector, instead of being
+       converted to lists element by element.
+    """
+    return ARITHMETIC_VECTOR_REGEX.match(return_type.strip()) is not None
+
+
+OWNED_CHANNEL_DATA_RETURN_REGEX = re.compile(
+    r"^(?:const\s+)?bbmp::OwnedChannelData<\s*[\w\s:]+\s*>$"
+)
+
+
+def is_ndarray_return(return_type: str) -> bool:
+    """Returned arithmetic vectors and `bbmp::OwnedChannelData<T>` values are converted with `bbmp::toNdarray`. The
+       latter give two-dimensional ndarrays, which own channels following each other in memory, e.g. those of a mapped
+       file, without copying them.
+    """
+    return (
+        is_arithmetic_vector(return_type)
+        or OWNED_CHANNEL_DATA_RETURN_REGEX.match(return_type.strip()) is not None
+    )
+
+
+SPAN_TYPE = "bbmp::Span"
+STRING_VIEW_TYPE = "std::string_view"
+BLOCK_FUNCTION_TYPE = "bbmp::BlockFunction"
+
+
+def is_view_parameter(parameter_type: str) -> bool:
+    """Parameters viewing the buffer of the Python argument for the duration of the call, without copying it."""
+    return SPAN_TYPE in parameter_type or STRING_VIEW_TYPE in parameter_type
+
+
+def get_parameter_names(function_signature: FunctionSignature) -> List[str]:
+    """Names of the parameters in the generated wrappers. Unnamed parameters are named by their position."""
+    return [
+        p[1] if p[1] is not None else f"arg{i}"
+        for i, p in enumerate(function_signature.parameters)
+    ]
+
+
+def get_python_parameter_order(function_signature: FunctionSignature) -> List[int]:
+    """Output parameters (`bbmp::OutChannelData<T>`) become optional keyword arguments, so they are moved behind
+       the other parameters in the Python function and the wrappers.
+    """
+    indices = range(len(function_signature.parameters))
+    is_out = [is_out_parameter(p[0]) for p in function_signature.parameters]
+    return [i for i in indices if not is_out[i]] + [i for i in indices if is_out[i]]
+
+
 def get_pybind11_arg_code(function_signature: FunctionSignature) -> List[str]:
     """
     Parameter names are only added, if they are available. Since the function we are exporting could be just a
     declaration containing only types, they are not necessarily available.
+
+    Functions with output parameters always get names, because the outputs are passed as keyword arguments. A single
+    output parameter is called `out`.
     """
+    out_indices = [
+        i
+        for i, p in enumerate(function_signature.parameters)
+        if is_out_parameter(p[0])
+    ]
+    if out_indices:
+        names = get_parameter_names(function_signature)
+        if len(out_indices) == 1:
+            names[out_indices[0]] = "out"
+        return [
+            f'pybind11::arg("{names[i]}") = pybind11::none()'
+            if i in out_indices
+            else f'pybind11::arg("{names[i]}")'
+            for i in get_python_parameter_order(function_signature)
+        ]
+
     parameter_names = []
     if all([p[1] is not None for p in function_signature.parameters]):
         parameter_names = [
@@ -276,6 +483,35 @@ def get_pybind11_arg_code(function_signature: FunctionSignature) -> List[str]:
     return parameter_names
 
 
+def get_returned_results_code(
+    call: str, return_type: str, out_ndarrays: List[str]
+) -> List[str]:
+    """Statements calling the exported function, and returning its result along with the `out_ndarrays`, as a tuple
+       if there is more than one of them.
+    """
+    if return_type == "void":
+        statements = [f"{call};"]
+        results = []
+    elif is_ndarray_return(return_type):
+        statements = [f"auto result = bbmp::toNdarray({call});"]
+        results = ["std::move(result)"]
+    else:
+        statements = [f"auto result = {call};"]
+        results = ["std::move(result)"]
+    results += out_ndarrays
+
+    if not results:
+        statements.append("return pybind11::none();")
+    elif len(results) == 1 and (out_ndarrays or is_ndarray_return(return_type)):
+        statements.append(f"return std::move({results[0]});")
+    elif len(results) == 1:
+        statements.append(f"return pybind11::cast({results[0]});")
+    else:
+        statements.append(f"return pybind11::make_tuple({', '.join(results)});")
+
+    return statements
+
+
 TYPE_PARAMETER_REGEX = re.compile(r"<([a-zA-Z0-9\s\-\_]+)>")
 
 
@@ -286,39 +522,55 @@ def create_wrapper_function_code(
        to `bbmp::OwnedChannelData`, which erase the underlying type. Thus, the exported function need not depend
        on `numpy.h`.
 
+       `bbmp::OutChannelData` parameters are taken as `pybind11::object`. If they are None, an ndarray with the shape
+       of the first `bbmp::OwnedChannelData` parameter is allocated. The wrapper returns these ndarrays after the
+       result of the function.
+
+       Returned `std::vector`s of arithmetic types and `bbmp::OwnedChannelData<T>` values are moved into ndarrays.
+
+       `bbmp::Span<T>` and `std::string_view` parameters are taken as `pybind11::buffer` and `pybind11::object`, and
+       refer to the buffer of the argument through a `bbmp::BufferView`, which holds it until the wrapper returns.
+
+       `bbmp::BlockFunction<T>` parameters are taken as `pybind11::object`, and call the Python callable once per
+       block with an ndarray viewing the block.
+
+       Functions annotated with `EXPORT_TO_PYTHON_CONVERTING` take their `bbmp::OwnedChannelData<T>` parameters as
+       `pybind11::array` through a `bbmp::ConvertedNdarray<T>`, which converts arguments of other dtypes or layouts
+       into a scratch buffer. The values of non-const parameters are copied back into the argument after the call.
+
        Returns a tuple(name_of_wrapper_function, definition_of_wrapper_function).
     """
-    if not any(
+    if not is_ndarray_return(function_signature.return_type) and not any(
         [
             "bbmp::OwnedChannelData" in param[0]
+            or is_out_parameter(param[0])
+            or is_view_parameter(param[0])
+            or BLOCK_FUNCTION_TYPE in param[0]
             for param in function_signature.parameters
         ]
     ):
         return None
 
-    wrapper_parameters = []
-    arg_counter = 0
-    for param in function_signature.parameters:
-        if "bbmp::OwnedChannelData" in param[0]:
-            type_specialization = TYPE_PARAMETER_REGEX.search(param[0]).groups()[0]
-            param_type = f"pybind11::array_t<{type_specialization}, 0>"
-            param_name = param[1] if len(param) > 1 else f"arg{arg_counter}"
-            arg_counter += 1
-            wrapper_parameters.append((param_type, param_name))
-        else:
-            wrapper_parameters.append(param)
-    array_checks = [
-        f"assert_c_contiguous({pname});"
-        for ptype, pname in wrapper_parameters
-        if "array_t" in ptype
-    ]
+    parameter_names = get_parameter_names(function_signature)
+    first_array = next(
+        (
+            name
+            for (ptype, _), name in zip(function_signature.parameters, parameter_names)
+            if "bbmp::OwnedChannelData" in ptype
+        ),
+        None,
+    )
 
-    wrapper_body = []
+    wrapper_parameters = []
+    array_checks = []
+    out_preparations = []
     variable_wrappers = []
     forwarded_parameters = []
+    out_ndarrays = []
+    copy_backs = []
 
-    for (_, param_name), (original_type, _) in zip(
-        wrapper_parameters, function_signature.parameters
+    for param_name, (original_type, _) in zip(
+        parameter_names, function_signature.parameters
     ):
         is_lvalue_ref = (
             "&" in original_type
@@ -333,13 +585,64 @@ def create_wrapper_function_code(
         is_rvalue_ref = "&&" in original_type and not "const" in original_type
         is_const_rvalue_ref = "&&" in original_type and not "const" in original_type
 
-        if "bbmp::OwnedChannelData" in original_type:
+        if "bbmp::OwnedChannelData" in original_type and function_signature.convert_dtypes:
+            type_specialization = TYPE_PARAMETER_REGEX.search(original_type).groups()[0].strip()
+            copy_back = "false" if "const" in original_type else "true"
+            wrapper_parameters.append(("pybind11::array", param_name))
+            variable_wrappers += [
+                f'bbmp::ConvertedNdarray<{type_specialization}> {param_name}_converted(std::move({param_name}), "{function_signature.get_fully_qualified_name()}", "{param_name}", {copy_back});',
+                f"auto {param_name}_wrapper = {param_name}_converted.channelData();",
+            ]
+            if copy_back == "true":
+                copy_backs.append(f"{param_name}_converted.copyBack();")
+            forwarded_name = f"{param_name}_wrapper"
+        elif "bbmp::OwnedChannelData" in original_type:
             type_specialization = TYPE_PARAMETER_REGEX.search(original_type).groups()[0]
+            wrapper_parameters.append(
+                (f"pybind11::array_t<{type_specialization}, 0>", param_name)
+            )
+            array_checks.append(f"assert_c_contiguous({param_name});")
             variable_wrappers.append(
                 f"auto {param_name}_wrapper = bbmp::createOwnedChannelData(std::move({param_name}));"
             )
             forwarded_name = f"{param_name}_wrapper"
+        elif is_out_parameter(original_type):
+            type_specialization = TYPE_PARAMETER_REGEX.search(original_type).groups()[0]
+            wrapper_parameters.append(("pybind11::object", param_name))
+            like = f"&{first_array}" if first_array is not None else "nullptr"
+            out_preparations.append(
+                f"auto {param_name}_ndarray = bbmp::prepareOutNdarray<{type_specialization}>({param_name}, {like});"
+            )
+            variable_wrappers.append(
+                f"auto {param_name}_wrapper = bbmp::createOwnedChannelData(NumpyNdarray<{type_specialization}>({param_name}_ndarray));"
+            )
+            out_ndarrays.append(f"{param_name}_ndarray")
+            forwarded_name = f"{param_name}_wrapper"
+        elif SPAN_TYPE in original_type:
+            element_type = TYPE_PARAMETER_REGEX.search(original_type).groups()[0].strip()
+            writable = "true" if not element_type.startswith("const ") else "false"
+            wrapper_parameters.append(("pybind11::buffer", param_name))
+            variable_wrappers += [
+                f"bbmp::BufferView {param_name}_view({param_name}, {writable});",
+                f'auto {param_name}_span = {param_name}_view.span<{element_type}>("{param_name}");',
+            ]
+            forwarded_name = f"{param_name}_span"
+        elif STRING_VIEW_TYPE in original_type:
+            wrapper_parameters.append(("pybind11::object", param_name))
+            variable_wrappers += [
+                f"bbmp::BufferView {param_name}_view({param_name}, false, true);",
+                f"auto {param_name}_string_view = {param_name}_view.stringView();",
+            ]
+            forwarded_name = f"{param_name}_string_view"
+        elif BLOCK_FUNCTION_TYPE in original_type:
+            type_specialization = TYPE_PARAMETER_REGEX.search(original_type).groups()[0].strip()
+            wrapper_parameters.append(("pybind11::object", param_name))
+            variable_wrappers.append(
+                f"auto {param_name}_function = bbmp::createBlockFunction<{type_specialization}>(std::move({param_name}));"
+            )
+            forwarded_name = f"{param_name}_function"
         else:
+            wrapper_parameters.append((original_type, param_name))
             forwarded_name = f"{param_name}"
 
         # Only a non-const lvalue reference can't bind to an rvalue.
@@ -348,8 +651,32 @@ def create_wrapper_function_code(
         else:
             forwarded_parameters.append(f"std::move({forwarded_name})")
 
-    wrapper_body += variable_wrappers
-    wrapper_body += forwarded_parameters
+    wrapper_parameters = [
+        wrapper_parameters[i] for i in get_python_parameter_order(function_signature)
+    ]
+
+    call = f"{function_signature.get_fully_qualified_name()}({', '.join(forwarded_parameters)})"
+    if out_ndarrays or is_ndarray_return(function_signature.return_type):
+        return_type = "pybind11::object"
+        forwarding_call = get_returned_results_code(
+            call, function_signature.return_type, out_ndarrays
+        )
+    elif copy_backs:
+        return_type = function_signature.return_type
+        forwarding_call = (
+            [f"{call};"]
+            if return_type == "void"
+            else [f"decltype(auto) result = {call};", "return result;"]
+        )
+    else:
+        return_type = function_signature.return_type
+        forwarding_call = [f"return {call};"]
+
+    # Converted values are copied back after the call, before returning
+    if forwarding_call[-1].startswith("return "):
+        forwarding_call = forwarding_call[:-1] + copy_backs + forwarding_call[-1:]
+    else:
+        forwarding_call += copy_backs
 
     wrapper_name = (
         f"{function_signature.get_fully_qualified_name().replace('::', '__')}_wrapper"
@@ -362,24 +689,339 @@ $variable_wrappers
 $forwarding_call
 }"""
     ).substitute(
-        descriptor_return_type=function_signature.return_type,
+        descriptor_return_type=return_type,
         wrapper_name=wrapper_name,
         parameters=", ".join(
             [f"{ptype} {pname}" for ptype, pname in wrapper_parameters]
         ),
-        array_checks=os.linesep.join(array_checks),
+        array_checks=os.linesep.join(array_checks + out_preparations),
         variable_wrappers=os.linesep.join(variable_wrappers),
-        forwarding_call=f"return {function_signature.get_fully_qualified_name()}({', '.join(forwarded_parameters)});",
+        forwarding_call=os.linesep.join(forwarding_call),
     )
     return wrapper_name, wrapper_body
 
 
+def get_cast_target_type(parameter_type: str):
+    return re.sub(r"\bconst\b", "", parameter_type).replace("&", "").strip()
+
+
+def create_dtype_dispatch_code(
+    function_signature: FunctionSignature,
+) -> Tuple[str, List[str]]:
+    """Function templates exported with `EXPORT_TO_PYTHON_TYPES(...)` get one wrapper per type, and a single entry
+       point, that selects the wrapper based on the dtype of the first `bbmp::OwnedChannelData<T>` parameter using
+       a `bbmp::DtypeDispatchTable`. Parameters depending on the template parameter are taken as `pybind11::object`
+       and cast to the selected type. `bbmp::OutChannelData<T>` and `bbmp::BlockFunction<T>` parameters are handled
+       as in `create_wrapper_function_code`.
+
+       Returns a tuple(name_of_entry_point, definitions_of_wrappers_and_entry_point).
+    """
+    template_parameter_regex = re.compile(
+        rf"\b{function_signature.template_parameter}\b"
+    )
+    is_dispatched_array = (
+        lambda param_type: "bbmp::OwnedChannelData" in param_type
+        and template_parameter_regex.search(param_type) is not None
+    )
+
+    parameters = []
+    for param_name, (param_type, _) in zip(
+        get_parameter_names(function_signature), function_signature.parameters
+    ):
+        if is_dispatched_array(param_type):
+            parameters.append(("pybind11::array", param_name, param_type))
+        elif (
+            is_out_parameter(param_type)
+            or BLOCK_FUNCTION_TYPE in param_type
+            or template_parameter_regex.search(param_type) is not None
+        ):
+            parameters.append(("pybind11::object", param_name, param_type))
+        else:
+            parameters.append((param_type, param_name, param_type))
+
+    dispatched_parameters = [
+        pname for ptype, pname, _ in parameters if ptype == "pybind11::array"
+    ]
+    assert dispatched_parameters, (
+        f"{function_signature.name}: {TYPED_EXPORT_ANNOTATION} requires a "
+        f"bbmp::OwnedChannelData<{function_signature.template_parameter}> parameter"
+    )
+
+    # The wrappers take the parameters in the order of the Python function
+    python_parameters = [
+        parameters[i] for i in get_python_parameter_order(function_signature)
+    ]
+
+    base_name = function_signature.get_fully_qualified_name().replace("::", "__")
+    wrapper_parameters = ", ".join(
+        [
+            f"{ptype}& {pname}" if ptype.startswith("pybind11::") else f"{ptype} {pname}"
+            for ptype, pname, _ in python_parameters
+        ]
+    )
+    function_pointer_type = (
+        f"pybind11::object (*)({', '.join([ptype + '&' if ptype.startswith('pybind11::') else ptype for ptype, _, _ in python_parameters])})"
+    )
+
+    definitions = []
+    type_wrapper_names = []
+    for template_type in function_signature.template_types:
+        substitute = lambda s: template_parameter_regex.sub(template_type, s)
+        out_preparations = []
+        variable_wrappers = []
+        forwarded_parameters = []
+        out_ndarrays = []
+        for ptype, pname, original_type in parameters:
+            is_lvalue_ref = (
+                "&" in original_type
+                and not "&&" in original_type
+                and not "const" in original_type
+            )
+            if ptype == "pybind11::array":
+                type_specialization = TYPE_PARAMETER_REGEX.search(
+                    substitute(original_type)
+                ).groups()[0]
+                variable_wrappers.append(
+                    f"auto {pname}_wrapper = bbmp::createOwnedChannelData(bbmp::castNdarray<{type_specialization}>({pname}));"
+                )
+                forwarded_parameters.append(
+                    f"{pname}_wrapper" if is_lvalue_ref else f"std::move({pname}_wrapper)"
+                )
+            elif is_out_parameter(original_type):
+                type_specialization = TYPE_PARAMETER_REGEX.search(
+                    substitute(original_type)
+                ).groups()[0]
+                out_preparations.append(
+                    f"auto {pname}_ndarray = bbmp::prepareOutNdarray<{type_specialization}>({pname}, &{dispatched_parameters[0]});"
+                )
+                variable_wrappers.append(
+                    f"auto {pname}_wrapper = bbmp::createOwnedChannelData(NumpyNdarray<{type_specialization}>({pname}_ndarray));"
+                )
+                out_ndarrays.append(f"{pname}_ndarray")
+                forwarded_parameters.append(
+                    f"{pname}_wrapper" if is_lvalue_ref else f"std::move({pname}_wrapper)"
+                )
+            elif BLOCK_FUNCTION_TYPE in original_type:
+                type_specialization = TYPE_PARAMETER_REGEX.search(
+                    substitute(original_type)
+                ).groups()[0].strip()
+                forwarded_parameters.append(
+                    f"bbmp::createBlockFunction<{type_specialization}>(pybind11::object({pname}))"
+                )
+            elif ptype == "pybind11::object":
+                forwarded_parameters.append(
+                    f"{pname}.cast<{get_cast_target_type(substitute(original_type))}>()"
+                )
+            else:
+                forwarded_parameters.append(pname)
+
+        call = f"{function_signature.get_fully_qualified_name()}<{template_type}>({', '.join(forwarded_parameters)})"
+        forwarding_call = get_returned_results_code(
+            call, substitute(function_signature.return_type), out_ndarrays
+        )
+
+        type_wrapper_name = (
+            f"{base_name}_wrapper_{re.sub(r'[^a-zA-Z0-9_]', '_', template_type)}"
+        )
+        type_wrapper_names.append((template_type, type_wrapper_name))
+        definitions.append(
+            os.linesep.join(
+                [
+                    f"static pybind11::object {type_wrapper_name}({wrapper_parameters})",
+                    "{",
+                ]
+                + out_preparations
+                + variable_wrappers
+                + forwarding_call
+                + ["}"]
+            )
+        )
+
+    entry_point_name = f"{base_name}_wrapper"
+    forwarded_parameters = ", ".join([pname for _, pname, _ in python_parameters])
+    definitions.append(
+        os.linesep.join(
+            [
+                f"pybind11::object {entry_point_name}({', '.join([f'{ptype} {pname}' for ptype, pname, _ in python_parameters])})",
+                "{",
+                f"static const auto dispatch_table = [] {{",
+                f'bbmp::DtypeDispatchTable<{function_pointer_type}> table("{function_signature.name}");',
+            ]
+            + [f"table.add<{t}>(&{name});" for t, name in type_wrapper_names]
+            + [
+                "return table;",
+                "}();",
+                f"return dispatch_table.find({dispatched_parameters[0]})({forwarded_parameters});",
+                "}",
+            ]
+        )
+    )
+
+    return entry_point_name, definitions
+
+
+C_ABI_SCALAR_REGEX = re.compile(
+    r"^(?:(?:un)?signed\s+)?(?:bool|char|short|int|long|long\s+long|float|double|(?:std::)?size_t"
+    r"|(?:std::)?u?int(?:8|16|32|64)_t)$"
+)
+
+
+def get_c_abi_scalar_type(cpp_type: str) -> Optional[str]:
+    """The C type of an arithmetic parameter or return type, without qualifiers and references, or None if
+       `cpp_type` is not arithmetic.
+    """
+    base_type = " ".join(re.sub(r"\bconst\b", "", cpp_type).replace("&", "").split())
+    if C_ABI_SCALAR_REGEX.match(base_type) is None:
+        return None
+    return base_type.replace("std::", "")
+
+
+def create_c_abi_trampoline_code(
+    function_signature: FunctionSignature,
+) -> Optional[Tuple[str, str, str]]:
+    """An `extern "C"` entry point for JIT compiled callers, e.g. Numba or cffi, which takes the data of the
+       parameters as raw pointers, lengths and scalars.
+
+       `bbmp::OwnedChannelData<T>` and `bbmp::OutChannelData<T>` become `T* name, size_t name_num_channels,
+       size_t name_length` referring to consecutive channels, `bbmp::Span<T>` becomes `T* name, size_t name_size`,
+       `std::string_view` becomes `const char* name, size_t name_size`, and non-const references to arithmetic
+       types become pointers. Functions with other parameter or return types get no entry point.
+
+       Returns a tuple(name_of_trampoline, definition_of_trampoline, c_function_pointer_type).
+    """
+    if function_signature.template_parameter is not None:
+        return None
+
+    return_type = function_signature.return_type.strip()
+    if return_type != "void":
+        return_type = get_c_abi_scalar_type(return_type)
+        if return_type is None:
+            return None
+
+    c_parameters = []
+    variable_wrappers = []
+    forwarded_parameters = []
+    for param_name, (param_type, _) in zip(
+        get_parameter_names(function_signature), function_signature.parameters
+    ):
+        scalar_type = get_c_abi_scalar_type(param_type)
+        if "bbmp::OwnedChannelData" in param_type or is_out_parameter(param_type):
+            element_type = TYPE_PARAMETER_REGEX.search(param_type).groups()[0].strip()
+            c_parameters += [
+                (f"{element_type}*", param_name),
+                ("size_t", f"{param_name}_num_channels"),
+                ("size_t", f"{param_name}_length"),
+            ]
+            variable_wrappers.append(
+                f"auto {param_name}_wrapper = bbmp::createBorrowedOwnedChannelData<{element_type}>({param_name}, {param_name}_num_channels, {param_name}_length);"
+            )
+            # Only a non-const lvalue reference can't bind to an rvalue.
+            if "&" in param_type and not "&&" in param_type and not "const" in param_type:
+                forwarded_name = f"{param_name}_wrapper"
+            else:
+                forwarded_name = f"std::move({param_name}_wrapper)"
+        elif SPAN_TYPE in param_type:
+            element_type = TYPE_PARAMETER_REGEX.search(param_type).groups()[0].strip()
+            c_parameters += [(f"{element_type}*", param_name), ("size_t", f"{param_name}_size")]
+            forwarded_name = f"bbmp::Span<{element_type}>({param_name}, {param_name}_size)"
+        elif STRING_VIEW_TYPE in param_type:
+            c_parameters += [("const char*", param_name), ("size_t", f"{param_name}_size")]
+            forwarded_name = f"std::string_view({param_name}, {param_name}_size)"
+        elif scalar_type is not None and "&" in param_type and not "const" in param_type:
+            c_parameters.append((f"{scalar_type}*", param_name))
+            forwarded_name = f"*{param_name}"
+        elif scalar_type is not None:
+            c_parameters.append((scalar_type, param_name))
+            forwarded_name = param_name
+        else:
+            return None
+
+        forwarded_parameters.append(forwarded_name)
+
+    trampoline_name = (
+        f"bbmp_c_abi__{function_signature.get_fully_qualified_name().replace('::', '__')}"
+    )
+    call = f"{function_signature.get_fully_qualified_name()}({', '.join(forwarded_parameters)})"
+    statements = variable_wrappers + [
+        f"{call};" if return_type == "void" else f"return {call};"
+    ]
+    definition = Template(
+        """static $return_type $trampoline_name($parameters) noexcept
+{
+return bbmp::c_abi::call<$return_type>([&]() {
+$statements
+});
+}"""
+    ).substitute(
+        return_type=return_type,
+        trampoline_name=trampoline_name,
+        parameters=", ".join([f"{ptype} {pname}" for ptype, pname in c_parameters]),
+        statements=os.linesep.join(statements),
+    )
+    pointer_type = f"{return_type} (*)({', '.join([ptype for ptype, _ in c_parameters]) or 'void'})"
+
+    return trampoline_name, definition, pointer_type
+
+
+FASTCALL_STRING_RETURN_REGEX = re.compile(r"^(?:const\s+)?std::string$")
+
+
+def create_fastcall_code(function_signature: FunctionSignature) -> Optional[Tuple[str, str]]:
+    """Functions taking only arithmetic values by value or const reference, and returning void, an arithmetic value
+       or a `std::string` get a `METH_FASTCALL` function, which bypasses pybind11's generic dispatcher for
+       positional arguments of exact types. `bbmp::fastcall::install` replaces the pybind11 function with it, and
+       other calls are forwarded to the pybind11 function.
+
+       Returns a tuple(name_of_method_def, definitions_of_function_and_method_def).
+    """
+    if function_signature.template_parameter is not None:
+        return None
+
+    return_type = function_signature.return_type.strip()
+    if (
+        return_type != "void"
+        and FASTCALL_STRING_RETURN_REGEX.match(return_type) is None
+        and get_c_abi_scalar_type(return_type) in [None, "char"]
+    ):
+        return None
+
+    argument_types = []
+    for param_type, _ in function_signature.parameters:
+        scalar_type = get_c_abi_scalar_type(param_type)
+        # pybind11 converts `char` from a string
+        if scalar_type in [None, "char"] or (
+            "&" in param_type and not "const" in param_type
+        ):
+            return None
+        argument_types.append(scalar_type)
+
+    function_name = f"{function_signature.get_fully_qualified_name().replace('::', '__')}_fastcall"
+    parameter_names = [f"arg{i}" for i in range(len(argument_types))]
+    definitions = Template(
+        """static PyObject* $function_name(PyObject* self, PyObject* const* args, Py_ssize_t nargs, PyObject* kwnames)
+{
+return bbmp::fastcall::call<$argument_types>(self, args, nargs, kwnames, []($parameters) { return $call; });
+}
+static PyMethodDef ${function_name}_def = {nullptr, reinterpret_cast<PyCFunction>(reinterpret_cast<void (*)(void)>(&$function_name)), 0, nullptr};"""
+    ).substitute(
+        function_name=function_name,
+        argument_types=", ".join(argument_types),
+        parameters=", ".join(
+            [f"{t} {n}" for t, n in zip(argument_types, parameter_names)]
+        ),
+        call=f"{function_signature.get_fully_qualified_name()}({', '.join(parameter_names)})",
+    )
+
+    return f"{function_name}_def", definitions
+
+
 class CodeSections:
     def __init__(self):
         self.function_signatures = []
         self.function_declarations = []
         self.wrapper_definitions = []
         self.module_function_definitions = []
+        self.c_abi_definitions = []
 
     def append(self, code_sections):
         other_dict = {}
@@ -402,7 +1044,18 @@ class CodeSections:
 
 
 def generate_code_sections(function_signature: FunctionSignature):
-    function_declaration = f"extern {function_signature.get_signature()};"
+    if function_signature.template_parameter is None:
+        function_declaration = f"extern {function_signature.get_signature()};"
+    else:
+        # The library exporting the function template has to instantiate it
+        # explicitly for each of the exported types.
+        function_declaration = " ".join(
+            [f"{function_signature.get_signature()};"]
+            + [
+                f"extern template {function_signature.get_instantiation_signature(t)};"
+                for t in function_signature.template_types
+            ]
+        )
     if function_signature.namespace is not None:
         namespaces = function_signature.namespace.split("::")
         namespaces.reverse()
@@ -417,20 +1070,54 @@ def generate_code_sections(function_signature: FunctionSignature):
     wrapper_definitions = []
     module_function_definitions = []
 
-    add_quotes = lambda s: f'"{s}"'
+    if function_signature.template_parameter is not None:
+        entry_point_name, wrapper_definitions = create_dtype_dispatch_code(
+            function_signature
+        )
+        wrapper_defintion = (entry_point_name, None)
+    else:
+        wrapper_defintion = create_wrapper_function_code(function_signature)
+        wrapper_definitions = (
+            [wrapper_defintion[1]] if wrapper_defintion is not None else []
+        )
 
-    wrapper_defintion = create_wrapper_function_code(function_signature)
-    wrapper_definitions = (
-        [wrapper_defintion[1]] if wrapper_defintion is not None else []
+    fastcall_definition = (
+        create_fastcall_code(function_signature) if wrapper_defintion is None else None
     )
+    if fastcall_definition is not None:
+        wrapper_definitions.append(fastcall_definition[1])
 
+    # The Python name of the function depends on the module layout, which is
+    # only decided in `generate_cpp`, so we store the namespace and the
+    # unqualified name alongside the arguments of `m.def`, and the name of the
+    # `METH_FASTCALL` method def, if any.
     if wrapper_defintion is not None:
-        module_function_definitions.append(
-            f'm.def({", ".join([add_quotes(function_signature.get_fully_qualified_name().replace("::", "__")), f"&{wrapper_defintion[0]}"] + get_pybind11_arg_code(function_signature))});'
-        )
+        function_pointer = f"&{wrapper_defintion[0]}"
     else:
-        module_function_definitions.append(
-            f'm.def({", ".join([add_quotes(function_signature.get_fully_qualified_name().replace("::", "__")), f"&{function_signature.get_fully_qualified_name()}"] + get_pybind11_arg_code(function_signature))});'
+        function_pointer = f"&{function_signature.get_fully_qualified_name()}"
+    module_function_definitions.append(
+        (
+            function_signature.namespace,
+            function_signature.name,
+            ", ".join(
+                [function_pointer] + get_pybind11_arg_code(function_signature)
+            ),
+            fastcall_definition[0] if fastcall_definition is not None else None,
+        )
+    )
+
+    # The entry points are always generated, but only written to modules
+    # created with the C_ABI option.
+    c_abi_definitions = []
+    c_abi_trampoline = create_c_abi_trampoline_code(function_signature)
+    if c_abi_trampoline is not None:
+        c_abi_definitions.append(
+            (
+                get_python_function_name(
+                    function_signature.namespace, function_signature.name
+                ),
+            )
+            + c_abi_trampoline
         )
 
     code_sections = CodeSections()
@@ -440,120 +1127,842 @@ def generate_code_sections(function_signature: FunctionSignature):
     code_sections.function_declarations = function_declarations
     code_sections.module_function_definitions = module_function_definitions
     code_sections.wrapper_definitions = wrapper_definitions
+    code_sections.c_abi_definitions = c_abi_definitions
 
     return code_sections
 
 
-def generate_cpp(code_sections: CodeSections, module_name: str):
-    includes = ['#include "pybind11/pybind11.h"']
+LAZY_SUBMODULE_HELPER = """// Defers the registration of a submodule's functions until the first attribute
+// lookup that fails on the submodule (PEP 562), so importing the extension
+// module doesn't pay for namespaces that are never used.
+static void bbmp_register_on_first_access(pybind11::module submodule, void (*register_functions)(pybind11::module&)) {
+// Capturing the submodule by handle, so that its `__getattr__` doesn't keep it alive
+const pybind11::handle submodule_handle = submodule;
+auto registered = std::make_shared<bool>(false);
+auto ensure_registered = [submodule_handle, register_functions, registered]() {
+if (!*registered) {
+*registered = true;
+auto m = pybind11::reinterpret_borrow<pybind11::module>(submodule_handle);
+register_functions(m);
+}
+};
+submodule.attr("__getattr__") = pybind11::cpp_function([submodule_handle, ensure_registered](const std::string& name) -> pybind11::object {
+ensure_registered();
+pybind11::dict attributes = submodule_handle.attr("__dict__");
+if (attributes.contains(name)) {
+return attributes[name.c_str()];
+}
+PyErr_Format(PyExc_AttributeError, "module '%s' has no attribute '%s'", PyModule_GetName(submodule_handle.ptr()), name.c_str());
+throw pybind11::error_already_set();
+});
+submodule.attr("__dir__") = pybind11::cpp_function([submodule_handle, ensure_registered]() {
+ensure_registered();
+return pybind11::list(submodule_handle.attr("__dict__"));
+});
+}"""
+
+
+def get_python_function_name(namespace: Optional[str], name: str):
+    """Name of a function in the flat module layout, where every export lives
+       in the top-level module.
+    """
+    if namespace is None:
+        return name
+    return f"{namespace.replace('::', '__')}__{name}"
+
+
+def get_submodule_variable_name(namespace: str):
+    return f"submodule__{namespace.replace('::', '__')}"
+
+
+def get_register_function_name(namespace: str):
+    return f"register__{namespace.replace('::', '__')}"
+
+
+ModuleFunctionDefinition = Tuple[Optional[str], str, str, Optional[str]]
+
+
+def get_fastcall_install_statements(
+    module_function_definitions: List[ModuleFunctionDefinition], namespace_submodules: bool
+) -> List[str]:
+    """The `METH_FASTCALL` functions replace the pybind11 functions after all functions of the scope are defined,
+       since pybind11 looks up existing functions of the same name for chaining overloads.
+    """
+    return [
+        f'bbmp::fastcall::install(m, "{name if namespace_submodules else get_python_function_name(namespace, name)}", &{fastcall});'
+        for namespace, name, _, fastcall in module_function_definitions
+        if fastcall is not None
+    ]
 
-    # Wrappers are created for `bbmp::OwnedChannelData` parameters.
-    # Thus, if we have wrappers, we need to include `types.hpp` and
-    # `conversions.hpp`
-    if code_sections.wrapper_definitions:
-        includes = ['#include "bbmp_interop/types.hpp"', '#include "bbmp_interop/conversions.hpp"', ""] + includes
 
-    code: str = Template(
-        """/* THIS FILE IS AUTO GENERATED BY BBMP_INTEROP */
+def generate_module_body(
+    module_function_definitions: List[ModuleFunctionDefinition],
+    namespace_submodules: bool,
+) -> Tuple[List[str], List[str]]:
+    """Returns a tuple(definitions_outside_the_module_function, statements_inside_the_module_function).
 
-$includes
+       In the flat layout every function is registered in the top-level module as `namespace__name`. With
+       `namespace_submodules` each C++ namespace becomes a Python submodule, whose functions are only registered
+       on first access.
+    """
+    if not namespace_submodules:
+        return (
+            [],
+            [
+                f'm.def("{get_python_function_name(namespace, name)}", {arguments});'
+                for namespace, name, arguments, _ in module_function_definitions
+            ]
+            + get_fastcall_install_statements(module_function_definitions, False),
+        )
 
-$function_declarations
+    definitions_by_namespace: Dict[Optional[str], List[ModuleFunctionDefinition]] = {}
+    for definition in module_function_definitions:
+        definitions_by_namespace.setdefault(definition[0], []).append(definition)
+    statements_by_namespace = {
+        namespace: [f'm.def("{name}", {arguments});' for _, name, arguments, _ in definitions]
+        + get_fastcall_install_statements(definitions, True)
+        for namespace, definitions in definitions_by_namespace.items()
+    }
+
+    # Parent namespaces need a submodule even if they export nothing themselves
+    namespaces = set()
+    for namespace in definitions_by_namespace.keys():
+        if namespace is None:
+            continue
+        components = namespace.split("::")
+        for i in range(1, len(components) + 1):
+            namespaces.add("::".join(components[:i]))
+
+    register_functions = []
+    module_statements = statements_by_namespace.get(None, [])
+    for namespace in sorted(namespaces):
+        parent, _, name = namespace.rpartition("::")
+        parent_variable = get_submodule_variable_name(parent) if parent else "m"
+        module_statements.append(
+            f'auto {get_submodule_variable_name(namespace)} = {parent_variable}.def_submodule("{name}");'
+        )
+
+        if namespace in definitions_by_namespace:
+            register_functions.append(
+                "\n".join(
+                    [f"static void {get_register_function_name(namespace)}(pybind11::module& m)", "{"]
+                    + statements_by_namespace[namespace]
+                    + ["}"]
+                )
+            )
+            module_statements.append(
+                f"bbmp_register_on_first_access({get_submodule_variable_name(namespace)}, &{get_register_function_name(namespace)});"
+            )
 
-$wrapper_definitions
+    if register_functions:
+        register_functions = [LAZY_SUBMODULE_HELPER] + register_functions
 
-PYBIND11_MODULE($module_name, m) {
-$module_function_definitions
+    return register_functions, module_statements
+
+
+C_ABI_LAST_ERROR_FUNCTION = """// Returns the message of the exception thrown by the last entry point called on
+// this thread, or NULL if it returned normally.
+static const char* bbmp_c_abi_last_error() noexcept {
+return bbmp::c_abi::lastError().empty() ? nullptr : bbmp::c_abi::lastError().c_str();
 }"""
-    ).substitute(
-        includes=os.linesep.join(includes),
-        module_name=module_name,
-        function_declarations=os.linesep.join(code_sections.function_declarations),
-        wrapper_definitions=os.linesep.join(code_sections.wrapper_definitions),
-        module_function_definitions=os.linesep.join(
-            code_sections.module_function_definitions
+
+
+MULTI_PHASE_INIT_TEMPLATE = Template("""
+// PEP 489 multi-phase initialization, which creates a separate module object
+// in each interpreter importing the module
+static int bbmp_module_exec(PyObject* module) {
+  try {
+    pybind11::detail::get_internals();
+    auto m = pybind11::reinterpret_borrow<pybind11::module>(module);
+    bbmp_module_body(m);
+    return 0;
+  } catch (pybind11::error_already_set& e) {
+    e.restore();
+  } catch (const std::exception& e) {
+    PyErr_SetString(PyExc_ImportError, e.what());
+  }
+  return -1;
+}
+
+// Releases the ndarrays, that were destroyed without holding the GIL of this
+// interpreter
+static void bbmp_module_free(void*) {
+  bbmp::DeferredReleaseQueue::instance().drain();
+}
+
+static PyModuleDef_Slot bbmp_module_slots[] = {
+  {Py_mod_exec, reinterpret_cast<void*>(&bbmp_module_exec)},
+#ifdef Py_mod_multiple_interpreters
+  // pybind11's internals are shared by all interpreters of the process, so
+  // they must also share the GIL
+  {Py_mod_multiple_interpreters, Py_MOD_MULTIPLE_INTERPRETERS_SUPPORTED},
+#endif
+  {0, nullptr}
+};
+
+static PyModuleDef bbmp_module_def = {
+  PyModuleDef_HEAD_INIT, "$module_name", nullptr, 0, nullptr,
+  bbmp_module_slots, nullptr, nullptr, &bbmp_module_free
+};
+
+extern "C" PYBIND11_EXPORT PyObject* PyInit_$module_name() {
+  PYBIND11_CHECK_PYTHON_VERSION
+  return PyModuleDef_Init(&bbmp_module_def);
+}
+""")
+
+
+def render_fragments(code_sections: CodeSections) -> Dict[str, str]:
+    """Renders the indented code of a single source, which `write_cpp` concatenates with the fragments of the other
+       sources of the module. The fragments are cached, so they are only rendered again when the exported function
+       signatures of the source change.
+    """
+    _, flat_module_statements = generate_module_body(
+        code_sections.module_function_definitions, False
+    )
+    fastcall_install_statements = get_fastcall_install_statements(
+        code_sections.module_function_definitions, False
+    )
+    flat_module_statements = flat_module_statements[
+        : len(flat_module_statements) - len(fastcall_install_statements)
+    ]
+
+    return {
+        "function_declarations": "".join(
+            f"{d}\n" for d in code_sections.function_declarations
         ),
+        "wrapper_definitions": cpp_indent(
+            "\n".join(code_sections.wrapper_definitions), 2
+        ),
+        "module_function_definitions": "".join(
+            f"  {s}\n" for s in flat_module_statements
+        ),
+        "fastcall_installs": "".join(
+            f"  {s}\n" for s in fastcall_install_statements
+        ),
+        "c_abi_trampolines": cpp_indent(
+            "\n".join(d[2] for d in code_sections.c_abi_definitions), 2
+        ),
+        "c_abi_table_entries": "".join(
+            f'  c_abi_table["{python_name}"] = pybind11::make_tuple(reinterpret_cast<std::uintptr_t>(&{trampoline_name}), "{pointer_type}");\n'
+            for python_name, trampoline_name, _, pointer_type in code_sections.c_abi_definitions
+        ),
+    }
+
+
+def write_cpp(
+    output_file: TextIO,
+    module_name: str,
+    fragments: List[Dict[str, str]],
+    module_function_definitions: List[ModuleFunctionDefinition],
+    namespace_submodules: bool = False,
+    c_abi: bool = False,
+    memory_accounting: bool = False,
+    multi_phase_init: bool = False,
+):
+    """Streams the code of the module into `output_file`, one source fragment at a time.
+
+       Only the namespace submodules layout needs `module_function_definitions`, because it groups the functions
+       of all sources by namespace.
+
+       With `c_abi` the `extern "C"` entry points are added, and the module gets a `__bbmp_c_abi__` dict mapping the
+       names of the Python functions to tuple(address, c_function_pointer_type).
+
+       With `memory_accounting` the module enables the accounting of `bbmp::OwnedChannelData` buffers, and gets the
+       `_bbmp_memory_stats()` and `_bbmp_configure_memory_accounting()` functions.
+
+       With `multi_phase_init` the module is initialized by the exec slot of a PEP 489 module definition instead of
+       `PYBIND11_MODULE`, so each (sub-)interpreter gets its own module object.
+    """
+    output_file.write("/* THIS FILE IS AUTO GENERATED BY BBMP_INTEROP */\n\n")
+
+    # Wrappers are created for `bbmp::OwnedChannelData` parameters.
+    # Thus, if we have wrappers, we need to include `types.hpp` and
+    # `conversions.hpp`
+    if memory_accounting or multi_phase_init or any(
+        f["wrapper_definitions"] or (c_abi and f["c_abi_trampolines"])
+        for f in fragments
+    ):
+        output_file.write(
+            '#include "bbmp_interop/types.hpp"\n#include "bbmp_interop/conversions.hpp"\n\n'
+        )
+    output_file.write('#include "pybind11/pybind11.h"\n\n')
+
+    output_file.writelines(f["function_declarations"] for f in fragments)
+    output_file.write("\n")
+    output_file.writelines(f["wrapper_definitions"] for f in fragments)
+    output_file.write("\n")
+
+    if c_abi:
+        output_file.write('extern "C" {\n')
+        output_file.writelines(f["c_abi_trampolines"] for f in fragments)
+        output_file.write(cpp_indent(C_ABI_LAST_ERROR_FUNCTION, 2))
+        output_file.write("}\n\n")
+
+    module_function_header = (
+        "static void bbmp_module_body(pybind11::module& m) {\n"
+        if multi_phase_init
+        else f"PYBIND11_MODULE({module_name}, m) {{\n"
+    )
+    if namespace_submodules:
+        register_functions, module_statements = generate_module_body(
+            module_function_definitions, True
+        )
+        output_file.write(cpp_indent("\n\n".join(register_functions), 2))
+        output_file.write("\n" + module_function_header)
+        output_file.writelines(f"  {s}\n" for s in module_statements)
+    else:
+        output_file.write(module_function_header)
+        output_file.writelines(f["module_function_definitions"] for f in fragments)
+        output_file.writelines(f["fastcall_installs"] for f in fragments)
+
+    if memory_accounting:
+        output_file.write("  bbmp::defineMemoryAccountingFunctions(m);\n")
+
+    if any("bbmp::ConvertedNdarray<" in f["wrapper_definitions"] for f in fragments):
+        output_file.write("  bbmp::defineDtypeConversionFunctions(m);\n")
+
+    if c_abi:
+        output_file.write("  pybind11::dict c_abi_table;\n")
+        output_file.writelines(f["c_abi_table_entries"] for f in fragments)
+        output_file.write('  m.attr("__bbmp_c_abi__") = c_abi_table;\n')
+        output_file.write(
+            '  m.attr("__bbmp_c_abi_last_error__") = pybind11::make_tuple(reinterpret_cast<std::uintptr_t>(&bbmp_c_abi_last_error), "const char* (*)(void)");\n'
+        )
+
+    output_file.write("}\n")
+
+    if multi_phase_init:
+        output_file.write(
+            cpp_indent(MULTI_PHASE_INIT_TEMPLATE.substitute(module_name=module_name), 2)
+        )
+
+
+def generate_cpp(
+    code_sections: CodeSections,
+    module_name: str,
+    namespace_submodules: bool = False,
+    c_abi: bool = False,
+    memory_accounting: bool = False,
+    multi_phase_init: bool = False,
+):
+    """Returns the code of the module as a string. `generate` streams the cached fragments into the output file
+       instead.
+    """
+    code = io.StringIO()
+    write_cpp(
+        code,
+        module_name,
+        [render_fragments(code_sections)],
+        code_sections.module_function_definitions,
+        namespace_submodules,
+        c_abi,
+        memory_accounting,
+        multi_phase_init,
     )
 
-    return code
+    return code.getvalue()
+
 
+class GenerationReport:
+    """Timings and cache statistics of one invocation of the generator, written as JSON with `--report`.
+
+       Sources are cache hits if their modification time is unchanged, otherwise they are parsed again. The reason
+       of a miss is one of
+         - "new": the source wasn't in the cache,
+         - "generator_changed": the cache was erased, because this script changed,
+         - "mtime": the source was modified, but its exported function signatures are unchanged, so the cached
+           fragments were reused,
+         - "content": the exported function signatures changed, and the fragments were rendered again.
+    """
 
-def main():
+    MISS_REASONS = ["new", "generator_changed", "mtime", "content"]
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.sources: Dict[str, Dict[str, Any]] = {}
+        self.modules: List[Dict[str, Any]] = []
+        self.generator_changed = False
+        self.evicted_cache_entries = 0
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def add_source(
+        self,
+        path: str,
+        reason: Optional[str] = None,
+        parse_seconds: Optional[float] = None,
+        num_functions: Optional[int] = None,
+    ):
+        """A `reason` of None is a cache hit."""
+        if reason == "new" and self.generator_changed:
+            reason = "generator_changed"
+        self.sources[path] = {
+            "cache": "hit" if reason is None else "miss",
+            "reason": reason,
+            "parse_seconds": parse_seconds,
+            "functions": num_functions,
+        }
+
+    def add_module(
+        self,
+        module_name: str,
+        output: str,
+        generated: bool,
+        num_functions: int = 0,
+        emit_seconds: float = 0.0,
+        write_seconds: float = 0.0,
+    ):
+        self.modules.append(
+            {
+                "module_name": module_name,
+                "output": output,
+                "generated": generated,
+                "functions": num_functions,
+                "emit_seconds": emit_seconds,
+                "write_seconds": write_seconds,
+            }
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        reasons = [s["reason"] for s in self.sources.values()]
+        phases = dict(
+            self.phases,
+            emit=sum(m["emit_seconds"] for m in self.modules),
+            write=sum(m["write_seconds"] for m in self.modules),
+        )
+        return {
+            "total_seconds": time.perf_counter() - self.start + phases.get("cache_load", 0.0),
+            "phases": phases,
+            "cache": {
+                "hits": reasons.count(None),
+                "misses": len(reasons) - reasons.count(None),
+                "miss_reasons": {r: reasons.count(r) for r in self.MISS_REASONS},
+                "evicted_entries": self.evicted_cache_entries,
+            },
+            "sources": self.sources,
+            "modules": self.modules,
+            "functions_emitted": sum(m["functions"] for m in self.modules if m["generated"]),
+        }
+
+    def save(self, path: str):
+        import json
+
+        with open(path, "w") as report_file:
+            json.dump(self.to_dict(), report_file, indent=2)
+
+
+class ModuleDescription:
+    def __init__(
+        self,
+        module_name: str,
+        output: str,
+        sources: List[str],
+        namespace_submodules: bool = False,
+        c_abi: bool = False,
+        memory_accounting: bool = False,
+        multi_phase_init: bool = False,
+    ):
+        self.module_name = module_name
+        self.output = output
+        self.sources = sources
+        self.namespace_submodules = namespace_submodules
+        self.c_abi = c_abi
+        self.memory_accounting = memory_accounting
+        self.multi_phase_init = multi_phase_init
+
+    def get_output_options(self):
+        """Options that change the generated code without changing the cached code sections of the sources."""
+        return {
+            "namespace_submodules": self.namespace_submodules,
+            "c_abi": self.c_abi,
+            "memory_accounting": self.memory_accounting,
+            "multi_phase_init": self.multi_phase_init,
+        }
+
+
+def parse_arguments(argv: Optional[List[str]] = None):
     import argparse
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("--output", type=str, required=True)
-    parser.add_argument("--sources", type=str, required=True)
-    parser.add_argument("--module_name", type=str, required=True)
-    args = parser.parse_args()
+    parser.add_argument("--output", type=str)
+    parser.add_argument("--sources", type=str)
+    parser.add_argument("--module_name", type=str)
+    parser.add_argument(
+        "--namespace_submodules",
+        action="store_true",
+        help="Map C++ namespaces to Python submodules, whose functions are registered on first access",
+    )
+    parser.add_argument(
+        "--c_abi",
+        action="store_true",
+        help="Add extern \"C\" entry points taking raw pointers, and a __bbmp_c_abi__ table of their addresses",
+    )
+    parser.add_argument(
+        "--memory_accounting",
+        action="store_true",
+        help="Account the live OwnedChannelData buffers, and add the _bbmp_memory_stats function to the module",
+    )
+    parser.add_argument(
+        "--multi_phase_init",
+        action="store_true",
+        help="Initialize the module with PEP 489 multi-phase initialization, so that sub-interpreters can import it",
+    )
+    parser.add_argument(
+        "--report",
+        type=str,
+        help="Write the timings of the phases, the parse times of the sources and the cache statistics of this "
+        "invocation to this JSON file",
+    )
+    parser.add_argument(
+        "--export_manifest",
+        type=str,
+        help="Write the exported function signatures of --sources to this JSON file, instead of generating a module. "
+        f"Sources ending in {EXPORT_MANIFEST_SUFFIX} are read as such manifests",
+    )
+    parser.add_argument(
+        "--library_name",
+        type=str,
+        help="Name of the library recorded in the --export_manifest",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        help="JSON file describing multiple modules to generate in one invocation, instead of --output, --sources "
+        "and --module_name",
+    )
+    args = parser.parse_args(argv)
+
+    single_module_arguments = [args.output, args.sources, args.module_name]
+    if args.export_manifest is not None:
+        if args.sources is None:
+            parser.error("--export_manifest requires --sources")
+        if any(a is not None for a in [args.output, args.module_name, args.manifest]):
+            parser.error("--export_manifest can't be combined with --output, --module_name or --manifest")
+        return args
+    if args.manifest is None and None in single_module_arguments:
+        parser.error("either --manifest or --output, --sources and --module_name are required")
+    if args.manifest is not None and any(
+        a is not None for a in single_module_arguments
+    ):
+        parser.error("--manifest can't be combined with --output, --sources or --module_name")
+
+    return args
 
-    sources = args.sources.split(";")
-    changes_cache = ChangesCache(CHANGES_CACHE_PATH)
 
-    this_generator_script_path = pathlib.PurePath(os.path.realpath(__file__)).as_posix()
-    if not changes_cache.exists_unchanged(this_generator_script_path):
-        changes_cache.erase()
-        changes_cache.update_modification_time(this_generator_script_path)
-
-    # Erase cache contents about paths that are no longer part of the build.
-    # This means that if you build multiple targets in a single build
-    # directory, subsequent calls to the generator may erase each other's
-    # cached information. So I'm considering removing this.
-    old_paths = [
-        k
-        for k in list(changes_cache.cache.keys())
-        if k not in sources + [this_generator_script_path, args.output]
+def split_sources(sources: str) -> List[str]:
+    """Splits the `;` separated `--sources`. Modules linking only libraries without sources get an empty string."""
+    return [s for s in sources.split(";") if s]
+
+
+def get_module_descriptions(args) -> List[ModuleDescription]:
+    """The manifest has the format
+       {"modules": [{"module_name": str, "output": str, "sources": [str], "namespace_submodules": bool,
+                     "c_abi": bool, "memory_accounting": bool, "multi_phase_init": bool}, ...]}
+    """
+    if args.manifest is None:
+        return [
+            ModuleDescription(
+                args.module_name,
+                args.output,
+                split_sources(args.sources),
+                args.namespace_submodules,
+                args.c_abi,
+                args.memory_accounting,
+                args.multi_phase_init,
+            )
+        ]
+
+    import json
+
+    with open(args.manifest, "r") as manifest_file:
+        manifest = json.load(manifest_file)
+
+    return [
+        ModuleDescription(
+            m["module_name"],
+            m["output"],
+            m["sources"],
+            m.get("namespace_submodules", False),
+            m.get("c_abi", False),
+            m.get("memory_accounting", False),
+            m.get("multi_phase_init", False),
+        )
+        for m in manifest["modules"]
     ]
-    for path in old_paths:
-        print(f"deleting {path}")
-        del changes_cache.cache[path]
-
-    # This signals whether the output file has to be regenerated. It only
-    # needs to be regenerated if any of the function signatures in any of the
-    # source files changed.
-    inputs_changed = False
+
+
+EXPORT_MANIFEST_SUFFIX = ".bbmp_exports.json"
+EXPORT_MANIFEST_VERSION = 1
+
+
+def is_export_manifest(path: str) -> bool:
+    """Sources ending in `EXPORT_MANIFEST_SUFFIX` are export manifests written by `write_export_manifest`, which are
+       read instead of parsed.
+    """
+    return path.endswith(EXPORT_MANIFEST_SUFFIX)
+
+
+def get_wrapper_requirements(function_signature: FunctionSignature) -> List[str]:
+    """The features of the generated wrapper a function relies on. These are recorded in export manifests, so that a
+       generator older than the one writing the manifest can reject functions, which it would bind incorrectly.
+    """
+    parameter_types = [p[0] for p in function_signature.parameters]
+    requirements = {
+        "channel_data": any("bbmp::OwnedChannelData" in t for t in parameter_types),
+        "out_parameters": any(is_out_parameter(t) for t in parameter_types),
+        "views": any(is_view_parameter(t) for t in parameter_types),
+        "block_function": any(BLOCK_FUNCTION_TYPE in t for t in parameter_types),
+        "ndarray_return": is_ndarray_return(function_signature.return_type),
+        "dtype_dispatch": len(function_signature.template_types) > 0,
+        "dtype_conversion": function_signature.convert_dtypes,
+    }
+    return [name for name, required in requirements.items() if required]
+
+
+KNOWN_WRAPPER_REQUIREMENTS = {
+    "channel_data",
+    "out_parameters",
+    "views",
+    "block_function",
+    "ndarray_return",
+    "dtype_dispatch",
+    "dtype_conversion",
+}
+
+
+def write_export_manifest(
+    path: str, sources: List[str], library_name: Optional[str] = None
+) -> bool:
+    """Writes the exported function signatures of the sources of a library, so that the modules of projects linking
+       the installed library can be generated without its sources. The manifest has the format
+       {"version": int, "library": str, "functions": [{"signature": str, "namespace": str,
+                                                       "requirements": [str]}, ...]}
+
+       The file is left untouched if its contents wouldn't change, so that the modules using it aren't regenerated.
+       Returns whether the file was written.
+    """
+    import json
+
+    functions = []
+    for source in sources:
+        with open(source, "r") as file:
+            for signature, namespace in extract_function_signatures_from_cpp(file):
+                functions.append(
+                    {
+                        "signature": signature,
+                        "namespace": namespace,
+                        "requirements": get_wrapper_requirements(
+                            FunctionSignature(signature, namespace)
+                        ),
+                    }
+                )
+
+    contents = json.dumps(
+        {"version": EXPORT_MANIFEST_VERSION, "library": library_name, "functions": functions},
+        indent=2,
+    )
+    if os.path.exists(path):
+        with open(path, "r") as file:
+            if file.read() == contents:
+                return False
+
+    with open(path, "w") as file:
+        file.write(contents)
+    return True
+
+
+def read_export_manifest(path: str) -> List[Tuple[str, Optional[str]]]:
+    """Returns the (signature, namespace) tuples of an export manifest, like `extract_function_signatures_from_cpp`
+       does for a source.
+    """
+    import json
+
+    with open(path, "r") as file:
+        manifest = json.load(file)
+
+    if manifest.get("version", 0) > EXPORT_MANIFEST_VERSION:
+        raise ValueError(
+            f"{path} has export manifest version {manifest['version']}, but {NAME_OF_THIS_FILE} only reads up to "
+            f"version {EXPORT_MANIFEST_VERSION}. Update bbmp_interop."
+        )
+
+    fsigs = []
+    for function in manifest["functions"]:
+        unknown_requirements = set(function["requirements"]) - KNOWN_WRAPPER_REQUIREMENTS
+        if unknown_requirements:
+            raise ValueError(
+                f"{path}: {function['signature']} requires wrapper features unknown to {NAME_OF_THIS_FILE}: "
+                f"{', '.join(sorted(unknown_requirements))}. Update bbmp_interop."
+            )
+        fsigs.append((function["signature"], function["namespace"]))
+
+    return fsigs
+
+
+def update_code_sections(
+    changes_cache: ChangesCache,
+    sources: List[str],
+    report: Optional[GenerationReport] = None,
+) -> List[str]:
+    """Parses the sources modified since the last invocation, and stores their code sections and rendered fragments
+       in the cache. Export manifests among the sources are read instead of parsed.
+
+       Returns the sources, in which the exported function signatures changed.
+    """
+    report = GenerationReport() if report is None else report
+    changed_sources = []
     for path in sources:
-        if not changes_cache.exists_unchanged(path):
+        if changes_cache.exists_unchanged(path):
+            report.add_source(path)
+        else:
+            start = time.perf_counter()
             fsigs = []
-            with open(path, "r") as file:
-                fsigs = extract_function_signatures_from_cpp(file)
-            cached_code_sections = changes_cache.get_data(path)
-            if cached_code_sections is None or not set(
-                cached_code_sections["function_signatures"]
-            ) == set(fsigs):
+            if is_export_manifest(path):
+                fsigs = read_export_manifest(path)
+            else:
+                with open(path, "r") as file:
+                    fsigs = extract_function_signatures_from_cpp(file)
+            cached_signatures = changes_cache.get_data(path, "signatures")
+            if cached_signatures is None:
+                reason = "new"
+            elif changes_cache.get_data(path, "fragments") is None or set(
+                cached_signatures
+            ) != set(fsigs):
+                reason = "content"
+            else:
+                reason = "mtime"
+            if reason != "mtime":
                 source_code_sections = CodeSections()
                 for signature, namespace in fsigs:
                     source_code_sections.append(
                         generate_code_sections(FunctionSignature(signature, namespace))
                     )
-                changes_cache.update_modification_time(path)
                 changes_cache.store_data(path, source_code_sections.__dict__)
-                inputs_changed = True
+                changes_cache.store_data(
+                    path, render_fragments(source_code_sections), "fragments"
+                )
+                changes_cache.store_data(path, fsigs, "signatures")
+                changed_sources.append(path)
+            changes_cache.update_modification_time(path)
+            report.add_source(path, reason, time.perf_counter() - start, len(fsigs))
+
+    return changed_sources
+
 
-    output_changed = not changes_cache.exists_unchanged(args.output)
+def generate(args, changes_cache: ChangesCache):
+    """Generates the modules described by the parsed command line `args`, unless the cache shows that none of the
+       exported function signatures changed since the last invocation. Sources shared by multiple modules are only
+       parsed once.
 
-    if inputs_changed or output_changed:
-        code_sections = CodeSections()
-        for path in sources:
-            code_sections.append(changes_cache.get_data(path))
+       With `args.report` the `GenerationReport` of the invocation is written to that path. With
+       `args.export_manifest` only the export manifest of `args.sources` is written.
+    """
+    if args.export_manifest is not None:
+        write_export_manifest(args.export_manifest, split_sources(args.sources), args.library_name)
+        return
+
+    report = GenerationReport()
+    report.phases["cache_load"] = changes_cache.load_seconds
+    changes_cache.load_seconds = 0.0
+
+    modules = get_module_descriptions(args)
+    sources = list(dict.fromkeys([s for m in modules for s in m.sources]))
+
+    with report.phase("cache_validation"):
+        this_generator_script_path = pathlib.PurePath(os.path.realpath(__file__)).as_posix()
+        if not changes_cache.exists_unchanged(this_generator_script_path):
+            report.generator_changed = this_generator_script_path in changes_cache.cache
+            changes_cache.erase()
+            changes_cache.update_modification_time(this_generator_script_path)
+
+        # Erase cache contents about paths that are no longer part of the build.
+        # This means that if you build multiple targets in a single build
+        # directory, subsequent calls to the generator may erase each other's
+        # cached information. So I'm considering removing this.
+        old_paths = [
+            k
+            for k in list(changes_cache.cache.keys())
+            if k not in sources + [this_generator_script_path] + [m.output for m in modules]
+        ]
+        for path in old_paths:
+            logger.debug(f"{NAME_OF_THIS_FILE}: deleting {path} from the cache")
+            del changes_cache.cache[path]
+            changes_cache.dirty = True
+        report.evicted_cache_entries = len(old_paths)
+
+    # A module only needs to be regenerated if any of the function signatures
+    # in any of its source files changed.
+    with report.phase("parse"):
+        changed_sources = set(update_code_sections(changes_cache, sources, report))
+
+    for module in modules:
+        inputs_changed = any([s in changed_sources for s in module.sources])
+        output_changed = not changes_cache.exists_unchanged(
+            module.output
+        ) or module.get_output_options() != changes_cache.get_data(module.output)
+
+        if inputs_changed or output_changed:
+            module_function_definitions = [
+                d
+                for path in module.sources
+                for d in changes_cache.get_data(path)["module_function_definitions"]
+            ]
+            with open(module.output, "w") as output_file:
+                emit_start = time.perf_counter()
+                write_cpp(
+                    output_file,
+                    module.module_name,
+                    [changes_cache.get_data(path, "fragments") for path in module.sources],
+                    module_function_definitions,
+                    module.namespace_submodules,
+                    module.c_abi,
+                    module.memory_accounting,
+                    module.multi_phase_init,
+                )
+                # Most of the writing happens when the buffered output is flushed
+                write_start = time.perf_counter()
+                output_file.flush()
+                write_end = time.perf_counter()
+            changes_cache.update_modification_time(module.output)
+            changes_cache.store_data(module.output, module.get_output_options())
+            report.add_module(
+                module.module_name,
+                module.output,
+                True,
+                len(module_function_definitions),
+                write_start - emit_start,
+                write_end - write_start,
+            )
+        else:
+            logger.info(
+                f"{NAME_OF_THIS_FILE}: no changes in exported function signatures of {module.module_name}. Skipping code generation."
+            )
+            report.add_module(module.module_name, module.output, False)
 
-        code = generate_cpp(code_sections, args.module_name)
-        code = cpp_indent(code, 2)
+    if changes_cache.dirty:
+        with report.phase("cache_save"):
+            changes_cache.save_to_disk()
 
-        with open(args.output, "w") as output_file:
-            output_file.write(code)
-            changes_cache.update_modification_time(args.output)
+    if args.report is not None:
+        report.save(args.report)
 
-        changes_cache.save_to_disk()
-    else:
-        logger.info(
-            f"{NAME_OF_THIS_FILE}: no changes in exported function signatures. Skipping code generation."
-        )
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_arguments(argv)
+    changes_cache = ChangesCache(CHANGES_CACHE_PATH)
+    generate(args, changes_cache)
 
 
 if __name__ == "__main__":
     logging.basicConfig()
-    import time
 
     start = time.perf_counter()
     main()
@@ -0,0 +1,19 @@
+/*
+ * Copyright (c) 2020 Attila Szarvas <attila.szarvas@gmail.com>
+ *
+ * All rights reserved. Use of this source code is governed the 3-Clause BSD
+ * License BSD-style license that can be found in the LICENSE file.
+ */
+
+/*
+ * Source of the static `bbmp_python_conversions` library. It is compiled once
+ * per build, and generated Python extension modules link against it instead
+ * of instantiating the conversions in `conversions.hpp` themselves.
+ */
+
+#include "conversions.hpp"
+
+#define BBMP_INTEROP_DEFINE_PREBUILT_CONVERSIONS(T) \
+  BBMP_INTEROP_CONVERSIONS_INSTANTIATION(template, T)
+BBMP_INTEROP_FOR_EACH_PREBUILT_TYPE(BBMP_INTEROP_DEFINE_PREBUILT_CONVERSIONS)
+#undef BBMP_INTEROP_DEFINE_PREBUILT_CONVERSIONS
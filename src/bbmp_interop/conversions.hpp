@@ -21,6 +21,20 @@
 
 #include "types.hpp"
 
+#include <algorithm>
+#include <array>
+#include <atomic>
+#include <cstdint>
+#include <exception>
+#include <map>
+#include <memory>
+#include <mutex>
+#include <string>
+#include <tuple>
+#include <type_traits>
+#include <utility>
+#include <vector>
+
 #include "pybind11/numpy.h"
 #include "pybind11/pybind11.h"
 
@@ -37,6 +51,166 @@ inline void assert_c_contiguous(const NumpyNdarray<T>& arr) {
 }
 
 namespace bbmp {
+// Whether the calling thread holds the GIL. Before Python 3.13 the unchecked
+// thread state belongs to whichever thread holds the GIL, and
+// PyGILState_Check() always succeeds once a sub-interpreter was created, so the
+// holder's thread is compared instead.
+inline bool holdsGil() noexcept {
+#if PY_VERSION_HEX >= 0x030D0000
+  return PyThreadState_GetUnchecked() != nullptr;
+#else
+  const auto thread_state = _PyThreadState_UncheckedGet();
+  return thread_state != nullptr &&
+         thread_state->thread_id == PyThread_get_thread_ident();
+#endif
+}
+
+// The interpreter of the calling thread, which must hold the GIL
+inline PyInterpreterState* currentInterpreter() noexcept {
+#if PY_VERSION_HEX >= 0x03090000
+  return PyInterpreterState_Get();
+#else
+  return PyThreadState_Get()->interp;
+#endif
+}
+
+inline PyInterpreterState* mainInterpreter() noexcept {
+#if PY_VERSION_HEX >= 0x03080000
+  return PyInterpreterState_Main();
+#else
+  // Interpreters are prepended to the list, so the main one is the last. The
+  // first call holds the GIL.
+  static const auto main_interpreter = []() {
+    auto interpreter = PyInterpreterState_Head();
+    while (PyInterpreterState_Next(interpreter) != nullptr) {
+      interpreter = PyInterpreterState_Next(interpreter);
+    }
+    return interpreter;
+  }();
+  return main_interpreter;
+#endif
+}
+
+/*
+ * `OwnedChannelData` created from an ndarray may be destroyed on a thread that
+ * doesn't hold the GIL, where the reference to the ndarray can't be released.
+ * Such references are queued instead, and released in a batch the next time
+ * the GIL is held by a thread releasing or creating an `OwnedChannelData`, or
+ * by a pending call, that the interpreter runs on the main thread.
+ *
+ * References are only released in the interpreter that created them. The
+ * pending call runs in the main interpreter, so references of sub-interpreters
+ * wait until the sub-interpreter converts or releases another ndarray, or
+ * frees a module generated with the MULTI_PHASE_INIT option.
+ */
+class DeferredReleaseQueue {
+ public:
+  BBMP_INTEROP_API static DeferredReleaseQueue& instance() {
+    // Never destroyed, because it may be used during static destruction
+    static auto queue = new DeferredReleaseQueue();
+    return *queue;
+  }
+
+  void release(PyObject* object, PyInterpreterState* interpreter) {
+    if (!Py_IsInitialized()) {
+      // Nothing to release after the interpreter has been finalized
+      return;
+    }
+
+    if (holdsGil() && currentInterpreter() == interpreter) {
+      Py_DECREF(object);
+      drain();
+      return;
+    }
+
+    std::lock_guard<std::mutex> lock(mutex_);
+    objects_.emplace_back(object, interpreter);
+    num_pending_.store(objects_.size(), std::memory_order_release);
+    if (!pending_call_scheduled_) {
+      // Py_AddPendingCall may be called without holding the GIL. If the
+      // interpreter's queue is full, we'll drain on the next opportunity.
+      pending_call_scheduled_ = Py_AddPendingCall(&drainPendingCall, this) == 0;
+    }
+  }
+
+  // Releases the queued references of the current interpreter. Must be called
+  // with the GIL held.
+  void drain() {
+    if (num_pending_.load(std::memory_order_acquire) == 0) {
+      return;
+    }
+
+    const auto interpreter = currentInterpreter();
+    std::vector<PyObject*> objects;
+    {
+      std::lock_guard<std::mutex> lock(mutex_);
+      const auto other_interpreters = std::stable_partition(
+          objects_.begin(), objects_.end(),
+          [interpreter](const std::pair<PyObject*, PyInterpreterState*>& o) {
+            return o.second != interpreter;
+          });
+      for (auto it = other_interpreters; it != objects_.end(); ++it) {
+        objects.push_back(it->first);
+      }
+      objects_.erase(other_interpreters, objects_.end());
+      num_pending_.store(objects_.size(), std::memory_order_release);
+    }
+
+    for (auto object : objects) {
+      Py_DECREF(object);
+    }
+  }
+
+  size_t num_pending() const noexcept {
+    return num_pending_.load(std::memory_order_acquire);
+  }
+
+ private:
+  DeferredReleaseQueue() = default;
+
+  static int drainPendingCall(void* queue) {
+    auto& self = *static_cast<DeferredReleaseQueue*>(queue);
+    {
+      std::lock_guard<std::mutex> lock(self.mutex_);
+      self.pending_call_scheduled_ = false;
+    }
+    self.drain();
+    return 0;
+  }
+
+  std::mutex mutex_;
+  std::vector<std::pair<PyObject*, PyInterpreterState*>> objects_;
+  std::atomic<size_t> num_pending_{0};
+  bool pending_call_scheduled_ = false;
+};
+
+// Deleter of the ndarrays converted in the main interpreter
+inline void releasePyObject(void* object) {
+  DeferredReleaseQueue::instance().release(static_cast<PyObject*>(object),
+                                           mainInterpreter());
+}
+
+// Ndarrays converted in sub-interpreters also remember their interpreter
+struct SubinterpreterObject {
+  PyObject* object;
+  PyInterpreterState* interpreter;
+};
+
+inline void releaseSubinterpreterObject(void* object) {
+  std::unique_ptr<SubinterpreterObject> owned(
+      static_cast<SubinterpreterObject*>(object));
+  DeferredReleaseQueue::instance().release(owned->object, owned->interpreter);
+}
+
+inline TypeErasedUniquePtr ownPyObject(PyObject* object) {
+  const auto interpreter = currentInterpreter();
+  if (interpreter == mainInterpreter()) {
+    return TypeErasedUniquePtr(object, &releasePyObject);
+  }
+  return TypeErasedUniquePtr(new SubinterpreterObject{object, interpreter},
+                             &releaseSubinterpreterObject);
+}
+
 template <typename T>
 OwnedChannelData<T> createOwnedChannelData(NumpyNdarray<T>&& ndarray) {
   assert_c_contiguous(ndarray);
@@ -45,23 +219,995 @@ OwnedChannelData<T> createOwnedChannelData(NumpyNdarray<T>&& ndarray) {
     throw std::domain_error("At most two-dimensional arrays are supported.");
   }
 
-  auto typed_heap_object = moveOntoHeap(std::move(ndarray));
-  auto raw_ptr = typed_heap_object.get();
-  auto heap_object = makeTypeErasedUniquePtr(std::move(typed_heap_object));
+  // We hold the GIL, so this is a good time to release queued references
+  DeferredReleaseQueue::instance().drain();
 
   int num_channels = 0;
   size_t length = 0;
-  if (raw_ptr->ndim() == 1) {
+  if (ndarray.ndim() == 1) {
     num_channels = 1;
-    length = raw_ptr->shape(0);
-  } else if (raw_ptr->ndim() == 2) {
-    num_channels = bbmp::asserted_static_cast_int(raw_ptr->shape(0));
-    length = raw_ptr->shape(1);
+    length = ndarray.shape(0);
+  } else if (ndarray.ndim() == 2) {
+    num_channels = bbmp::asserted_static_cast_int(ndarray.shape(0));
+    length = ndarray.shape(1);
+  }
+
+  const auto data = ndarray.mutable_data();
+  auto heap_object = ownPyObject(ndarray.release().ptr());
+
+  auto get_ch_ptr = [data, length](const int num_ch) noexcept {
+    return data + num_ch * length;
+  };
+  OwnedChannelData<T> result(std::move(heap_object), num_channels, length,
+                             std::move(get_ch_ptr));
+  result.account(MemoryOrigin::ndarray);
+  return result;
+}
+
+/*
+ * Holds the buffer of a Python object while an exported function uses a
+ * `Span` or `std::string_view` of it, and releases it on destruction. With
+ * `accept_str`, a `str` is viewed as its UTF-8 representation instead, which
+ * CPython caches in the string object.
+ */
+class BufferView {
+ public:
+  BufferView(const pybind11::handle& object, const bool writable,
+             const bool accept_str = false) {
+    if (accept_str && PyUnicode_Check(object.ptr())) {
+      Py_ssize_t size = 0;
+      const auto data = PyUnicode_AsUTF8AndSize(object.ptr(), &size);
+      if (data == nullptr) {
+        throw pybind11::error_already_set();
+      }
+      buffer_.buf = const_cast<char*>(data);
+      buffer_.len = size;
+      buffer_.itemsize = 1;
+      return;
+    }
+
+    const int flags =
+        PyBUF_C_CONTIGUOUS | PyBUF_FORMAT | (writable ? PyBUF_WRITABLE : 0);
+    if (PyObject_GetBuffer(object.ptr(), &buffer_, flags) != 0) {
+      throw pybind11::error_already_set();
+    }
+    acquired_ = true;
+  }
+
+  BufferView(const BufferView&) = delete;
+  BufferView& operator=(const BufferView&) = delete;
+
+  ~BufferView() {
+    if (acquired_) {
+      PyBuffer_Release(&buffer_);
+    }
+  }
+
+  /*
+   * Spans of single byte integer types view the buffer as raw bytes. Other
+   * types, including `bool`, whose other values than 0 and 1 are undefined,
+   * require a one-dimensional buffer with the matching format.
+   */
+  template <typename T>
+  Span<T> span(const char* parameter_name) const {
+    using Value = typename std::remove_const<T>::type;
+    static_assert(std::is_arithmetic<Value>::value,
+                  "Spans of Python buffers must have arithmetic types");
+
+    if (sizeof(Value) == 1 && !std::is_same<Value, bool>::value) {
+      return {static_cast<T*>(buffer_.buf), static_cast<size_t>(buffer_.len)};
+    }
+
+    if (buffer_.ndim > 1 || !formatMatches<Value>()) {
+      throw pybind11::type_error(
+          std::string(parameter_name) + ": buffer has format '" +
+          (buffer_.format != nullptr ? buffer_.format : "B") +
+          "' and item size " + std::to_string(buffer_.itemsize) +
+          ", expected a one-dimensional buffer of format '" +
+          pybind11::format_descriptor<Value>::format() + "'");
+    }
+    return {static_cast<T*>(buffer_.buf),
+            static_cast<size_t>(buffer_.len / buffer_.itemsize)};
+  }
+
+#ifdef PYBIND11_HAS_STRING_VIEW
+  std::string_view stringView() const {
+    return {static_cast<const char*>(buffer_.buf),
+            static_cast<size_t>(buffer_.len)};
+  }
+#endif
+
+ private:
+  template <typename T>
+  bool formatMatches() const {
+    if (buffer_.itemsize != static_cast<Py_ssize_t>(sizeof(T))) {
+      return false;
+    }
+
+    // Only native byte order is accepted
+    const uint16_t byte_order_probe = 1;
+    const bool little_endian =
+        *reinterpret_cast<const uint8_t*>(&byte_order_probe) == 1;
+    std::string format = buffer_.format != nullptr ? buffer_.format : "B";
+    if (!format.empty() && (format[0] == '@' || format[0] == '=' ||
+                            format[0] == (little_endian ? '<' : '>'))) {
+      format.erase(0, 1);
+    }
+    if (format.size() != 1) {
+      return false;
+    }
+
+    // Integer formats of the same size and signedness are interchangeable,
+    // e.g. 'l' and 'q' on Linux
+    if (std::is_integral<T>::value && !std::is_same<T, bool>::value) {
+      const std::string integer_formats =
+          std::is_signed<T>::value ? "bhilq" : "BHILQ";
+      return integer_formats.find(format[0]) != std::string::npos;
+    }
+    return format[0] == pybind11::format_descriptor<T>::c;
+  }
+
+  Py_buffer buffer_{};
+  bool acquired_ = false;
+};
+
+/*
+ * Ndarrays are identified by the kind character and the item size of their
+ * dtype. Unlike the type number, this maps aliases like `int64` and `longlong`
+ * to the same key. Returns `kDtypeKeyCount` for dtypes that can't be keyed.
+ */
+constexpr size_t kMaxDtypeItemSize = 16;
+constexpr size_t kDtypeKeyCount = 5 * (kMaxDtypeItemSize + 1);
+
+inline size_t dtypeKey(const pybind11::dtype& dtype) {
+  static const std::string kinds = "biufc";
+  const auto kind_ix = kinds.find(dtype.kind());
+  const auto item_size = static_cast<size_t>(dtype.itemsize());
+  if (kind_ix == std::string::npos || item_size > kMaxDtypeItemSize) {
+    return kDtypeKeyCount;
+  }
+  return kind_ix * (kMaxDtypeItemSize + 1) + item_size;
+}
+
+inline std::string dtypeName(const pybind11::dtype& dtype) {
+  return dtype.attr("name").cast<std::string>();
+}
+
+/*
+ * Reinterprets an ndarray as `NumpyNdarray<T>` without copying. Throws a
+ * `TypeError` if the ndarray doesn't hold values of type `T`.
+ */
+template <typename T>
+NumpyNdarray<T> castNdarray(const pybind11::array& ndarray) {
+  if (!NumpyNdarray<T>::check_(ndarray)) {
+    throw pybind11::type_error("ndarray argument has dtype " +
+                               dtypeName(ndarray.dtype()) + ", expected " +
+                               dtypeName(pybind11::dtype::of<T>()));
+  }
+  return pybind11::reinterpret_borrow<NumpyNdarray<T>>(ndarray);
+}
+
+/*
+ * Moves the vector into a one-dimensional ndarray without copying its
+ * elements. The ndarray owns the vector through a capsule, which destroys the
+ * vector when the ndarray is garbage collected.
+ */
+template <typename T>
+NumpyNdarray<T> toNdarray(std::vector<T>&& vector) {
+  auto heap_vector = std::make_unique<std::vector<T>>(std::move(vector));
+  const auto length = static_cast<pybind11::ssize_t>(heap_vector->size());
+  const auto data = heap_vector->data();
+
+  pybind11::capsule owner(heap_vector.get(), [](void* p) {
+    delete static_cast<std::vector<T>*>(p);
+  });
+  heap_vector.release();
+
+  return NumpyNdarray<T>({length}, {static_cast<pybind11::ssize_t>(sizeof(T))},
+                         data, owner);
+}
+
+/*
+ * Returns a two-dimensional ndarray of shape (num_channels, length). Channels
+ * following each other in memory, e.g. those of a mapped file, are moved into
+ * the ndarray without copying, which owns them through a capsule. Otherwise
+ * the values are copied. Read-only channel data gives a read-only ndarray.
+ */
+template <typename T>
+NumpyNdarray<T> toNdarray(OwnedChannelData<T>&& channel_data) {
+  const auto num_channels =
+      static_cast<pybind11::ssize_t>(channel_data.num_channels());
+  const auto length = static_cast<pybind11::ssize_t>(channel_data.length());
+  const auto read_only = channel_data.read_only();
+  const auto data =
+      num_channels > 0 ? channel_data.GetWriteChannelPtr(0) : nullptr;
+
+  auto contiguous = true;
+  for (auto chIx = 1; chIx < channel_data.num_channels(); ++chIx) {
+    contiguous &= channel_data.GetReadChannelPtr(chIx) == data + chIx * length;
+  }
+
+  NumpyNdarray<T> result;
+  if (contiguous) {
+    auto heap_data = moveOntoHeap(std::move(channel_data));
+    pybind11::capsule owner(heap_data.get(), [](void* p) {
+      delete static_cast<OwnedChannelData<T>*>(p);
+    });
+    heap_data.release();
+    result = NumpyNdarray<T>({num_channels, length}, {}, data, owner);
+  } else {
+    result = NumpyNdarray<T>({num_channels, length});
+    for (auto chIx = 0; chIx < channel_data.num_channels(); ++chIx) {
+      const auto channel = channel_data.GetReadChannelPtr(chIx);
+      std::copy(channel, channel + length, result.mutable_data(chIx));
+    }
+  }
+
+  if (read_only) {
+    pybind11::detail::array_proxy(result.ptr())->flags &=
+        ~pybind11::detail::npy_api::NPY_ARRAY_WRITEABLE_;
+  }
+  return result;
+}
+
+/*
+ * Returns a `BlockFunction<T>` calling `callable` with a read-only ndarray
+ * viewing each block, and copying the values of the returned array-like into
+ * the output. The values are converted to `T` if needed.
+ */
+template <typename T>
+BlockFunction<T> createBlockFunction(pybind11::object&& callable) {
+  if (!PyCallable_Check(callable.ptr())) {
+    throw pybind11::type_error("Expected a callable taking an ndarray");
+  }
+
+  // The function may be copied and destroyed on threads not holding the GIL,
+  // so it only holds the Python object through a shared pointer.
+  std::shared_ptr<pybind11::object> function(
+      new pybind11::object(std::move(callable)), [](pybind11::object* f) {
+        pybind11::gil_scoped_acquire gil;
+        delete f;
+      });
+
+  return BlockFunction<T>([function](const Span<const T> input,
+                                     const Span<T> output) {
+    pybind11::gil_scoped_acquire gil;
+
+    // A base object prevents the copy of the data
+    NumpyNdarray<T> view({static_cast<pybind11::ssize_t>(input.size())}, {},
+                         input.data(), pybind11::none());
+    pybind11::detail::array_proxy(view.ptr())->flags &=
+        ~pybind11::detail::npy_api::NPY_ARRAY_WRITEABLE_;
+
+    {
+      auto result = pybind11::array_t<T, pybind11::array::c_style |
+                                             pybind11::array::forcecast>::
+          ensure((*function)(view));
+      if (!result) {
+        throw pybind11::error_already_set();
+      }
+      if (static_cast<size_t>(result.size()) != output.size()) {
+        throw pybind11::value_error(
+            "The block callback returned " + std::to_string(result.size()) +
+            " values for a block of " + std::to_string(output.size()));
+      }
+      std::copy(result.data(), result.data() + output.size(), output.data());
+    }
+
+    if (view.ref_count() > 1) {
+      throw pybind11::value_error(
+          "The block callback must not keep the ndarray viewing the block");
+    }
+  });
+}
+
+inline std::string shapeToString(const pybind11::array& ndarray) {
+  std::string shape = "(";
+  for (pybind11::ssize_t i = 0; i < ndarray.ndim(); ++i) {
+    shape += (i > 0 ? ", " : "") + std::to_string(ndarray.shape(i));
+  }
+  return shape + (ndarray.ndim() == 1 ? ",)" : ")");
+}
+
+/*
+ * Returns the ndarray for an `OutChannelData<T>` parameter. If `out` is None,
+ * a new ndarray is allocated with the shape of `like`. Otherwise `out` must be
+ * a C contiguous ndarray of type `T`, with the same shape as `like`, if given.
+ */
+template <typename T>
+NumpyNdarray<T> prepareOutNdarray(const pybind11::object& out,
+                                  const pybind11::array* like) {
+  if (out.is_none()) {
+    if (like == nullptr) {
+      throw pybind11::type_error("missing required out argument");
+    }
+    return NumpyNdarray<T>(std::vector<pybind11::ssize_t>(
+        like->shape(), like->shape() + like->ndim()));
   }
 
-  auto get_ch_ptr = [raw_ptr, length](const int num_ch) noexcept {
-    return raw_ptr->mutable_unchecked().mutable_data() + num_ch * length;
+  if (!pybind11::isinstance<pybind11::array>(out)) {
+    throw pybind11::type_error("out argument must be an ndarray");
+  }
+  auto ndarray = castNdarray<T>(out.cast<pybind11::array>());
+  assert_c_contiguous(ndarray);
+  if (like != nullptr &&
+      (ndarray.ndim() != like->ndim() ||
+       !std::equal(like->shape(), like->shape() + like->ndim(),
+                   ndarray.shape()))) {
+    throw pybind11::value_error("out argument has shape " +
+                                shapeToString(ndarray) + ", expected " +
+                                shapeToString(*like));
+  }
+  return ndarray;
+}
+
+/*
+ * Counts the arguments converted for functions exported with
+ * `EXPORT_TO_PYTHON_CONVERTING`, by function, parameter and dtypes, to find
+ * the calls that would be cheaper if the caller passed the expected dtype.
+ */
+class DtypeConversions {
+ public:
+  struct Counters {
+    size_t count = 0;
+    size_t bytes = 0;
+    size_t copy_backs = 0;
   };
-  return {std::move(heap_object), num_channels, length, std::move(get_ch_ptr)};
+
+  // Function, parameter, dtype of the argument, dtype of the parameter
+  using Key = std::tuple<std::string, std::string, std::string, std::string>;
+
+  BBMP_INTEROP_API static DtypeConversions& global() {
+    static auto conversions = new DtypeConversions();
+    return *conversions;
+  }
+
+  void addConversion(const Key& key, const size_t bytes) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    auto& counters = counters_[key];
+    ++counters.count;
+    counters.bytes += bytes;
+  }
+
+  void addCopyBack(const Key& key) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    ++counters_[key].copy_backs;
+  }
+
+  std::map<Key, Counters> counters() const {
+    std::lock_guard<std::mutex> lock(mutex_);
+    return counters_;
+  }
+
+  void reset() {
+    std::lock_guard<std::mutex> lock(mutex_);
+    counters_.clear();
+  }
+
+ private:
+  DtypeConversions() = default;
+
+  mutable std::mutex mutex_;
+  std::map<Key, Counters> counters_;
+};
+
+/*
+ * Scratch buffers of converted arguments. They are cached per thread, so
+ * repeated calls with arguments of similar size reuse the same memory.
+ */
+BBMP_INTEROP_API inline BufferPool& scratchBufferPool() {
+  static auto pool = new BufferPool(64 * 1024 * 1024, 4);
+  return *pool;
 }
+
+/*
+ * Argument of an `OwnedChannelData<T>` parameter of a function exported with
+ * `EXPORT_TO_PYTHON_CONVERTING`. C contiguous ndarrays of type `T` are used
+ * directly. Other array-likes are converted into a scratch buffer, and
+ * `copyBack()` converts the values of mutable parameters back into the
+ * argument after the call.
+ *
+ * The scratch buffer returns to the pool once both this object and the
+ * `OwnedChannelData` are destroyed, so the function may keep the channels.
+ */
+template <typename T>
+class ConvertedNdarray {
+ public:
+  ConvertedNdarray(pybind11::array&& ndarray, const char* function,
+                   const char* parameter, const bool copy_back)
+      : source_(std::move(ndarray)), copy_back_(copy_back) {
+    if (source_.ndim() > 2) {
+      throw std::domain_error("At most two-dimensional arrays are supported.");
+    }
+    if (NumpyNdarray<T>::check_(source_) &&
+        (source_.flags() & pybind11::array::c_style) != 0) {
+      return;
+    }
+    if (source_.ndim() == 0) {
+      throw std::domain_error("At least one-dimensional arrays are required.");
+    }
+    if (copy_back_ && !source_.writeable()) {
+      throw std::domain_error("array is not writeable");
+    }
+
+    num_channels_ = source_.ndim() == 2
+                        ? bbmp::asserted_static_cast_int(source_.shape(0))
+                        : 1;
+    length_ = static_cast<size_t>(source_.shape(source_.ndim() - 1));
+    const auto bytes = num_channels_ * length_ * sizeof(T);
+    data_ = static_cast<T*>(scratchBufferPool().allocate(bytes));
+    scratch_ = std::shared_ptr<T>(data_, &BufferPool::release);
+    copyInto(view(), source_);
+
+    key_ =
+        DtypeConversions::Key(function, parameter, dtypeName(source_.dtype()),
+                              dtypeName(pybind11::dtype::of<T>()));
+    DtypeConversions::global().addConversion(key_, bytes);
+  }
+
+  bool converted() const noexcept { return data_ != nullptr; }
+
+  // The channels passed to the exported function. Called once.
+  OwnedChannelData<T> channelData() {
+    if (!converted()) {
+      return createOwnedChannelData(
+          pybind11::reinterpret_borrow<NumpyNdarray<T>>(source_));
+    }
+
+    const auto data = data_;
+    const auto length = length_;
+    auto get_ch_ptr = [data, length](const int num_ch) noexcept {
+      return data + num_ch * length;
+    };
+    OwnedChannelData<T> result(
+        makeTypeErasedUniquePtr(new std::shared_ptr<T>(scratch_)),
+        num_channels_, length_, std::move(get_ch_ptr));
+    result.account(MemoryOrigin::pool);
+    return result;
+  }
+
+  // Writes the converted values back into the argument of a mutable parameter
+  void copyBack() {
+    if (converted() && copy_back_) {
+      copyInto(source_, view());
+      DtypeConversions::global().addCopyBack(key_);
+    }
+  }
+
+ private:
+  static void copyInto(const pybind11::array& destination,
+                       const pybind11::array& source) {
+    if (pybind11::detail::npy_api::get().PyArray_CopyInto_(destination.ptr(),
+                                                           source.ptr()) != 0) {
+      throw pybind11::error_already_set();
+    }
+  }
+
+  // A base object prevents the copy of the data
+  NumpyNdarray<T> view() const {
+    return NumpyNdarray<T>(
+        std::vector<pybind11::ssize_t>(source_.shape(),
+                                       source_.shape() + source_.ndim()),
+        {}, data_, pybind11::none());
+  }
+
+  pybind11::array source_;
+  const bool copy_back_;
+  int num_channels_ = 0;
+  size_t length_ = 0;
+  T* data_ = nullptr;
+  std::shared_ptr<T> scratch_;
+  DtypeConversions::Key key_;
+};
+
+/*
+ * Returns the `MemoryAccounting` stats as a dict
+ *   {"enabled": bool, "soft_limit": int, "count": int, "bytes": int,
+ *    "peak_bytes": int, "by_origin": {origin: {dtype: {"count": int, ...}}}}
+ * listing only the origins and dtypes that had buffers.
+ */
+inline pybind11::dict memoryStatsToDict() {
+  const auto& accounting = MemoryAccounting::global();
+  const auto stats = accounting.stats();
+  auto counters_to_dict = [](const MemoryAccounting::Counters& counters) {
+    pybind11::dict result;
+    result["count"] = counters.count;
+    result["bytes"] = counters.bytes;
+    result["peak_bytes"] = counters.peak_bytes;
+    return result;
+  };
+
+  pybind11::dict result = counters_to_dict(stats.total);
+  result["enabled"] = accounting.enabled();
+  result["soft_limit"] = accounting.softLimit();
+  pybind11::dict by_origin;
+  for (size_t origin = 0; origin < MemoryAccounting::kNumOrigins; ++origin) {
+    pybind11::dict by_dtype;
+    for (size_t dtype = 0; dtype < MemoryAccounting::kNumDtypes; ++dtype) {
+      const auto& counters = stats.by_origin[origin][dtype];
+      if (counters.peak_bytes != 0 || counters.count != 0) {
+        by_dtype[MemoryAccounting::dtypeName(dtype)] =
+            counters_to_dict(counters);
+      }
+    }
+    if (!by_dtype.empty()) {
+      by_origin[MemoryAccounting::originName(origin)] = by_dtype;
+    }
+  }
+  result["by_origin"] = by_origin;
+  return result;
+}
+
+/*
+ * Enables the `MemoryAccounting`, and adds the `_bbmp_memory_stats()` and
+ * `_bbmp_configure_memory_accounting()` functions to the module. Called by
+ * modules generated with the MEMORY_ACCOUNTING option.
+ */
+inline void defineMemoryAccountingFunctions(pybind11::module& m) {
+  MemoryAccounting::global().setEnabled(true);
+
+  m.def("_bbmp_memory_stats", &memoryStatsToDict,
+        "Count and bytes of the live OwnedChannelData buffers, and their "
+        "high-water marks");
+  m.def(
+      "_bbmp_configure_memory_accounting",
+      [](const bool enabled, const size_t soft_limit,
+         const pybind11::object& callback, const bool reset_peaks) {
+        auto& accounting = MemoryAccounting::global();
+        accounting.setEnabled(enabled);
+        if (reset_peaks) {
+          accounting.resetPeaks();
+        }
+        if (callback.is_none()) {
+          accounting.setSoftLimit(soft_limit, nullptr);
+          return;
+        }
+        // The callback is called after acquiring the GIL with
+        // PyGILState_Ensure, which selects the main interpreter
+        if (currentInterpreter() != mainInterpreter()) {
+          throw std::runtime_error(
+              "The memory accounting callback can only be set in the main "
+              "interpreter");
+        }
+
+        // The callback may be copied and destroyed on threads not holding the
+        // GIL, so it only holds the Python object through a shared pointer.
+        std::shared_ptr<pybind11::object> function(
+            new pybind11::object(callback), [](pybind11::object* f) {
+              pybind11::gil_scoped_acquire gil;
+              delete f;
+            });
+        accounting.setSoftLimit(soft_limit, [function](const size_t bytes) {
+          pybind11::gil_scoped_acquire gil;
+          try {
+            (*function)(bytes);
+          } catch (pybind11::error_already_set& e) {
+            e.restore();
+            PyErr_WriteUnraisable(function->ptr());
+          }
+        });
+      },
+      pybind11::arg("enabled") = true, pybind11::arg("soft_limit") = 0,
+      pybind11::arg("callback") = pybind11::none(),
+      pybind11::arg("reset_peaks") = false,
+      "Enables or disables the accounting, and sets a soft limit in bytes, "
+      "above which callback(live_bytes) is called");
+}
+
+/*
+ * Adds the `_bbmp_dtype_conversions()` function to the module, returning
+ *   {"conversions": [{"function": str, "parameter": str, "from": str,
+ *                     "to": str, "count": int, "bytes": int,
+ *                     "copy_backs": int}, ...],
+ *    "scratch_hits": int, "scratch_misses": int}
+ * with the most frequent conversions first. Called by modules containing
+ * functions exported with `EXPORT_TO_PYTHON_CONVERTING`.
+ */
+inline void defineDtypeConversionFunctions(pybind11::module& m) {
+  m.def(
+      "_bbmp_dtype_conversions",
+      [](const bool reset) {
+        auto& conversions = DtypeConversions::global();
+        auto counters = conversions.counters();
+        if (reset) {
+          conversions.reset();
+        }
+
+        std::vector<
+            std::pair<DtypeConversions::Key, DtypeConversions::Counters>>
+            sorted(counters.begin(), counters.end());
+        std::stable_sort(sorted.begin(), sorted.end(),
+                         [](const decltype(sorted)::value_type& a,
+                            const decltype(sorted)::value_type& b) {
+                           return a.second.count > b.second.count;
+                         });
+
+        pybind11::list list;
+        for (const auto& entry : sorted) {
+          pybind11::dict conversion;
+          conversion["function"] = std::get<0>(entry.first);
+          conversion["parameter"] = std::get<1>(entry.first);
+          conversion["from"] = std::get<2>(entry.first);
+          conversion["to"] = std::get<3>(entry.first);
+          conversion["count"] = entry.second.count;
+          conversion["bytes"] = entry.second.bytes;
+          conversion["copy_backs"] = entry.second.copy_backs;
+          list.append(conversion);
+        }
+
+        const auto pool_stats = scratchBufferPool().stats();
+        pybind11::dict result;
+        result["conversions"] = list;
+        result["scratch_hits"] = pool_stats.hits;
+        result["scratch_misses"] = pool_stats.misses;
+        return result;
+      },
+      pybind11::arg("reset") = false,
+      "Counts of the arguments converted to the dtype of the parameter, and "
+      "the reuse of their scratch buffers");
+}
+
+namespace c_abi {
+/*
+ * Message of the exception thrown by the last C ABI entry point called on this
+ * thread, or empty if it returned normally.
+ */
+inline std::string& lastError() noexcept {
+  static thread_local std::string error;
+  return error;
+}
+
+template <typename R>
+struct Guard {
+  template <typename Function>
+  static R call(Function&& function) noexcept {
+    lastError().clear();
+    try {
+      return function();
+    } catch (const std::exception& e) {
+      lastError() = e.what();
+    } catch (...) {
+      lastError() = "unknown exception";
+    }
+    return R{};
+  }
+};
+
+template <>
+struct Guard<void> {
+  template <typename Function>
+  static void call(Function&& function) noexcept {
+    lastError().clear();
+    try {
+      function();
+    } catch (const std::exception& e) {
+      lastError() = e.what();
+    } catch (...) {
+      lastError() = "unknown exception";
+    }
+  }
+};
+
+/*
+ * Calls `function` from a C ABI entry point, which must not let exceptions
+ * escape into the JIT compiled caller. If it throws, a value initialized `R`
+ * is returned, and the message is available from `lastError()`.
+ */
+template <typename R, typename Function>
+R call(Function&& function) noexcept {
+  return Guard<R>::call(std::forward<Function>(function));
+}
+}  // namespace c_abi
+
+/*
+ * `METH_FASTCALL` entry points for exported functions taking and returning
+ * only arithmetic values. They convert positional arguments of exact types
+ * directly, and leave every other call, e.g. with keyword arguments or values
+ * needing a conversion, to the pybind11 function they replace, so behavior and
+ * error messages stay the same.
+ */
+namespace fastcall {
+#if PY_VERSION_HEX >= 0x03070000
+#define BBMP_INTEROP_HAS_FASTCALL
+#endif
+
+inline bool load(PyObject* object, bool& value) {
+  if (object != Py_True && object != Py_False) {
+    return false;
+  }
+  value = object == Py_True;
+  return true;
+}
+
+template <typename T>
+typename std::enable_if<std::is_integral<T>::value &&
+                            std::is_signed<T>::value,
+                        bool>::type
+load(PyObject* object, T& value) {
+  if (!PyLong_CheckExact(object)) {
+    return false;
+  }
+  int overflow = 0;
+  const auto result = PyLong_AsLongLongAndOverflow(object, &overflow);
+  if (overflow != 0 || result < std::numeric_limits<T>::min() ||
+      result > std::numeric_limits<T>::max()) {
+    return false;
+  }
+  value = static_cast<T>(result);
+  return true;
+}
+
+template <typename T>
+typename std::enable_if<std::is_integral<T>::value &&
+                            std::is_unsigned<T>::value,
+                        bool>::type
+load(PyObject* object, T& value) {
+  if (!PyLong_CheckExact(object)) {
+    return false;
+  }
+  const auto result = PyLong_AsUnsignedLongLong(object);
+  if (PyErr_Occurred()) {
+    PyErr_Clear();
+    return false;
+  }
+  if (result > std::numeric_limits<T>::max()) {
+    return false;
+  }
+  value = static_cast<T>(result);
+  return true;
+}
+
+template <typename T>
+typename std::enable_if<std::is_floating_point<T>::value, bool>::type load(
+    PyObject* object, T& value) {
+  if (!PyFloat_CheckExact(object)) {
+    return false;
+  }
+  value = static_cast<T>(PyFloat_AS_DOUBLE(object));
+  return true;
+}
+
+inline PyObject* toPython(const bool value) { return PyBool_FromLong(value); }
+
+template <typename T>
+typename std::enable_if<std::is_integral<T>::value && std::is_signed<T>::value,
+                        PyObject*>::type
+toPython(const T value) {
+  return PyLong_FromLongLong(value);
+}
+
+template <typename T>
+typename std::enable_if<std::is_integral<T>::value &&
+                            std::is_unsigned<T>::value,
+                        PyObject*>::type
+toPython(const T value) {
+  return PyLong_FromUnsignedLongLong(value);
+}
+
+template <typename T>
+typename std::enable_if<std::is_floating_point<T>::value, PyObject*>::type
+toPython(const T value) {
+  return PyFloat_FromDouble(value);
+}
+
+inline PyObject* toPython(const std::string& value) {
+  return PyUnicode_DecodeUTF8(
+      value.data(), static_cast<pybind11::ssize_t>(value.size()), nullptr);
+}
+
+/*
+ * Sets the Python error for the exception being handled, trying the
+ * registered exception translators the same way pybind11's dispatcher does.
+ */
+inline void translateActiveException() {
+  auto last_exception = std::current_exception();
+  auto& translators =
+      pybind11::detail::get_internals().registered_exception_translators;
+  for (auto& translator : translators) {
+    try {
+      translator(last_exception);
+    } catch (...) {
+      last_exception = std::current_exception();
+      continue;
+    }
+    return;
+  }
+  PyErr_SetString(PyExc_SystemError,
+                  "Exception escaped from default exception translator!");
+}
+
+// `fallback` is the pybind11 function of the export
+inline PyObject* callFallback(PyObject* fallback, PyObject* const* args,
+                              const Py_ssize_t nargs, PyObject* kwnames) {
+#if PY_VERSION_HEX >= 0x03090000
+  return PyObject_Vectorcall(fallback, args, static_cast<size_t>(nargs),
+                             kwnames);
+#else
+  const auto num_kwargs = kwnames != nullptr ? PyTuple_GET_SIZE(kwnames) : 0;
+  auto positional = pybind11::reinterpret_steal<pybind11::tuple>(
+      PyTuple_New(nargs));
+  for (Py_ssize_t i = 0; i < nargs; ++i) {
+    Py_INCREF(args[i]);
+    PyTuple_SET_ITEM(positional.ptr(), i, args[i]);
+  }
+  pybind11::dict keywords;
+  for (Py_ssize_t i = 0; i < num_kwargs; ++i) {
+    PyDict_SetItem(keywords.ptr(), PyTuple_GET_ITEM(kwnames, i),
+                   args[nargs + i]);
+  }
+  return PyObject_Call(fallback, positional.ptr(), keywords.ptr());
+#endif
+}
+
+template <typename Function, typename... Args>
+PyObject* invoke(std::true_type /* returns void */, Function& function,
+                 Args&... args) {
+  function(args...);
+  Py_RETURN_NONE;
+}
+
+template <typename Function, typename... Args>
+PyObject* invoke(std::false_type /* returns void */, Function& function,
+                 Args&... args) {
+  return toPython(function(args...));
+}
+
+template <typename... Args, typename Function, size_t... I>
+PyObject* call(PyObject* fallback, PyObject* const* args,
+               const Py_ssize_t nargs, PyObject* kwnames, Function& function,
+               std::index_sequence<I...>) {
+  if (kwnames != nullptr || nargs != sizeof...(Args)) {
+    return callFallback(fallback, args, nargs, kwnames);
+  }
+
+  std::tuple<Args...> values;
+  const bool loaded[] = {true, load(args[I], std::get<I>(values))...};
+  for (const auto is_loaded : loaded) {
+    if (!is_loaded) {
+      return callFallback(fallback, args, nargs, kwnames);
+    }
+  }
+
+  using returns_void =
+      std::is_void<decltype(function(std::get<I>(values)...))>;
+  try {
+    return invoke(returns_void{}, function, std::get<I>(values)...);
+  } catch (...) {
+    translateActiveException();
+    return nullptr;
+  }
+}
+
+/*
+ * Calls `function` with the arguments converted to `Args`. The generated
+ * `METH_FASTCALL | METH_KEYWORDS` functions forward to it.
+ */
+template <typename... Args, typename Function>
+PyObject* call(PyObject* fallback, PyObject* const* args,
+               const Py_ssize_t nargs, PyObject* kwnames, Function function) {
+  return call<Args...>(fallback, args, nargs, kwnames, function,
+                       std::index_sequence_for<Args...>{});
+}
+
+/*
+ * Replaces the pybind11 function `name` of `scope` with a function using
+ * `method_def`, which keeps the pybind11 function for its fallback calls. It
+ * has to be called after every `def` of the scope, because pybind11 looks up
+ * existing functions of the same name for chaining overloads. Overloaded
+ * functions are left to pybind11.
+ */
+inline void install(pybind11::module& scope, const char* name,
+                    PyMethodDef* method_def) {
+#ifdef BBMP_INTEROP_HAS_FASTCALL
+  pybind11::object fallback = scope.attr(name);
+  auto record = static_cast<pybind11::detail::function_record*>(
+      pybind11::reinterpret_borrow<pybind11::capsule>(
+          PyCFunction_GET_SELF(fallback.ptr())));
+  if (record->next != nullptr) {
+    return;
+  }
+
+  // `method_def` is shared by every interpreter importing the module, while
+  // the name and the docstring of the pybind11 function are freed with its
+  // interpreter. The first interpreter sets copies of them, which are the
+  // same in every interpreter, and are never freed, like `method_def`.
+  if (method_def->ml_name == nullptr) {
+    const auto fallback_method_def =
+        reinterpret_cast<PyCFunctionObject*>(fallback.ptr())->m_ml;
+    method_def->ml_name =
+        (new std::string(fallback_method_def->ml_name))->c_str();
+    if (fallback_method_def->ml_doc != nullptr) {
+      method_def->ml_doc =
+          (new std::string(fallback_method_def->ml_doc))->c_str();
+    }
+    method_def->ml_flags = METH_FASTCALL | METH_KEYWORDS;
+  }
+
+  auto function = pybind11::reinterpret_steal<pybind11::object>(
+      PyCFunction_NewEx(method_def, fallback.ptr(),
+                        scope.attr("__name__").ptr()));
+  if (!function) {
+    throw pybind11::error_already_set();
+  }
+  scope.attr(name) = function;
+#endif
+}
+}  // namespace fastcall
+
+/*
+ * Selects the function instantiated for the dtype of an ndarray with a single
+ * table lookup. Used by the generated entry points of function templates
+ * exported with `EXPORT_TO_PYTHON_TYPES(...)`.
+ */
+template <typename Function>
+class DtypeDispatchTable {
+ public:
+  explicit DtypeDispatchTable(std::string function_name)
+      : function_name_(std::move(function_name)) {
+    functions_.fill(nullptr);
+  }
+
+  template <typename T>
+  void add(Function function) {
+    const auto dtype = pybind11::dtype::of<T>();
+    functions_[dtypeKey(dtype)] = function;
+    supported_dtypes_ +=
+        (supported_dtypes_.empty() ? "" : ", ") + dtypeName(dtype);
+  }
+
+  Function find(const pybind11::array& ndarray) const {
+    const auto key = dtypeKey(ndarray.dtype());
+    if (key < kDtypeKeyCount && functions_[key] != nullptr) {
+      return functions_[key];
+    }
+    throw pybind11::type_error(function_name_ +
+                               "(): unsupported ndarray dtype " +
+                               dtypeName(ndarray.dtype()) +
+                               ", supported dtypes are " + supported_dtypes_);
+  }
+
+ private:
+  std::string function_name_;
+  std::string supported_dtypes_;
+  std::array<Function, kDtypeKeyCount + 1> functions_;
+};
 }  // namespace bbmp
+
+/*
+ * The static `bbmp_python_conversions` library contains explicit
+ * instantiations of the conversions for the dtypes below. When linking
+ * against it, `BBMP_INTEROP_PREBUILT_CONVERSIONS` is defined, and the
+ * generated modules don't instantiate these templates themselves.
+ */
+#define BBMP_INTEROP_FOR_EACH_PREBUILT_TYPE(MACRO) \
+  MACRO(float)                                     \
+  MACRO(double)                                    \
+  MACRO(int8_t)                                    \
+  MACRO(int16_t)                                   \
+  MACRO(int32_t)                                   \
+  MACRO(int64_t)                                   \
+  MACRO(uint8_t)                                   \
+  MACRO(uint16_t)                                  \
+  MACRO(uint32_t)                                  \
+  MACRO(uint64_t)
+
+#define BBMP_INTEROP_CONVERSIONS_INSTANTIATION(PREFIX, T)                  \
+  PREFIX void assert_c_contiguous<T>(const NumpyNdarray<T>&);              \
+  namespace bbmp {                                                         \
+  PREFIX class OwnedChannelData<T>;                                        \
+  PREFIX OwnedChannelData<T> createOwnedChannelData<T>(NumpyNdarray<T>&&); \
+  PREFIX NumpyNdarray<T> castNdarray<T>(const pybind11::array&);           \
+  PREFIX NumpyNdarray<T> prepareOutNdarray<T>(const pybind11::object&,     \
+                                              const pybind11::array*);     \
+  PREFIX NumpyNdarray<T> toNdarray<T>(std::vector<T>&&);                   \
+  PREFIX NumpyNdarray<T> toNdarray<T>(OwnedChannelData<T>&&);              \
+  PREFIX BlockFunction<T> createBlockFunction<T>(pybind11::object&&);      \
+  PREFIX class ConvertedNdarray<T>;                                        \
+  }
+
+#ifdef BBMP_INTEROP_PREBUILT_CONVERSIONS
+#define BBMP_INTEROP_DECLARE_PREBUILT_CONVERSIONS(T) \
+  BBMP_INTEROP_CONVERSIONS_INSTANTIATION(extern template, T)
+BBMP_INTEROP_FOR_EACH_PREBUILT_TYPE(BBMP_INTEROP_DECLARE_PREBUILT_CONVERSIONS)
+#undef BBMP_INTEROP_DECLARE_PREBUILT_CONVERSIONS
+#endif
@@ -0,0 +1,218 @@
+/*
+ * Copyright (c) 2020 Attila Szarvas <attila.szarvas@gmail.com>
+ *
+ * All rights reserved. Use of this source code is governed the 3-Clause BSD
+ * License BSD-style license that can be found in the LICENSE file.
+ */
+
+/*
+ * Creates `OwnedChannelData<T>` referring to the samples of a raw file mapped
+ * into memory, so that large files can be processed without reading them
+ * first. Like `types.hpp`, this header doesn't depend on Python.
+ */
+
+#pragma once
+
+#include "types.hpp"
+
+#include <cerrno>
+#include <cstdint>
+#include <memory>
+#include <stdexcept>
+#include <string>
+#include <system_error>
+#include <type_traits>
+
+#ifdef _WIN32
+#ifndef NOMINMAX
+#define NOMINMAX
+#endif
+#ifndef WIN32_LEAN_AND_MEAN
+#define WIN32_LEAN_AND_MEAN
+#endif
+#include <windows.h>
+#else
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
+
+namespace bbmp {
+
+enum class MappingMode {
+  // The channels must not be written
+  read_only,
+  // The channels may be written, without modifying the file
+  copy_on_write
+};
+
+/*
+ * Layout of a file containing `num_channels` channels of samples stored one
+ * after the other, i.e. not interleaved, after a header of `header_bytes`
+ * bytes. A `length` of zero uses as many samples as the file contains.
+ */
+struct MappedFileLayout {
+  std::string path;
+  int num_channels = 1;
+  size_t header_bytes = 0;
+  size_t length = 0;
+  MappingMode mode = MappingMode::read_only;
+};
+
+/*
+ * A whole file mapped into memory, which is unmapped on destruction.
+ */
+class MappedFile {
+ public:
+  MappedFile(const std::string& path, const MappingMode mode) {
+#ifdef _WIN32
+    file_ = CreateFileA(path.c_str(), GENERIC_READ, FILE_SHARE_READ, nullptr,
+                        OPEN_EXISTING, FILE_ATTRIBUTE_NORMAL, nullptr);
+    if (file_ == INVALID_HANDLE_VALUE) {
+      throwLastError(path);
+    }
+    LARGE_INTEGER size;
+    if (!GetFileSizeEx(file_, &size)) {
+      throwLastError(path);
+    }
+    size_ = static_cast<size_t>(size.QuadPart);
+    if (size_ == 0) {
+      return;
+    }
+    mapping_ = CreateFileMappingA(
+        file_, nullptr,
+        mode == MappingMode::read_only ? PAGE_READONLY : PAGE_WRITECOPY, 0, 0,
+        nullptr);
+    if (mapping_ == nullptr) {
+      throwLastError(path);
+    }
+    data_ = MapViewOfFile(
+        mapping_,
+        mode == MappingMode::read_only ? FILE_MAP_READ : FILE_MAP_COPY, 0, 0,
+        0);
+    if (data_ == nullptr) {
+      throwLastError(path);
+    }
+#else
+    const auto fd = open(path.c_str(), O_RDONLY);
+    if (fd < 0) {
+      throw std::system_error(errno, std::generic_category(), path);
+    }
+    struct stat status;
+    if (fstat(fd, &status) != 0) {
+      const auto error = errno;
+      close(fd);
+      throw std::system_error(error, std::generic_category(), path);
+    }
+    size_ = static_cast<size_t>(status.st_size);
+    if (size_ > 0) {
+      const auto mapping = mmap(
+          nullptr, size_,
+          mode == MappingMode::read_only ? PROT_READ : PROT_READ | PROT_WRITE,
+          mode == MappingMode::read_only ? MAP_SHARED : MAP_PRIVATE, fd, 0);
+      const auto error = errno;
+      // The mapping keeps the file open
+      close(fd);
+      if (mapping == MAP_FAILED) {
+        throw std::system_error(error, std::generic_category(), path);
+      }
+      data_ = mapping;
+    } else {
+      close(fd);
+    }
+#endif
+  }
+
+  MappedFile(const MappedFile&) = delete;
+  MappedFile& operator=(const MappedFile&) = delete;
+
+  ~MappedFile() { release(); }
+
+  uint8_t* data() const noexcept { return static_cast<uint8_t*>(data_); }
+
+  size_t size() const noexcept { return size_; }
+
+ private:
+  // Frees whatever the constructor acquired so far
+  void release() noexcept {
+#ifdef _WIN32
+    if (data_ != nullptr) {
+      UnmapViewOfFile(data_);
+    }
+    if (mapping_ != nullptr) {
+      CloseHandle(mapping_);
+    }
+    if (file_ != INVALID_HANDLE_VALUE) {
+      CloseHandle(file_);
+    }
+#else
+    if (data_ != nullptr) {
+      munmap(data_, size_);
+    }
+#endif
+  }
+
+#ifdef _WIN32
+  [[noreturn]] void throwLastError(const std::string& path) {
+    const auto error = static_cast<int>(GetLastError());
+    release();
+    throw std::system_error(error, std::system_category(), path);
+  }
+
+  HANDLE file_ = INVALID_HANDLE_VALUE;
+  HANDLE mapping_ = nullptr;
+#endif
+  void* data_ = nullptr;
+  size_t size_ = 0;
+};
+
+/*
+ * Maps the file described by `layout`, and returns `OwnedChannelData<T>`
+ * referring to its channels, which owns the mapping. Nothing is read until the
+ * channels are accessed. Read-only mappings are marked `read_only()`.
+ */
+template <typename T>
+OwnedChannelData<T> createOwnedChannelData(const MappedFileLayout& layout) {
+  static_assert(std::is_arithmetic<T>::value,
+                "Mapped files must contain arithmetic samples");
+
+  if (layout.num_channels < 1) {
+    throw std::invalid_argument(layout.path +
+                                ": at least one channel is required");
+  }
+  if (layout.header_bytes % alignof(T) != 0) {
+    throw std::invalid_argument(layout.path + ": a header of " +
+                                std::to_string(layout.header_bytes) +
+                                " bytes misaligns the samples of " +
+                                std::to_string(sizeof(T)) + " bytes");
+  }
+
+  auto file = std::make_unique<MappedFile>(layout.path, layout.mode);
+  const auto num_channels = static_cast<size_t>(layout.num_channels);
+  const auto available =
+      file->size() > layout.header_bytes
+          ? (file->size() - layout.header_bytes) / sizeof(T) / num_channels
+          : 0;
+  const auto length = layout.length > 0 ? layout.length : available;
+  if (length > available) {
+    throw std::invalid_argument(
+        layout.path + ": " + std::to_string(layout.num_channels) +
+        " channels of " + std::to_string(length) +
+        " samples don't fit into the file, which has room for " +
+        std::to_string(available));
+  }
+
+  const auto data = reinterpret_cast<T*>(file->data() + layout.header_bytes);
+  auto get_ch_ptr = [data, length](const int num_ch) noexcept {
+    return data + num_ch * length;
+  };
+  OwnedChannelData<T> result(makeTypeErasedUniquePtr(file.release()),
+                             layout.num_channels, length,
+                             std::move(get_ch_ptr));
+  result.setReadOnly(layout.mode == MappingMode::read_only);
+  result.account(MemoryOrigin::mapped_file);
+  return result;
+}
+
+}  // namespace bbmp
@@ -7,14 +7,32 @@
 
 #pragma once
 
+#include <algorithm>
 #include <array>
+#include <atomic>
 #include <cassert>
+#include <cstddef>
+#include <cstdint>
 #include <functional>
 #include <limits>
 #include <memory>
+#include <mutex>
+#include <new>
 #include <type_traits>
+#include <unordered_map>
 #include <vector>
 
+/*
+ * Python modules are compiled with hidden visibility. The accessors of the
+ * process-wide singletons stay visible, so that a module and the shared
+ * libraries it links use the same instance.
+ */
+#if defined(_WIN32)
+#define BBMP_INTEROP_API
+#else
+#define BBMP_INTEROP_API __attribute__((visibility("default")))
+#endif
+
 namespace bbmp {
 
 inline int asserted_static_cast_int(size_t value) {
@@ -40,6 +58,236 @@ std::unique_ptr<T> moveOntoHeap(T&& obj) {
   return std::make_unique<T>(std::move(obj));
 }
 
+/*
+ * Where the buffer of an `OwnedChannelData` comes from.
+ */
+enum class MemoryOrigin : size_t {
+  ndarray = 0,
+  vector,
+  pool,
+  mapped_file,
+  count
+};
+
+/*
+ * Optional accounting of the live `OwnedChannelData` buffers, which can be
+ * retained indefinitely after an exported function returns. It tracks their
+ * count and bytes by origin and element type, and their high-water marks. It's
+ * disabled by default, and only buffers created while it's enabled are
+ * counted. The counters are updated without locking.
+ *
+ * A soft limit callback is called with the live bytes whenever an allocation
+ * makes them exceed the soft limit. It runs on the allocating thread.
+ */
+class MemoryAccounting {
+ public:
+  static constexpr size_t kNumOrigins =
+      static_cast<size_t>(MemoryOrigin::count);
+  static constexpr size_t kNumDtypes = 12;
+
+  struct Counters {
+    size_t count = 0;
+    size_t bytes = 0;
+    size_t peak_bytes = 0;
+  };
+
+  struct Stats {
+    Counters total;
+    // Indexed by `MemoryOrigin` and `dtypeIndex<T>()`
+    std::array<std::array<Counters, kNumDtypes>, kNumOrigins> by_origin;
+  };
+
+  using SoftLimitCallback = std::function<void(size_t live_bytes)>;
+
+  BBMP_INTEROP_API static MemoryAccounting& global() {
+    // Leaked, so that buffers destroyed during static destruction can still
+    // report their release
+    static auto accounting = new MemoryAccounting();
+    return *accounting;
+  }
+
+  static const char* originName(const size_t origin) noexcept {
+    static const char* names[] = {"ndarray", "vector", "pool", "mapped_file"};
+    return names[origin];
+  }
+
+  static const char* dtypeName(const size_t dtype) noexcept {
+    static const char* names[] = {"bool",   "int8",   "int16",   "int32",
+                                  "int64",  "uint8",  "uint16",  "uint32",
+                                  "uint64", "float32", "float64", "other"};
+    return names[dtype];
+  }
+
+  template <typename T>
+  static constexpr size_t dtypeIndex() noexcept {
+    return std::is_same<T, bool>::value ? 0
+           : std::is_floating_point<T>::value
+               ? (sizeof(T) == 4 ? 9 : sizeof(T) == 8 ? 10 : 11)
+           : std::is_integral<T>::value && sizeof(T) <= 8
+               ? (std::is_signed<T>::value ? 1 : 5) +
+                     (sizeof(T) == 1 ? 0
+                      : sizeof(T) == 2 ? 1
+                      : sizeof(T) == 4 ? 2
+                                       : 3)
+               : 11;
+  }
+
+  void setEnabled(const bool enabled) noexcept {
+    enabled_.store(enabled, std::memory_order_relaxed);
+  }
+
+  bool enabled() const noexcept {
+    return enabled_.load(std::memory_order_relaxed);
+  }
+
+  // A `soft_limit` of 0 disables the callback
+  void setSoftLimit(const size_t soft_limit, SoftLimitCallback callback) {
+    std::lock_guard<std::mutex> lock(callback_mutex_);
+    soft_limit_callback_ = std::move(callback);
+    soft_limit_.store(soft_limit, std::memory_order_relaxed);
+  }
+
+  size_t softLimit() const noexcept {
+    return soft_limit_.load(std::memory_order_relaxed);
+  }
+
+  Stats stats() const noexcept {
+    Stats stats;
+    load(total_, stats.total);
+    for (size_t origin = 0; origin < kNumOrigins; ++origin) {
+      for (size_t dtype = 0; dtype < kNumDtypes; ++dtype) {
+        load(by_origin_[origin][dtype], stats.by_origin[origin][dtype]);
+      }
+    }
+    return stats;
+  }
+
+  // Resets the high-water marks to the current live bytes
+  void resetPeaks() noexcept {
+    reset(total_);
+    for (auto& counters : by_origin_) {
+      for (auto& c : counters) {
+        reset(c);
+      }
+    }
+  }
+
+  void add(const size_t origin, const size_t dtype, const size_t bytes) {
+    add(by_origin_[origin][dtype], bytes);
+    const auto live_bytes = add(total_, bytes);
+
+    const auto soft_limit = softLimit();
+    if (soft_limit != 0 && live_bytes > soft_limit &&
+        live_bytes - bytes <= soft_limit) {
+      SoftLimitCallback callback;
+      {
+        std::lock_guard<std::mutex> lock(callback_mutex_);
+        callback = soft_limit_callback_;
+      }
+      if (callback) {
+        callback(live_bytes);
+      }
+    }
+  }
+
+  void remove(const size_t origin, const size_t dtype,
+              const size_t bytes) noexcept {
+    remove(by_origin_[origin][dtype], bytes);
+    remove(total_, bytes);
+  }
+
+ private:
+  struct AtomicCounters {
+    std::atomic<size_t> count{0};
+    std::atomic<size_t> bytes{0};
+    std::atomic<size_t> peak_bytes{0};
+  };
+
+  MemoryAccounting() = default;
+
+  static size_t add(AtomicCounters& counters, const size_t bytes) noexcept {
+    counters.count.fetch_add(1, std::memory_order_relaxed);
+    const auto live_bytes =
+        counters.bytes.fetch_add(bytes, std::memory_order_relaxed) + bytes;
+    auto peak_bytes = counters.peak_bytes.load(std::memory_order_relaxed);
+    while (live_bytes > peak_bytes &&
+           !counters.peak_bytes.compare_exchange_weak(
+               peak_bytes, live_bytes, std::memory_order_relaxed)) {
+    }
+    return live_bytes;
+  }
+
+  static void remove(AtomicCounters& counters, const size_t bytes) noexcept {
+    counters.count.fetch_sub(1, std::memory_order_relaxed);
+    counters.bytes.fetch_sub(bytes, std::memory_order_relaxed);
+  }
+
+  static void load(const AtomicCounters& counters, Counters& result) noexcept {
+    result.count = counters.count.load(std::memory_order_relaxed);
+    result.bytes = counters.bytes.load(std::memory_order_relaxed);
+    result.peak_bytes = counters.peak_bytes.load(std::memory_order_relaxed);
+  }
+
+  static void reset(AtomicCounters& counters) noexcept {
+    counters.peak_bytes.store(counters.bytes.load(std::memory_order_relaxed),
+                              std::memory_order_relaxed);
+  }
+
+  std::atomic<bool> enabled_{false};
+  std::atomic<size_t> soft_limit_{0};
+  std::mutex callback_mutex_;
+  SoftLimitCallback soft_limit_callback_;
+  AtomicCounters total_;
+  std::array<std::array<AtomicCounters, kNumDtypes>, kNumOrigins> by_origin_;
+};
+
+/*
+ * Removes the bytes of a buffer from the `MemoryAccounting` when destroyed.
+ * Moved-from tickets don't remove anything.
+ */
+class MemoryTicket {
+ public:
+  MemoryTicket() noexcept = default;
+
+  MemoryTicket(const MemoryOrigin origin, const size_t dtype,
+               const size_t bytes)
+      : origin_(static_cast<size_t>(origin)),
+        dtype_(dtype),
+        bytes_(bytes),
+        active_(true) {
+    MemoryAccounting::global().add(origin_, dtype_, bytes_);
+  }
+
+  MemoryTicket(MemoryTicket&& other) noexcept { *this = std::move(other); }
+
+  MemoryTicket& operator=(MemoryTicket&& other) noexcept {
+    if (this != &other) {
+      release();
+      origin_ = other.origin_;
+      dtype_ = other.dtype_;
+      bytes_ = other.bytes_;
+      active_ = other.active_;
+      other.active_ = false;
+    }
+    return *this;
+  }
+
+  ~MemoryTicket() { release(); }
+
+ private:
+  void release() noexcept {
+    if (active_) {
+      MemoryAccounting::global().remove(origin_, dtype_, bytes_);
+      active_ = false;
+    }
+  }
+
+  size_t origin_ = 0;
+  size_t dtype_ = 0;
+  size_t bytes_ = 0;
+  bool active_ = false;
+};
+
 template <typename T>
 class OwnedChannelData {
  public:
@@ -77,13 +325,111 @@ class OwnedChannelData {
 
   int num_channels() const noexcept { return num_channels_; }
 
+  // Whether the channels must not be written, e.g. because they refer to a
+  // read-only memory mapping. Returned ndarrays aren't writeable then.
+  bool read_only() const noexcept { return read_only_; }
+
+  void setReadOnly(const bool read_only) noexcept { read_only_ = read_only; }
+
+  // Counts the buffer in the `MemoryAccounting` until it's destroyed, if the
+  // accounting is enabled. Called by the functions creating owned buffers.
+  void account(const MemoryOrigin origin) {
+    if (MemoryAccounting::global().enabled()) {
+      ticket_ = MemoryTicket(origin, MemoryAccounting::dtypeIndex<T>(),
+                             num_channels_ * length_ * sizeof(T));
+    }
+  }
+
  private:
   int num_channels_;
   size_t length_;
   TypeErasedUniquePtr heap_object_;
   std::unique_ptr<T*[]> ptrs_;
+  MemoryTicket ticket_;
+  bool read_only_ = false;
+};
+
+/*
+ * Non-owning view of contiguous values. Exported functions can take
+ * `Span<const uint8_t>` for binary payloads, and `Span<const T>` or `Span<T>`
+ * for one-dimensional numeric buffers. The generated Python function accepts
+ * any object supporting the buffer protocol, e.g. `bytes` or a 1-D ndarray,
+ * and the span refers to its memory for the duration of the call.
+ */
+template <typename T>
+class Span {
+ public:
+  Span() noexcept = default;
+
+  Span(T* data, const size_t size) noexcept : data_(data), size_(size) {}
+
+  T* data() const noexcept { return data_; }
+
+  size_t size() const noexcept { return size_; }
+
+  bool empty() const noexcept { return size_ == 0; }
+
+  T& operator[](const size_t ix) const noexcept { return data_[ix]; }
+
+  T* begin() const noexcept { return data_; }
+
+  T* end() const noexcept { return data_ + size_; }
+
+ private:
+  T* data_ = nullptr;
+  size_t size_ = 0;
+};
+
+/*
+ * Callback of exported functions, that transforms a block of values per call,
+ * instead of a single value like `std::function<float(float)>`. The generated
+ * Python function takes a callable, which is called once per block with a
+ * read-only ndarray viewing the input values, and returns an array-like of the
+ * same size, e.g. `numpy.sin`. The ndarray must not be kept by the callable.
+ *
+ * Exported functions may also be called from C++ with any callable taking
+ * `(Span<const T> input, Span<T> output)`.
+ */
+template <typename T>
+class BlockFunction {
+ public:
+  using Function = std::function<void(Span<const T>, Span<T>)>;
+
+  BlockFunction() = default;
+
+  BlockFunction(Function function) : function_(std::move(function)) {}
+
+  // Transforms `input` into `output`, which may be the same values
+  void operator()(const Span<const T> input, const Span<T> output) const {
+    assert(input.size() == output.size());
+    function_(input, output);
+  }
+
+  // Transforms `input` into `output` with a call for every `block_size` values
+  void transform(const Span<const T> input, const Span<T> output,
+                 const size_t block_size) const {
+    assert(input.size() == output.size() && block_size > 0);
+    for (size_t offset = 0; offset < input.size(); offset += block_size) {
+      const auto size = std::min(block_size, input.size() - offset);
+      function_(Span<const T>(input.data() + offset, size),
+                Span<T>(output.data() + offset, size));
+    }
+  }
+
+  explicit operator bool() const noexcept { return bool(function_); }
+
+ private:
+  Function function_;
 };
 
+/*
+ * Marks output parameters of exported functions. The generated Python function
+ * takes them as an optional `out` keyword argument, and allocates an ndarray
+ * with the shape of the first `OwnedChannelData` argument if it's omitted.
+ */
+template <typename T>
+using OutChannelData = OwnedChannelData<T>;
+
 template <typename T>
 OwnedChannelData<T> createOwnedChannelData(
     std::vector<std::vector<T>>&& channelsData) {
@@ -94,9 +440,267 @@ OwnedChannelData<T> createOwnedChannelData(
   auto get_ch_ptr = [raw_ptr](const int num_ch) noexcept {
     return raw_ptr->at(num_ch).data();
   };
-  return OwnedChannelData<T>(std::move(heap_object),
+  OwnedChannelData<T> result(std::move(heap_object),
                              asserted_static_cast_int(raw_ptr->size()),
                              raw_ptr->at(0).size(), std::move(get_ch_ptr));
+  result.account(MemoryOrigin::vector);
+  return result;
+}
+
+/*
+ * Refers to `num_channels` consecutive channels of `length` values at `data`,
+ * without taking ownership of them. The caller must keep the memory alive as
+ * long as the returned object is used. The C ABI entry points use it for the
+ * raw pointers they are called with.
+ */
+template <typename T>
+OwnedChannelData<T> createBorrowedOwnedChannelData(T* data,
+                                                   const size_t num_channels,
+                                                   const size_t length) {
+  auto heap_object = TypeErasedUniquePtr(data, [](void*) {});
+  auto get_ch_ptr = [data, length](const int num_ch) noexcept {
+    return data + num_ch * length;
+  };
+  return OwnedChannelData<T>(std::move(heap_object),
+                             asserted_static_cast_int(num_channels), length,
+                             std::move(get_ch_ptr));
+}
+
+/*
+ * Recycles the memory of `OwnedChannelData` created by
+ * `createPooledOwnedChannelData`, for functions that create results of the
+ * same shape over and over again.
+ *
+ * Buffers are grouped into power of two size classes. A released buffer is
+ * kept for reuse, unless the cached bytes of its size class would exceed the
+ * high-water mark. With a non-zero `thread_cache_capacity` every thread also
+ * keeps up to that many buffers per size class, which it reuses without
+ * locking.
+ *
+ * The pool must outlive the buffers allocated from it.
+ */
+class BufferPool {
+ public:
+  struct Stats {
+    // Allocations served from cached buffers
+    size_t hits = 0;
+    // Allocations that had to allocate new memory
+    size_t misses = 0;
+    // Released buffers freed, because the size class was at its high-water mark
+    size_t discards = 0;
+    // Bytes in the buffers cached by the pool, excluding the thread caches
+    size_t cached_bytes = 0;
+  };
+
+  explicit BufferPool(const size_t high_water_mark = 64 * 1024 * 1024,
+                      const size_t thread_cache_capacity = 0)
+      : id_(nextId()),
+        high_water_mark_(high_water_mark),
+        thread_cache_capacity_(thread_cache_capacity) {}
+
+  BufferPool(const BufferPool&) = delete;
+  BufferPool& operator=(const BufferPool&) = delete;
+
+  ~BufferPool() { trim(); }
+
+  BBMP_INTEROP_API static BufferPool& global() {
+    // Never destroyed, because buffers may be released during static
+    // destruction
+    static auto pool = new BufferPool();
+    return *pool;
+  }
+
+  // Returns uninitialized memory of at least `bytes` size
+  void* allocate(const size_t bytes) {
+    const auto size_class = sizeClass(bytes);
+    void* buffer = nullptr;
+
+    if (size_class < kNumSizeClasses) {
+      auto cache = threadCache();
+      if (cache && !cache->at(size_class).empty()) {
+        buffer = cache->at(size_class).back();
+        cache->at(size_class).pop_back();
+      } else {
+        std::lock_guard<std::mutex> lock(mutex_);
+        auto& buffers = buffers_[size_class];
+        if (!buffers.empty()) {
+          buffer = buffers.back();
+          buffers.pop_back();
+          cached_bytes_ -= sizeClassBytes(size_class);
+        }
+      }
+    }
+
+    if (buffer != nullptr) {
+      hits_.fetch_add(1, std::memory_order_relaxed);
+    } else {
+      misses_.fetch_add(1, std::memory_order_relaxed);
+      buffer = ::operator new(size_class < kNumSizeClasses
+                                  ? sizeClassBytes(size_class)
+                                  : kHeaderSize + bytes);
+    }
+
+    auto header = static_cast<Header*>(buffer);
+    header->pool = this;
+    header->size_class = size_class;
+    return static_cast<char*>(buffer) + kHeaderSize;
+  }
+
+  // Returns memory obtained from `allocate` of any pool to that pool
+  static void release(void* data) {
+    auto header =
+        reinterpret_cast<Header*>(static_cast<char*>(data) - kHeaderSize);
+    header->pool->deallocate(header);
+  }
+
+  void setHighWaterMark(const size_t bytes) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    high_water_mark_ = bytes;
+  }
+
+  size_t highWaterMark() const {
+    std::lock_guard<std::mutex> lock(mutex_);
+    return high_water_mark_;
+  }
+
+  Stats stats() const {
+    Stats stats;
+    stats.hits = hits_.load(std::memory_order_relaxed);
+    stats.misses = misses_.load(std::memory_order_relaxed);
+    stats.discards = discards_.load(std::memory_order_relaxed);
+    std::lock_guard<std::mutex> lock(mutex_);
+    stats.cached_bytes = cached_bytes_;
+    return stats;
+  }
+
+  // Frees the buffers cached by the pool. Thread caches are freed when their
+  // threads exit.
+  void trim() {
+    std::lock_guard<std::mutex> lock(mutex_);
+    for (auto& buffers : buffers_) {
+      for (auto buffer : buffers) {
+        ::operator delete(buffer);
+      }
+      buffers.clear();
+    }
+    cached_bytes_ = 0;
+  }
+
+ private:
+  struct alignas(std::max_align_t) Header {
+    BufferPool* pool;
+    size_t size_class;
+  };
+
+  // The smallest size class holds 64 bytes including the header, the largest
+  // 64 GiB. Larger buffers aren't pooled.
+  static constexpr size_t kHeaderSize = sizeof(Header);
+  static constexpr size_t kMinSizeClassLog2 = 6;
+  static constexpr size_t kNumSizeClasses = 31;
+
+  using ThreadCache = std::array<std::vector<void*>, kNumSizeClasses>;
+
+  static uint64_t nextId() {
+    static std::atomic<uint64_t> next_id{0};
+    return next_id++;
+  }
+
+  static size_t sizeClass(const size_t bytes) {
+    size_t size_class = 0;
+    while (size_class < kNumSizeClasses &&
+           sizeClassBytes(size_class) < kHeaderSize + bytes) {
+      ++size_class;
+    }
+    return size_class;
+  }
+
+  static constexpr size_t sizeClassBytes(const size_t size_class) {
+    return size_t{1} << (kMinSizeClassLog2 + size_class);
+  }
+
+  ThreadCache* threadCache() {
+    if (thread_cache_capacity_ == 0) {
+      return nullptr;
+    }
+
+    struct ThreadCaches {
+      // Buffers are freed directly, because their pools may no longer exist
+      ~ThreadCaches() {
+        for (auto& id_and_cache : caches) {
+          for (auto& buffers : id_and_cache.second) {
+            for (auto buffer : buffers) {
+              ::operator delete(buffer);
+            }
+          }
+        }
+      }
+      std::unordered_map<uint64_t, ThreadCache> caches;
+    };
+    thread_local ThreadCaches thread_caches;
+    return &thread_caches.caches[id_];
+  }
+
+  void deallocate(Header* header) {
+    const auto size_class = header->size_class;
+    if (size_class >= kNumSizeClasses) {
+      ::operator delete(header);
+      return;
+    }
+
+    auto cache = threadCache();
+    if (cache && cache->at(size_class).size() < thread_cache_capacity_) {
+      cache->at(size_class).push_back(header);
+      return;
+    }
+
+    {
+      std::lock_guard<std::mutex> lock(mutex_);
+      if (cached_bytes_ + sizeClassBytes(size_class) <= high_water_mark_) {
+        buffers_[size_class].push_back(header);
+        cached_bytes_ += sizeClassBytes(size_class);
+        return;
+      }
+    }
+
+    discards_.fetch_add(1, std::memory_order_relaxed);
+    ::operator delete(header);
+  }
+
+  const uint64_t id_;
+  size_t high_water_mark_;
+  const size_t thread_cache_capacity_;
+
+  mutable std::mutex mutex_;
+  std::array<std::vector<void*>, kNumSizeClasses> buffers_;
+  size_t cached_bytes_ = 0;
+
+  std::atomic<size_t> hits_{0};
+  std::atomic<size_t> misses_{0};
+  std::atomic<size_t> discards_{0};
+};
+
+/*
+ * Creates channels of uninitialized values in a single buffer allocated from
+ * `pool`, to which the buffer is returned when the `OwnedChannelData` is
+ * destroyed.
+ */
+template <typename T>
+OwnedChannelData<T> createPooledOwnedChannelData(
+    const int num_channels, const size_t length,
+    BufferPool& pool = BufferPool::global()) {
+  static_assert(std::is_trivially_copyable<T>::value &&
+                    alignof(T) <= alignof(std::max_align_t),
+                "Pooled channels must have trivial types");
+  assert(num_channels > 0);
+  auto data = static_cast<T*>(pool.allocate(num_channels * length * sizeof(T)));
+  auto heap_object = TypeErasedUniquePtr(data, &BufferPool::release);
+  auto get_ch_ptr = [data, length](const int num_ch) noexcept {
+    return data + num_ch * length;
+  };
+  OwnedChannelData<T> result(std::move(heap_object), num_channels, length,
+                             std::move(get_ch_ptr));
+  result.account(MemoryOrigin::pool);
+  return result;
 }
 
 template <typename T>
@@ -16,23 +16,24 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 
-def run_in_shell(commands: List[Union[List[str], str]]):
+def run_in_shell(commands: List[Union[List[str], str]], log_prefix: str = ""):
     """
     str commands are not escaped automatically, so you get full control over it. Tokens of List[str]
     commands will be escaped when containing whitespace.
 
+    Can be called from multiple threads at once. `log_prefix` tells apart the logged output of parallel calls.
+
     :return: (return_code, output)
     """
-    output = ""
+    output_lines = []
 
     def shell_reader(process: subprocess.Popen):
         global logger
-        nonlocal output
 
         for line in iter(process.stdout.readline, b""):
             if line.strip():
-                output += line
-                logger.info(line.rstrip())
+                output_lines.append(line)
+                logger.info(f"{log_prefix}{line.rstrip()}")
 
             if len(line) == 0:
                 break
@@ -48,11 +49,13 @@ def run_in_shell(commands: List[Union[List[str], str]]):
         stderr=subprocess.STDOUT,
     )
 
-    def kill_at_exit():
+    def kill_at_exit(*args):
         process.kill()
 
-    signal.signal(signal.SIGTERM, kill_at_exit)
-    signal.signal(signal.SIGINT, kill_at_exit)
+    # Signal handlers can only be set from the main thread
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, kill_at_exit)
+        signal.signal(signal.SIGINT, kill_at_exit)
 
     t = threading.Thread(target=shell_reader, args=(process,))
 
@@ -60,7 +63,7 @@ def run_in_shell(commands: List[Union[List[str], str]]):
         if isinstance(cmd, list):
             cmd = [token if " " not in token else f'"{token}"' for token in cmd]
             cmd = " ".join(cmd)
-        logger.debug(f"run_in_shell: executing command: {cmd}")
+        logger.debug(f"{log_prefix}run_in_shell: executing command: {cmd}")
         process.stdin.write(cmd + "\n")
 
     if sys.platform == "win32":
@@ -79,6 +82,7 @@ def run_in_shell(commands: List[Union[List[str], str]]):
             pass
 
     t.join()
+    output = "".join(output_lines)
     assert return_code == 0, output
     return return_code, output
 
@@ -0,0 +1,127 @@
+'''
+Copyright (c) 2020 Attila Szarvas <attila.szarvas@gmail.com>
+
+All rights reserved. Use of this source code is governed the 3-Clause BSD
+License BSD-style license that can be found in the LICENSE file.
+
+Orchestrates the builds of the integration tests. The project is configured,
+built and installed once in a `SharedBuild`, which the scenarios only read
+from, and independent scenarios run in parallel on a `ScenarioRunner`. Each
+scenario still builds its own projects in its own temporary directories.
+
+The environment variables
+  BBMP_TEST_BUILD_JOBS      parallel jobs of each build and of ctest
+                            (default: number of CPUs)
+  BBMP_TEST_SCENARIO_JOBS   scenarios running at the same time (default: 2)
+  BBMP_TEST_CMAKE_ARGS      additional arguments of every configure step,
+                            e.g. -DPython_ROOT_DIR=...
+influence the orchestration.
+'''
+
+import concurrent.futures
+import logging
+import os
+import shlex
+import sys
+import tempfile
+import threading
+from typing import Callable, Dict, List, Optional
+
+import bbmp_subprocess
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+BUILD_JOBS = int(os.environ.get("BBMP_TEST_BUILD_JOBS", os.cpu_count() or 1))
+SCENARIO_JOBS = int(os.environ.get("BBMP_TEST_SCENARIO_JOBS", 2))
+CMAKE_ARGS = shlex.split(os.environ.get("BBMP_TEST_CMAKE_ARGS", ""))
+
+
+def configure_command(source_dir: str, build_dir: str, *cmake_args: str) -> List[str]:
+    return ["cmake", "-S", source_dir, "-B", build_dir, *cmake_args, *CMAKE_ARGS]
+
+
+def build_command(build_dir: str, target: Optional[str] = None) -> List[str]:
+    target_args = ["--target", target] if target is not None else []
+    return ["cmake", "--build", build_dir, *target_args, "--parallel", str(BUILD_JOBS)]
+
+
+class SharedBuild:
+    """
+    A build directory and an install prefix of a CMake project, which are configured, built and installed the first
+    time a scenario needs them, and then shared by all scenarios. Scenarios must not modify them.
+
+    :param shell_prefix: Commands setting up the environment of the shell, e.g. vcvarsall.bat on Windows.
+    """
+
+    def __init__(self, source_dir: str, shell_prefix: List[List[str]] = [], cmake_args: List[str] = []):
+        self.source_dir = source_dir
+        self.shell_prefix = [c for c in shell_prefix if c]
+        self.cmake_args = cmake_args
+        self._directory = tempfile.TemporaryDirectory()
+        self.build_dir = os.path.join(self._directory.name, "build")
+        self.install_prefix = os.path.join(self._directory.name, "install")
+        self._lock = threading.Lock()
+        self._installed = False
+
+    def run(self, commands: List[List[str]], log_prefix: str = ""):
+        """Runs `commands` in a shell set up by `shell_prefix`."""
+        bbmp_subprocess.run_in_shell(self.shell_prefix + commands, log_prefix)
+
+    def ensure_installed(self) -> str:
+        """Configures, builds and installs the project, unless it was already done. Returns the install prefix."""
+        with self._lock:
+            if not self._installed:
+                self.run(
+                    [
+                        configure_command(
+                            self.source_dir,
+                            self.build_dir,
+                            f"-DCMAKE_INSTALL_PREFIX={self.install_prefix}",
+                            *self.cmake_args,
+                        ),
+                        build_command(self.build_dir),
+                        build_command(self.build_dir, "install"),
+                    ],
+                    "[shared build] ",
+                )
+                self._installed = True
+        return self.install_prefix
+
+    def run_ctest(self, exclude: Optional[str] = None):
+        self.ensure_installed()
+        exclude_args = ["-E", exclude] if exclude is not None else []
+        self.run(
+            [
+                ["cd", "/d", self.build_dir] if sys.platform == "win32" else ["cd", self.build_dir],
+                ["ctest", "--output-on-failure", "-j", str(BUILD_JOBS), *exclude_args],
+            ],
+            "[ctest] ",
+        )
+
+    def cleanup(self):
+        self._directory.cleanup()
+
+
+class ScenarioRunner:
+    """
+    Runs independent scenarios on at most `max_workers` threads. The scenarios spend their time waiting for build
+    processes, so threads are sufficient. Test methods call `result` to wait for their scenario, which re-raises its
+    exception, so failures are still reported by the test that owns the scenario.
+    """
+
+    def __init__(self, max_workers: int = SCENARIO_JOBS):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._futures: Dict[str, concurrent.futures.Future] = {}
+
+    def submit(self, name: str, scenario: Callable[[], None]):
+        self._futures[name] = self._executor.submit(scenario)
+
+    def result(self, name: str):
+        return self._futures[name].result()
+
+    def shutdown(self):
+        for future in self._futures.values():
+            future.cancel()
+        self._executor.shutdown(wait=True)
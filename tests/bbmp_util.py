@@ -5,10 +5,12 @@ All rights reserved. Use of this source code is governed the 3-Clause BSD
 License BSD-style license that can be found in the LICENSE file.
 '''
 
+import atexit
+import concurrent.futures
 import json
 import logging
 import os
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -17,10 +19,98 @@ logger.setLevel(logging.DEBUG)
 find_file_cache: Dict[str, List[str]] = {}
 
 # Setting this variable to a path will allow the module to store previously found results in a cache saved to disk. So
-# even after unloading and reloading the module, finding the target will be very quick.
+# even after unloading and reloading the module, finding the target will be very quick. The cache also contains an
+# index of the searched directories, so searches not answered from the cache only list the directories modified since
+# the previous run.
 find_file_persistent_cache = None
 
 
+class DirectoryIndex:
+    """
+    Listings of directories along with the modification time of the directory. Adding, removing or renaming an entry
+    of a directory updates its modification time, so a listing is valid as long as the time didn't change, and only
+    modified directories are listed again.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.directories: Dict[str, Tuple[int, List[str], List[str]]] = {}
+        self.results: Dict[str, List[str]] = {}
+        self.dirty = False
+
+        if path is not None and os.path.isfile(path):
+            with open(path, "r") as index_file:
+                try:
+                    index = json.load(index_file)
+                    self.directories = index["directories"]
+                    self.results = index["results"]
+                    logger.debug(f"[find_file]: Loaded index file {path}")
+                except (ValueError, KeyError, TypeError):
+                    pass
+
+    def list_directory(self, dirpath: str) -> Tuple[List[str], List[str]]:
+        """
+        Returns the tuple(dirnames, filenames) of `dirpath`, like `os.walk`. Symbolic links to directories are not
+        returned, since `os.walk` doesn't descend into them either. Unreadable directories are empty.
+        """
+        try:
+            modification_time = os.stat(dirpath).st_mtime_ns
+        except OSError:
+            return [], []
+
+        listing = self.directories.get(dirpath)
+        if listing is not None and listing[0] == modification_time:
+            return listing[1], listing[2]
+
+        dirnames = []
+        filenames = []
+        try:
+            with os.scandir(dirpath) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            dirnames.append(entry.name)
+                        elif not entry.is_dir():
+                            filenames.append(entry.name)
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+
+        # Listings of removed subdirectories would never be used again
+        if listing is not None:
+            for removed in set(listing[1]) - set(dirnames):
+                self.directories.pop(os.path.join(dirpath, removed), None)
+
+        # Worker threads only ever write the listings of their own directories
+        self.directories[dirpath] = (modification_time, dirnames, filenames)
+        self.dirty = True
+        return dirnames, filenames
+
+    def save(self):
+        if self.path is None or not self.dirty:
+            return
+        with open(self.path, "w") as index_file:
+            json.dump({"directories": self.directories, "results": self.results}, index_file)
+        self.dirty = False
+
+
+_directory_indexes: Dict[Optional[str], DirectoryIndex] = {}
+
+
+def get_directory_index() -> DirectoryIndex:
+    """The index belonging to the current value of `find_file_persistent_cache`. It's only read from disk once."""
+    if find_file_persistent_cache not in _directory_indexes:
+        _directory_indexes[find_file_persistent_cache] = DirectoryIndex(find_file_persistent_cache)
+    return _directory_indexes[find_file_persistent_cache]
+
+
+@atexit.register
+def save_directory_indexes():
+    for index in _directory_indexes.values():
+        index.save()
+
+
 def get_most_recent_file(paths: List[str]) -> Union[str, None]:
     msg = ""
     if paths:
@@ -44,6 +134,27 @@ def get_most_recent_file(paths: List[str]) -> Union[str, None]:
 
 
 
+def _find_in_subtree(
+    index: DirectoryIndex, target: str, top: str, depth: int, search_constraint: List[str]
+) -> List[str]:
+    """
+    Walks `top`, which is `depth` levels below the root of the search. The subdirectories at depth `d` have to
+    contain `search_constraint[d]`.
+    """
+    result = []
+    stack = [(top, depth)]
+    while stack:
+        dirpath, depth = stack.pop()
+        dirnames, filenames = index.list_directory(dirpath)
+        if target in filenames:
+            result.append(os.path.abspath(os.path.join(dirpath, target)))
+        if depth < len(search_constraint):
+            dirnames = [d for d in dirnames if search_constraint[depth] in d]
+        # Reversed, so that directories are visited in the order of the listing
+        stack.extend((os.path.join(dirpath, d), depth + 1) for d in reversed(dirnames))
+    return result
+
+
 def find_file(
     target: str, root: str, search_constraint=[], cache_result=True,
 ) -> List[str]:
@@ -58,53 +169,42 @@ def find_file(
     :param cache_result:      If a result has been returned for a given set of parameters, the same result will be
                               returned, and the search will be omitted. Checks if the returned files are valid.
     :return: list of paths matching target filename
+
+    The top-level directories of `root` are searched in parallel. Directory listings are kept in an index, that's
+    also saved to `find_file_persistent_cache` if it's set, and only the directories modified since they were last
+    listed are listed again.
     """
-    if find_file_persistent_cache is not None:
-        if os.path.isfile(find_file_persistent_cache):
-            with open(find_file_persistent_cache, "r") as cache_file:
-                try:
-                    cache = json.load(cache_file)
-                    logger.debug(
-                        f"[find_file]: Loading values from cache file {find_file_persistent_cache}"
-                    )
-                    for k, v in cache.items():
-                        find_file_cache[k] = v
-                except:
-                    pass
+    index = get_directory_index()
+    find_file_cache.update(index.results)
+    cache_key = json.dumps([target, os.path.abspath(root), list(search_constraint)])
 
     if cache_result:
-        if target in find_file_cache.keys():
-            preferred = find_file_cache[target]
+        if cache_key in find_file_cache.keys():
+            preferred = find_file_cache[cache_key]
 
             if all([os.path.isfile(possible_match) for possible_match in preferred]):
                 logger.info(f"[find_file]: Returning cached result {preferred}")
                 return preferred
 
-    result = []
-    root_level = True
-    for dirpath, dirnames, filenames in os.walk(root):
-        if root_level:
-            dirnames[:] = [d for d in dirnames if "Recycle.Bin" not in d]
-            if search_constraint:
-                dirnames[:] = [d for d in dirnames if search_constraint[0] in d]
-        elif len(search_constraint) > (dirpath.count(os.path.sep)):
-            dirnames[:] = [
-                d
-                for d in dirnames
-                if search_constraint[dirpath.count(os.path.sep)] in d
-            ]
-        root_level = False
-
-        for filename in filenames:
-            if filename == target:
-                abspath = os.path.abspath(os.path.join(dirpath, filename))
-                result.append(abspath)
+    dirnames, filenames = index.list_directory(root)
+    result = [os.path.abspath(os.path.join(root, target))] if target in filenames else []
 
-    if cache_result and result:
-        find_file_cache[target] = result
+    dirnames = [d for d in dirnames if "Recycle.Bin" not in d]
+    if search_constraint:
+        dirnames = [d for d in dirnames if search_constraint[0] in d]
 
-        if find_file_persistent_cache is not None:
-            with open(find_file_persistent_cache, "w") as cache_file:
-                json.dump(find_file_cache, cache_file)
+    # Listing directories is mostly waiting for the file system, which doesn't hold the GIL
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        subtree_results = executor.map(
+            lambda d: _find_in_subtree(index, target, os.path.join(root, d), 1, search_constraint),
+            dirnames,
+        )
+        for subtree_result in subtree_results:
+            result += subtree_result
+
+    if cache_result and result:
+        find_file_cache[cache_key] = result
+        index.results[cache_key] = result
+        index.dirty = True
 
-    return result
\ No newline at end of file
+    return result
@@ -5,9 +5,17 @@
  * License BSD-style license that can be found in the LICENSE file.
  */
 
+#include "bbmp_interop/mapped_file.hpp"
 #include "bbmp_interop/types.hpp"
 
+#include <cstdint>
+#include <stdexcept>
+#include <string_view>
+#include <vector>
+
 #define EXPORT_TO_PYTHON
+#define EXPORT_TO_PYTHON_TYPES(...)
+#define EXPORT_TO_PYTHON_CONVERTING
 
 EXPORT_TO_PYTHON
 void multiplyValues(bbmp::OwnedChannelData<float> data,
@@ -23,6 +31,113 @@ std::string hello() {
   return "Hello from C++";
 }
 
+// Addresses of the singletons seen by the module, which links this library
+// statically
+EXPORT_TO_PYTHON
+std::vector<uint64_t> singletonAddresses() {
+  return {reinterpret_cast<uint64_t>(&bbmp::MemoryAccounting::global()),
+          reinterpret_cast<uint64_t>(&bbmp::BufferPool::global())};
+}
+
+// Returns the number of allocations served by recycled buffers
+EXPORT_TO_PYTHON
+size_t countPooledBufferReuses(const int iterations,
+                               const size_t high_water_mark,
+                               const size_t thread_cache_capacity) {
+  bbmp::BufferPool pool(high_water_mark, thread_cache_capacity);
+  for (int i = 0; i < iterations; ++i) {
+    auto data = bbmp::createPooledOwnedChannelData<float>(2, 1000, pool);
+    data.GetWriteChannelPtr(1)[999] = 1.0f;
+  }
+  return pool.stats().hits;
+}
+
+EXPORT_TO_PYTHON
+void scaleInto(const bbmp::OwnedChannelData<float>& data, const float factor,
+               bbmp::OutChannelData<float>& result) {
+  for (int chIx = 0; chIx < data.num_channels(); ++chIx) {
+    auto in = data.GetReadChannelPtr(chIx);
+    auto out = result.GetWriteChannelPtr(chIx);
+    for (size_t i = 0; i < data.length(); ++i) out[i] = factor * in[i];
+  }
+}
+
+EXPORT_TO_PYTHON
+std::vector<float> makeRamp(const size_t length) {
+  std::vector<float> ramp(length);
+  for (size_t i = 0; i < length; ++i) ramp[i] = static_cast<float>(i);
+  return ramp;
+}
+
+// Returns the sum of the bytes of the payload
+EXPORT_TO_PYTHON
+size_t sumBytes(bbmp::Span<const uint8_t> payload) {
+  size_t sum = 0;
+  for (const auto byte : payload) sum += byte;
+  return sum;
+}
+
+EXPORT_TO_PYTHON
+size_t countTrue(bbmp::Span<const bool> flags) {
+  size_t count = 0;
+  for (const auto flag : flags) count += flag ? 1 : 0;
+  return count;
+}
+
+EXPORT_TO_PYTHON
+void fillSpan(bbmp::Span<double> values, const double value) {
+  for (auto& v : values) v = value;
+}
+
+EXPORT_TO_PYTHON
+size_t countCharacter(std::string_view text, const char character) {
+  size_t count = 0;
+  for (const auto c : text) count += c == character ? 1 : 0;
+  return count;
+}
+
+// Transforms the channels in place, with a call for every block_size values
+EXPORT_TO_PYTHON
+void transformInBlocks(bbmp::OwnedChannelData<float>& data,
+                       const bbmp::BlockFunction<float>& function,
+                       const size_t block_size) {
+  for (int chIx = 0; chIx < data.num_channels(); ++chIx) {
+    const auto values = data.GetWriteChannelPtr(chIx);
+    function.transform(bbmp::Span<const float>(values, data.length()),
+                       bbmp::Span<float>(values, data.length()), block_size);
+  }
+}
+
+static std::vector<bbmp::OwnedChannelData<float>> retained_ndarrays;
+static std::vector<bbmp::OwnedChannelData<double>> retained_vectors;
+
+// Keeps the data after returning, until releaseRetained() is called
+EXPORT_TO_PYTHON
+void retain(bbmp::OwnedChannelData<float> data) {
+  retained_ndarrays.push_back(std::move(data));
+}
+
+EXPORT_TO_PYTHON
+void retainVectorChannels(const int num_channels, const size_t length) {
+  std::vector<std::vector<double>> channels(num_channels,
+                                            std::vector<double>(length));
+  retained_vectors.push_back(bbmp::createOwnedChannelData(std::move(channels)));
+}
+
+EXPORT_TO_PYTHON
+void releaseRetained() {
+  retained_ndarrays.clear();
+  retained_vectors.clear();
+}
+
+EXPORT_TO_PYTHON
+int checkedDivide(const int dividend, const int divisor) {
+  if (divisor == 0) {
+    throw std::invalid_argument("division by zero");
+  }
+  return dividend / divisor;
+}
+
 namespace test_namespace {
 EXPORT_TO_PYTHON
 void add_to_array(bbmp::OwnedChannelData<float>& data, const float number) {
@@ -32,3 +147,111 @@ void add_to_array(bbmp::OwnedChannelData<float>& data, const float number) {
   }
 }
 }  // namespace test_namespace
+
+EXPORT_TO_PYTHON_TYPES(float, double, int16_t)
+template <typename T>
+T addAndSum(bbmp::OwnedChannelData<T>& data, const T number) {
+  T sum = 0;
+  for (int chIx = 0; chIx < data.num_channels(); ++chIx) {
+    auto ptr = data.GetWriteChannelPtr(chIx);
+    for (size_t i = 0; i < data.length(); ++i) {
+      *(ptr + i) += number;
+      sum += *(ptr + i);
+    }
+  }
+  return sum;
+}
+
+// The module only declares the function template, so it has to be
+// instantiated for each exported type here.
+template float addAndSum<float>(bbmp::OwnedChannelData<float>&, const float);
+template double addAndSum<double>(bbmp::OwnedChannelData<double>&,
+                                  const double);
+template int16_t addAndSum<int16_t>(bbmp::OwnedChannelData<int16_t>&,
+                                    const int16_t);
+
+// Returns the sum of the negated values, which are also written into `out`
+EXPORT_TO_PYTHON_TYPES(float, double)
+template <typename T>
+T negateInto(const bbmp::OwnedChannelData<T>& data,
+             bbmp::OutChannelData<T>& out) {
+  T sum = 0;
+  for (int chIx = 0; chIx < data.num_channels(); ++chIx) {
+    auto in = data.GetReadChannelPtr(chIx);
+    auto result = out.GetWriteChannelPtr(chIx);
+    for (size_t i = 0; i < data.length(); ++i) {
+      result[i] = -in[i];
+      sum += result[i];
+    }
+  }
+  return sum;
+}
+
+template float negateInto<float>(const bbmp::OwnedChannelData<float>&,
+                                 bbmp::OutChannelData<float>&);
+template double negateInto<double>(const bbmp::OwnedChannelData<double>&,
+                                   bbmp::OutChannelData<double>&);
+
+// Transforms each channel in place with a single call
+EXPORT_TO_PYTHON_TYPES(float, double)
+template <typename T>
+void transformChannels(bbmp::OwnedChannelData<T>& data,
+                       bbmp::BlockFunction<T> function) {
+  for (int chIx = 0; chIx < data.num_channels(); ++chIx) {
+    const auto values = data.GetWriteChannelPtr(chIx);
+    function(bbmp::Span<const T>(values, data.length()),
+             bbmp::Span<T>(values, data.length()));
+  }
+}
+
+template void transformChannels<float>(bbmp::OwnedChannelData<float>&,
+                                       bbmp::BlockFunction<float>);
+template void transformChannels<double>(bbmp::OwnedChannelData<double>&,
+                                        bbmp::BlockFunction<double>);
+
+// Maps the planar channels stored after a header of `header_bytes` bytes
+EXPORT_TO_PYTHON
+bbmp::OwnedChannelData<float> mapFloatFile(const std::string& path,
+                                           const int num_channels,
+                                           const size_t header_bytes,
+                                           const bool copy_on_write) {
+  bbmp::MappedFileLayout layout;
+  layout.path = path;
+  layout.num_channels = num_channels;
+  layout.header_bytes = header_bytes;
+  layout.mode = copy_on_write ? bbmp::MappingMode::copy_on_write
+                              : bbmp::MappingMode::read_only;
+  return bbmp::createOwnedChannelData<float>(layout);
+}
+
+// Channels in separate vectors are copied into the returned ndarray
+EXPORT_TO_PYTHON
+bbmp::OwnedChannelData<int32_t> rampChannels(const int num_channels,
+                                             const int length) {
+  std::vector<std::vector<int32_t>> channels(num_channels);
+  for (int chIx = 0; chIx < num_channels; ++chIx) {
+    for (int i = 0; i < length; ++i) {
+      channels[chIx].push_back(chIx * length + i);
+    }
+  }
+  return bbmp::createOwnedChannelData(std::move(channels));
+}
+
+// Arguments of other dtypes are converted, and the scaled values copied back
+EXPORT_TO_PYTHON_CONVERTING
+void scaleConverting(bbmp::OwnedChannelData<float>& data, const float factor) {
+  for (int chIx = 0; chIx < data.num_channels(); ++chIx) {
+    auto values = data.GetWriteChannelPtr(chIx);
+    for (size_t i = 0; i < data.length(); ++i) values[i] *= factor;
+  }
+}
+
+EXPORT_TO_PYTHON_CONVERTING
+double sumConverting(const bbmp::OwnedChannelData<float>& data) {
+  double sum = 0;
+  for (int chIx = 0; chIx < data.num_channels(); ++chIx) {
+    auto values = data.GetReadChannelPtr(chIx);
+    for (size_t i = 0; i < data.length(); ++i) sum += values[i];
+  }
+  return sum;
+}
@@ -0,0 +1,84 @@
+'''
+Copyright (c) 2020 Attila Szarvas <attila.szarvas@gmail.com>
+
+All rights reserved. Use of this source code is governed the 3-Clause BSD
+License BSD-style license that can be found in the LICENSE file.
+'''
+
+import os
+import tempfile
+import unittest
+
+import bbmp_util as util
+
+
+class TestFindFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+        for subdirectory in [
+            ["Program Files", "Visual Studio", "VC"],
+            ["Program Files", "Tools"],
+            ["Tools", "Program Files", "Visual Studio"],
+            ["$Recycle.Bin"],
+        ]:
+            path = os.path.join(self.root, *subdirectory)
+            os.makedirs(path)
+            with open(os.path.join(path, "vcvarsall.bat"), "w"):
+                pass
+
+        self.index_path = os.path.join(self.root, "index.json")
+        util.find_file_persistent_cache = self.index_path
+        util.find_file_cache.clear()
+
+    def tearDown(self):
+        util._directory_indexes.clear()
+        util.find_file_persistent_cache = None
+        self.directory.cleanup()
+
+    def find(self, search_constraint=[]):
+        return sorted(
+            util.find_file("vcvarsall.bat", self.root, search_constraint, cache_result=False)
+        )
+
+    def test_finds_all_matches_except_recycle_bin(self):
+        self.assertEqual(3, len(self.find()))
+
+    def test_search_constraint_applies_from_root(self):
+        self.assertEqual(
+            [os.path.join(self.root, "Program Files", "Visual Studio", "VC", "vcvarsall.bat")],
+            self.find(["Progr", "Vis"]),
+        )
+
+    def test_only_modified_directories_listed_again(self):
+        self.find()
+        index = util.get_directory_index()
+        listed = []
+        list_directory = index.list_directory
+
+        def counting_list_directory(dirpath):
+            listing = index.directories.get(dirpath)
+            result = list_directory(dirpath)
+            if index.directories.get(dirpath) is not listing:
+                listed.append(dirpath)
+            return result
+
+        index.list_directory = counting_list_directory
+        new_directory = os.path.join(self.root, "Tools", "VC")
+        os.makedirs(new_directory)
+        with open(os.path.join(new_directory, "vcvarsall.bat"), "w"):
+            pass
+        os.utime(os.path.join(self.root, "Tools"), ns=(0, 0))
+
+        self.assertEqual(4, len(self.find()))
+        self.assertEqual(sorted([os.path.join(self.root, "Tools"), new_directory]), sorted(listed))
+
+    def test_index_persisted(self):
+        self.find()
+        util.save_directory_indexes()
+        util._directory_indexes.clear()
+        self.assertIn(self.root, util.get_directory_index().directories)
+
+
+if __name__ == "__main__":
+    unittest.main()
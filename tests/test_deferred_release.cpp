@@ -0,0 +1,38 @@
+/*
+ * Copyright (c) 2020 Attila Szarvas <attila.szarvas@gmail.com>
+ *
+ * All rights reserved. Use of this source code is governed the 3-Clause BSD
+ * License BSD-style license that can be found in the LICENSE file.
+ */
+
+#include "bbmp_interop/conversions.hpp"
+#include "bbmp_interop/types.hpp"
+
+#include <thread>
+
+#define EXPORT_TO_PYTHON
+
+// Destroys the data on a worker thread, while the calling thread holds the GIL,
+// or has released it if release_gil is set. Returns the number of references
+// the release added to the DeferredReleaseQueue. Pending calls only run while
+// the interpreter evaluates code on the main thread, so this can't be drained
+// in between, if called from the main thread.
+EXPORT_TO_PYTHON
+size_t releaseOnWorkerThread(bbmp::OwnedChannelData<float> data,
+                             const bool release_gil) {
+  auto& queue = bbmp::DeferredReleaseQueue::instance();
+  const auto num_pending = queue.num_pending();
+  std::thread worker([retained = std::move(data)]() mutable {
+    auto released = std::move(retained);
+  });
+  if (release_gil) {
+    pybind11::gil_scoped_release no_gil;
+    worker.join();
+  } else {
+    worker.join();
+  }
+  return queue.num_pending() - num_pending;
+}
+
+EXPORT_TO_PYTHON
+void drainDeferredReleases() { bbmp::DeferredReleaseQueue::instance().drain(); }
@@ -14,6 +14,7 @@ import tempfile
 import unittest
 
 import bbmp_subprocess
+import bbmp_test_build
 import bbmp_util as util
 
 logger = logging.getLogger(__name__)
@@ -44,66 +45,6 @@ if sys.platform == "win32":
     PLATFORM_SPECIFIC_CMAKE_PARAMETERS = ["-G", "NMake Makefiles"]
 
 
-def run_ctests():
-    with tempfile.TemporaryDirectory() as cmake_build_dir:
-        commands = [
-            VCVARSALL_COMMAND,
-            [
-                "cmake",
-                "-S",
-                PROJECT_DIR,
-                "-B",
-                cmake_build_dir,
-                *PLATFORM_SPECIFIC_CMAKE_PARAMETERS,  # selects generator on Windows
-            ],
-            [
-                "cmake",
-                "--build",
-                cmake_build_dir,
-                "--target",
-                "test",
-                "--",
-                'ARGS="--verbose"',
-            ],
-        ]
-        bbmp_subprocess.run_in_shell(commands)
-
-
-def install(build_dir, cmake_install_prefix):
-    commands = [
-        VCVARSALL_COMMAND,
-        [
-            "cmake",
-            "-S",
-            PROJECT_DIR,
-            "-B",
-            build_dir,
-            f"-DCMAKE_INSTALL_PREFIX={cmake_install_prefix}",
-            *PLATFORM_SPECIFIC_CMAKE_PARAMETERS,
-        ],
-        ["cmake", "--build", build_dir, "--target", "install"],
-    ]
-    bbmp_subprocess.run_in_shell(commands)
-
-
-def _run_ctests():
-    with tempfile.TemporaryDirectory() as cmake_build_dir:
-        bbmp_subprocess.run_in_shell(
-            [
-                ["cmake", "-S", PROJECT_DIR, "-B", cmake_build_dir,],
-                [
-                    "cmake",
-                    "--build",
-                    cmake_build_dir,
-                    "--target",
-                    "test",
-                    "--",
-                    'ARGS="--verbose"',
-                ],
-            ]
-        )
-
-
 TEST_CPP_CONTENT = """
 #include "bbmp_interop/types.hpp"
 
@@ -135,6 +76,32 @@ bbmp_add_python_module(pyhello LINK_LIBRARIES hello)
         file.write(TEST_CPP_CONTENT)
 
 
+def create_optimized_project_using_installed_bbmp_interop(source_dir):
+    test_CMakeLists_txt_content = """
+cmake_minimum_required(VERSION 3.15)
+
+project(import_bbmp_interop)
+
+find_package(bbmp_interop 0.1 REQUIRED)
+
+add_library(hello STATIC test.cpp)
+set_target_properties(hello PROPERTIES POSITION_INDEPENDENT_CODE ON)
+target_link_libraries(hello PRIVATE bbmp::bbmp_types)
+
+bbmp_add_python_module(pyhello LINK_LIBRARIES hello IPO PGO_TRAINING_SCRIPT
+                       train.py)
+"""
+
+    with open(os.path.join(source_dir, "CMakeLists.txt"), "w") as file:
+        file.write(test_CMakeLists_txt_content)
+
+    with open(os.path.join(source_dir, "test.cpp"), "w") as file:
+        file.write(TEST_CPP_CONTENT)
+
+    with open(os.path.join(source_dir, "train.py"), "w") as file:
+        file.write("import pyhello\nfor _ in range(1000):\n    pyhello.eight()\n")
+
+
 def create_project_using_subdirectory_bbmp_interop(source_dir):
     test_CMakeLists_txt_content = """
 cmake_minimum_required(VERSION 3.15)
@@ -156,89 +123,243 @@ bbmp_add_python_module(pyhello LINK_LIBRARIES hello)
         file.write(TEST_CPP_CONTENT)
 
 
+def create_prebuilt_library_project(source_dir):
+    test_CMakeLists_txt_content = """
+cmake_minimum_required(VERSION 3.15)
+
+project(hello_library)
+
+find_package(bbmp_interop 0.1 REQUIRED)
+
+add_library(hello STATIC test.cpp)
+set_target_properties(hello PROPERTIES POSITION_INDEPENDENT_CODE ON)
+target_link_libraries(hello PRIVATE bbmp::bbmp_types)
+
+install(TARGETS hello EXPORT hello-targets DESTINATION lib)
+install(EXPORT hello-targets NAMESPACE hello:: DESTINATION lib/cmake/hello)
+bbmp_add_export_manifest(hello INSTALL_DESTINATION lib/cmake/hello NAMESPACE
+                         hello::)
+
+file(
+  WRITE "${CMAKE_CURRENT_BINARY_DIR}/hello-config.cmake"
+  "include(\\"\\${CMAKE_CURRENT_LIST_DIR}/hello-targets.cmake\\")\\n"
+  "include(\\"\\${CMAKE_CURRENT_LIST_DIR}/hello-bbmp-exports.cmake\\")\\n")
+install(FILES "${CMAKE_CURRENT_BINARY_DIR}/hello-config.cmake"
+        DESTINATION lib/cmake/hello)
+"""
+
+    with open(os.path.join(source_dir, "CMakeLists.txt"), "w") as file:
+        file.write(test_CMakeLists_txt_content)
+
+    with open(os.path.join(source_dir, "test.cpp"), "w") as file:
+        file.write(TEST_CPP_CONTENT)
+
+
+def create_project_using_prebuilt_library(source_dir):
+    test_CMakeLists_txt_content = """
+cmake_minimum_required(VERSION 3.15)
+
+project(import_prebuilt_library)
+
+find_package(bbmp_interop 0.1 REQUIRED)
+find_package(hello REQUIRED)
+
+bbmp_add_python_module(pyhello LINK_LIBRARIES hello::hello)
+"""
+
+    with open(os.path.join(source_dir, "CMakeLists.txt"), "w") as file:
+        file.write(test_CMakeLists_txt_content)
+
+
 def as_posix(path):
     return pathlib.PurePath(path).as_posix()
 
 
-class TestUsage(unittest.TestCase):
-    def test_installed_library(self):
-        with tempfile.TemporaryDirectory() as bbmp_interop_build_dir:
-            with tempfile.TemporaryDirectory() as cmake_install_prefix:
-                install(bbmp_interop_build_dir, cmake_install_prefix)
-
-                with tempfile.TemporaryDirectory() as importing_lib_dir:
-                    create_project_using_installed_bbmp_interop(importing_lib_dir)
-                    build_dir = os.path.join(importing_lib_dir, "build")
-                    commands = [
-                        VCVARSALL_COMMAND,
-                        [
-                            "cmake",
-                            "-S",
-                            importing_lib_dir,
-                            "-B",
-                            build_dir,
-                            f"-DCMAKE_PREFIX_PATH={cmake_install_prefix}",
-                            *PLATFORM_SPECIFIC_CMAKE_PARAMETERS,
-                        ],
-                        ["cmake", "--build", build_dir],
-                    ]
-                    bbmp_subprocess.run_in_shell(commands)
-
-                    # We need to run this in a subprocess, because you can't unload a module (DLL), so if
-                    # this process loaded the extension, the TMP directories couldn't be cleaned up
-                    native_module_test_command = [
-                        sys.executable,
-                        "-c",
-                        f"import sys;sys.path.append('{as_posix(build_dir)}');import pyhello;assert pyhello.eight() == 8",
-                    ]
-                    bbmp_subprocess.run_in_shell([native_module_test_command])
+def check_module(build_dir, log_prefix):
+    # We need to run this in a subprocess, because you can't unload a module (DLL), so if
+    # this process loaded the extension, the TMP directories couldn't be cleaned up
+    native_module_test_command = [
+        sys.executable,
+        "-c",
+        f"import sys;sys.path.append('{as_posix(build_dir)}');import pyhello;assert pyhello.eight() == 8",
+    ]
+    bbmp_subprocess.run_in_shell([native_module_test_command], log_prefix)
 
-    def test_using_as_subdir(self):
-        with tempfile.TemporaryDirectory() as importing_lib_dir:
-            create_project_using_subdirectory_bbmp_interop(importing_lib_dir)
-            items_to_copy = [
-                os.path.join(PROJECT_DIR, "cmake"),
-                os.path.join(PROJECT_DIR, "extern"),
-                os.path.join(PROJECT_DIR, "src"),
-                os.path.join(PROJECT_DIR, "tests"),
-                os.path.join(PROJECT_DIR, ".clang-format"),
-                os.path.join(PROJECT_DIR, ".gitignore"),
-                os.path.join(PROJECT_DIR, "bbmp_interop-config.cmake.in"),
-                os.path.join(PROJECT_DIR, "CMakeLists.txt"),
-                os.path.join(PROJECT_DIR, "README.md"),
-            ]
-            subdir_path = os.path.join(importing_lib_dir, "extern", "bbmp_interop")
-            pathlib.Path(subdir_path).mkdir(parents=True, exist_ok=True)
-            for item in items_to_copy:
-                if os.path.isdir(item):
-                    shutil.copytree(
-                        item, os.path.join(subdir_path, pathlib.PurePath(item).name)
-                    )
-                else:
-                    shutil.copy2(item, subdir_path)
-            build_dir = os.path.join(importing_lib_dir, "build")
-            commands = [
-                VCVARSALL_COMMAND,
-                [
-                    "cmake",
-                    "-S",
+
+def installed_library_scenario(shared_build: bbmp_test_build.SharedBuild):
+    cmake_install_prefix = shared_build.ensure_installed()
+
+    with tempfile.TemporaryDirectory() as importing_lib_dir:
+        create_project_using_installed_bbmp_interop(importing_lib_dir)
+        build_dir = os.path.join(importing_lib_dir, "build")
+        shared_build.run(
+            [
+                bbmp_test_build.configure_command(
+                    importing_lib_dir,
+                    build_dir,
+                    f"-DCMAKE_PREFIX_PATH={cmake_install_prefix}",
+                    *PLATFORM_SPECIFIC_CMAKE_PARAMETERS,
+                ),
+                bbmp_test_build.build_command(build_dir),
+            ],
+            "[installed library] ",
+        )
+        check_module(build_dir, "[installed library] ")
+
+
+def optimized_module_scenario(shared_build: bbmp_test_build.SharedBuild):
+    cmake_install_prefix = shared_build.ensure_installed()
+
+    with tempfile.TemporaryDirectory() as importing_lib_dir:
+        create_optimized_project_using_installed_bbmp_interop(importing_lib_dir)
+        build_dir = os.path.join(importing_lib_dir, "build")
+        shared_build.run(
+            [
+                bbmp_test_build.configure_command(
                     importing_lib_dir,
-                    "-B",
                     build_dir,
+                    f"-DCMAKE_PREFIX_PATH={cmake_install_prefix}",
+                    "-DCMAKE_BUILD_TYPE=Release",
                     *PLATFORM_SPECIFIC_CMAKE_PARAMETERS,
+                ),
+                [
+                    sys.executable,
+                    os.path.join(cmake_install_prefix, "lib", "cmake", "bbmp_interop", "bbmp_pgo_build.py"),
+                    "--build_dir",
+                    build_dir,
                 ],
-                ["cmake", "--build", build_dir],
-            ]
-            bbmp_subprocess.run_in_shell(commands)
-
-            # We need to run this in a subprocess, because you can't unload a module (DLL), so if
-            # this process loaded the extension, the TMP directories couldn't be cleaned up
-            native_module_test_command = [
-                sys.executable,
-                "-c",
-                f"import sys;sys.path.append('{as_posix(build_dir)}');import pyhello;assert pyhello.eight() == 8",
-            ]
-            bbmp_subprocess.run_in_shell([native_module_test_command])
+            ],
+            "[optimized module] ",
+        )
+        check_module(build_dir, "[optimized module] ")
+        assert os.listdir(os.path.join(build_dir, "bbmp_pgo")), "no profile was recorded"
+
+
+def prebuilt_library_scenario(shared_build: bbmp_test_build.SharedBuild):
+    cmake_install_prefix = shared_build.ensure_installed()
+
+    with tempfile.TemporaryDirectory() as library_dir, tempfile.TemporaryDirectory() as importing_lib_dir:
+        library_build_dir = os.path.join(library_dir, "build")
+        library_install_prefix = os.path.join(library_dir, "install")
+        create_prebuilt_library_project(library_dir)
+        shared_build.run(
+            [
+                bbmp_test_build.configure_command(
+                    library_dir,
+                    library_build_dir,
+                    f"-DCMAKE_PREFIX_PATH={cmake_install_prefix}",
+                    f"-DCMAKE_INSTALL_PREFIX={library_install_prefix}",
+                    *PLATFORM_SPECIFIC_CMAKE_PARAMETERS,
+                ),
+                bbmp_test_build.build_command(library_build_dir, "install"),
+            ],
+            "[prebuilt library] ",
+        )
+        # The module must be generated from the installed export manifest alone
+        os.remove(os.path.join(library_dir, "test.cpp"))
+
+        create_project_using_prebuilt_library(importing_lib_dir)
+        build_dir = os.path.join(importing_lib_dir, "build")
+        shared_build.run(
+            [
+                bbmp_test_build.configure_command(
+                    importing_lib_dir,
+                    build_dir,
+                    f"-DCMAKE_PREFIX_PATH={cmake_install_prefix}",
+                    f"-Dhello_DIR={os.path.join(library_install_prefix, 'lib', 'cmake', 'hello')}",
+                    *PLATFORM_SPECIFIC_CMAKE_PARAMETERS,
+                ),
+                bbmp_test_build.build_command(build_dir),
+            ],
+            "[prebuilt library] ",
+        )
+        check_module(build_dir, "[prebuilt library] ")
+
+
+def subdirectory_scenario(shared_build: bbmp_test_build.SharedBuild):
+    with tempfile.TemporaryDirectory() as importing_lib_dir:
+        create_project_using_subdirectory_bbmp_interop(importing_lib_dir)
+        items_to_copy = [
+            os.path.join(PROJECT_DIR, "cmake"),
+            os.path.join(PROJECT_DIR, "extern"),
+            os.path.join(PROJECT_DIR, "src"),
+            os.path.join(PROJECT_DIR, "tests"),
+            os.path.join(PROJECT_DIR, ".clang-format"),
+            os.path.join(PROJECT_DIR, ".gitignore"),
+            os.path.join(PROJECT_DIR, "bbmp_interop-config.cmake.in"),
+            os.path.join(PROJECT_DIR, "CMakeLists.txt"),
+            os.path.join(PROJECT_DIR, "README.md"),
+        ]
+        subdir_path = os.path.join(importing_lib_dir, "extern", "bbmp_interop")
+        pathlib.Path(subdir_path).mkdir(parents=True, exist_ok=True)
+        for item in items_to_copy:
+            if os.path.isdir(item):
+                shutil.copytree(
+                    item, os.path.join(subdir_path, pathlib.PurePath(item).name)
+                )
+            else:
+                shutil.copy2(item, subdir_path)
+        build_dir = os.path.join(importing_lib_dir, "build")
+        shared_build.run(
+            [
+                bbmp_test_build.configure_command(
+                    importing_lib_dir, build_dir, *PLATFORM_SPECIFIC_CMAKE_PARAMETERS
+                ),
+                bbmp_test_build.build_command(build_dir),
+            ],
+            "[subdirectory] ",
+        )
+        check_module(build_dir, "[subdirectory] ")
+
+
+def ctest_scenario(shared_build: bbmp_test_build.SharedBuild):
+    # The excluded test runs this file
+    shared_build.run_ctest(exclude="including_the_library_test")
+
+
+class TestUsage(unittest.TestCase):
+    """
+    The scenarios are started together in `setUpClass`, and run in parallel. They share a single build and install
+    of this project, but build their own projects in separate temporary directories.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.shared_build = bbmp_test_build.SharedBuild(
+            PROJECT_DIR, [VCVARSALL_COMMAND], PLATFORM_SPECIFIC_CMAKE_PARAMETERS
+        )
+        cls.scenarios = bbmp_test_build.ScenarioRunner()
+        scenarios = [
+            ("installed_library", installed_library_scenario),
+            ("prebuilt_library", prebuilt_library_scenario),
+            ("subdirectory", subdirectory_scenario),
+            ("ctest", ctest_scenario),
+        ]
+        if sys.platform != "win32":
+            scenarios.append(("optimized_module", optimized_module_scenario))
+        for name, scenario in scenarios:
+            cls.scenarios.submit(name, lambda scenario=scenario: scenario(cls.shared_build))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.scenarios.shutdown()
+        cls.shared_build.cleanup()
+
+    def test_installed_library(self):
+        self.scenarios.result("installed_library")
+
+    def test_prebuilt_library(self):
+        self.scenarios.result("prebuilt_library")
+
+    def test_using_as_subdir(self):
+        self.scenarios.result("subdirectory")
+
+    @unittest.skipIf(sys.platform == "win32", "profile-guided optimization requires GCC or Clang")
+    def test_optimized_module(self):
+        self.scenarios.result("optimized_module")
+
+    def test_ctests(self):
+        self.scenarios.result("ctest")
 
 
 if __name__ == "__main__":
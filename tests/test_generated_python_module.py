@@ -5,15 +5,28 @@ All rights reserved. Use of this source code is governed the 3-Clause BSD
 License BSD-style license that can be found in the LICENSE file.
 '''
 
+import concurrent.futures
+import ctypes
 import inspect
 import logging
+import multiprocessing
 import os
 import pathlib
+import pickle
+import subprocess
 import sys
+import tempfile
+import time
+import types
 import unittest
 
 import numpy as np
 
+try:
+    import _xxsubinterpreters as subinterpreters
+except ImportError:
+    subinterpreters = None
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
@@ -50,6 +63,561 @@ class TestNumpyFunctions(unittest.TestCase):
         self.assertTrue(np.allclose(expected, actual))
 
 
+class TestDtypeConversion(unittest.TestCase):
+    def setUp(self):
+        pybbmp_interop_test._bbmp_dtype_conversions(reset=True)
+
+    def conversions(self):
+        return pybbmp_interop_test._bbmp_dtype_conversions()["conversions"]
+
+    def test_converted_values_copied_back(self):
+        data = np.arange(20, dtype=np.float64).reshape(2, 10)
+        pybbmp_interop_test.scaleConverting(data, 2.0)
+        self.assertEqual(np.float64, data.dtype)
+        self.assertTrue(np.array_equal(np.arange(20).reshape(2, 10) * 2, data))
+
+    def test_non_contiguous_argument_updated_in_place(self):
+        data = np.ones((4, 10), dtype=np.float32)
+        pybbmp_interop_test.scaleConverting(data[:, ::2], 3.0)
+        self.assertTrue(np.array_equal(np.tile([3, 1], (4, 5)), data))
+
+    def test_matching_argument_not_converted(self):
+        data = np.ones((2, 10), dtype=np.float32)
+        pybbmp_interop_test.scaleConverting(data, 2.0)
+        self.assertEqual(40, data.sum())
+        self.assertEqual([], self.conversions())
+
+    def test_conversions_counted(self):
+        for _ in range(3):
+            pybbmp_interop_test.scaleConverting(np.ones(10, dtype=np.int64), 2.0)
+        self.assertEqual(6, pybbmp_interop_test.sumConverting(np.array([1, 2, 3], dtype=np.int64)))
+        self.assertEqual(
+            [
+                {
+                    "function": "scaleConverting",
+                    "parameter": "data",
+                    "from": "int64",
+                    "to": "float32",
+                    "count": 3,
+                    "bytes": 120,
+                    "copy_backs": 3,
+                },
+                {
+                    "function": "sumConverting",
+                    "parameter": "data",
+                    "from": "int64",
+                    "to": "float32",
+                    "count": 1,
+                    "bytes": 12,
+                    "copy_backs": 0,
+                },
+            ],
+            self.conversions(),
+        )
+
+    def test_scratch_buffer_reused(self):
+        data = np.ones(1000, dtype=np.float64)
+        pybbmp_interop_test.sumConverting(data)
+        before = pybbmp_interop_test._bbmp_dtype_conversions()
+        for _ in range(10):
+            pybbmp_interop_test.sumConverting(data)
+        after = pybbmp_interop_test._bbmp_dtype_conversions()
+        self.assertEqual(before["scratch_misses"], after["scratch_misses"])
+        self.assertEqual(before["scratch_hits"] + 10, after["scratch_hits"])
+
+    def test_read_only_argument(self):
+        data = np.ones(10, dtype=np.float64)
+        data.flags.writeable = False
+        self.assertEqual(10, pybbmp_interop_test.sumConverting(data))
+        with self.assertRaises(ValueError):
+            pybbmp_interop_test.scaleConverting(data, 2.0)
+
+
+class TestDeferredRelease(unittest.TestCase):
+    def assert_released_after_drain(self, release_gil):
+        data = np.ones((2, 5), dtype=np.float32)
+        reference_count = sys.getrefcount(data)
+        self.assertEqual(1, pybbmp_interop_test.releaseOnWorkerThread(data, release_gil))
+        pybbmp_interop_test.drainDeferredReleases()
+        self.assertEqual(reference_count, sys.getrefcount(data))
+
+    def test_release_while_caller_holds_gil_is_deferred(self):
+        self.assert_released_after_drain(False)
+
+    def test_release_while_caller_released_gil_is_deferred(self):
+        self.assert_released_after_drain(True)
+
+    def test_reference_released_by_pending_call(self):
+        data = np.ones((2, 5), dtype=np.float32)
+        reference_count = sys.getrefcount(data)
+        for _ in range(100):
+            pybbmp_interop_test.releaseOnWorkerThread(data, False)
+        # The queued references are released by a pending call, which the
+        # interpreter runs on the main thread, e.g. when it takes the GIL back
+        for _ in range(100):
+            if sys.getrefcount(data) == reference_count:
+                break
+            time.sleep(0.01)
+        self.assertEqual(reference_count, sys.getrefcount(data))
+
+
+class TestSharedLibrary(unittest.TestCase):
+    def test_singletons_shared_with_linked_shared_library(self):
+        self.assertEqual(
+            pybbmp_interop_test.singletonAddresses().tolist(),
+            pybbmp_interop_test.sharedLibrarySingletonAddresses().tolist(),
+        )
+
+
+class TestBufferPool(unittest.TestCase):
+    def test_buffers_reused(self):
+        self.assertEqual(9, pybbmp_interop_test.countPooledBufferReuses(10, 1 << 20, 0))
+
+    def test_buffers_above_high_water_mark_freed(self):
+        self.assertEqual(0, pybbmp_interop_test.countPooledBufferReuses(10, 0, 0))
+
+    def test_thread_cache(self):
+        self.assertEqual(9, pybbmp_interop_test.countPooledBufferReuses(10, 0, 1))
+
+
+class TestOutParameters(unittest.TestCase):
+    def test_result_allocated_without_out(self):
+        data = np.ones((2, 5), dtype=np.float32)
+        result = pybbmp_interop_test.scaleInto(data, 3.0)
+        self.assertTrue(np.array_equal(np.full((2, 5), 3.0, dtype=np.float32), result))
+
+    def test_result_written_into_out(self):
+        data = np.ones((2, 5), dtype=np.float32)
+        out = np.zeros((2, 5), dtype=np.float32)
+        result = pybbmp_interop_test.scaleInto(data, 3.0, out=out)
+        self.assertIs(out, result)
+        self.assertTrue(np.array_equal(np.full((2, 5), 3.0), out))
+
+    def test_out_with_wrong_shape_raises_value_error(self):
+        data = np.ones((2, 5), dtype=np.float32)
+        with self.assertRaises(ValueError):
+            pybbmp_interop_test.scaleInto(data, 3.0, out=np.zeros((5, 2), dtype=np.float32))
+
+    def test_out_with_wrong_dtype_raises_type_error(self):
+        data = np.ones((2, 5), dtype=np.float32)
+        with self.assertRaises(TypeError):
+            pybbmp_interop_test.scaleInto(data, 3.0, out=np.zeros((2, 5)))
+
+    def test_dispatched_function_returns_result_and_out(self):
+        data = np.ones((2, 5), dtype=np.float64)
+        out = np.zeros((2, 5), dtype=np.float64)
+        result, returned_out = pybbmp_interop_test.negateInto(data, out=out)
+        self.assertEqual(-10, result)
+        self.assertIs(out, returned_out)
+        self.assertTrue(np.array_equal(-data, out))
+
+        _, allocated_out = pybbmp_interop_test.negateInto(data.astype(np.float32))
+        self.assertEqual(np.float32, allocated_out.dtype)
+
+
+class TestVectorReturn(unittest.TestCase):
+    def test_vector_returned_as_ndarray(self):
+        ramp = pybbmp_interop_test.makeRamp(5)
+        self.assertIsInstance(ramp, np.ndarray)
+        self.assertEqual(np.float32, ramp.dtype)
+        self.assertTrue(np.array_equal(np.arange(5), ramp))
+
+    def test_ndarray_owns_vector(self):
+        ramp = pybbmp_interop_test.makeRamp(1000)
+        self.assertFalse(ramp.flags.owndata)
+        self.assertIsNotNone(ramp.base)
+        ramp[:] = 1
+        self.assertEqual(1000, ramp.sum())
+
+    def test_empty_vector(self):
+        self.assertEqual((0,), pybbmp_interop_test.makeRamp(0).shape)
+
+
+class TestMappedFile(unittest.TestCase):
+    HEADER = b"BBMP\0\0\0\0"
+
+    def setUp(self):
+        self.samples = np.arange(3000, dtype=np.float32).reshape(3, 1000)
+        handle, self.path = tempfile.mkstemp()
+        with os.fdopen(handle, "wb") as f:
+            f.write(self.HEADER)
+            f.write(self.samples.tobytes())
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_channels_after_header(self):
+        mapped = pybbmp_interop_test.mapFloatFile(self.path, 3, len(self.HEADER), False)
+        self.assertEqual((3, 1000), mapped.shape)
+        self.assertTrue(np.array_equal(self.samples, mapped))
+
+    def test_read_only_mapping_not_writeable(self):
+        mapped = pybbmp_interop_test.mapFloatFile(self.path, 3, len(self.HEADER), False)
+        self.assertFalse(mapped.flags.writeable)
+        with self.assertRaises(ValueError):
+            mapped[0, 0] = 1
+
+    def test_copy_on_write_leaves_file_unchanged(self):
+        mapped = pybbmp_interop_test.mapFloatFile(self.path, 3, len(self.HEADER), True)
+        mapped[:] = -1
+        self.assertEqual(-3000, mapped.sum())
+        with open(self.path, "rb") as f:
+            self.assertEqual(self.HEADER + self.samples.tobytes(), f.read())
+
+    def test_view_keeps_mapping_alive(self):
+        channel = pybbmp_interop_test.mapFloatFile(self.path, 3, len(self.HEADER), False)[2]
+        self.assertTrue(np.array_equal(self.samples[2], channel))
+
+    def test_trailing_samples_ignored(self):
+        mapped = pybbmp_interop_test.mapFloatFile(self.path, 7, len(self.HEADER), False)
+        self.assertEqual((7, 428), mapped.shape)
+
+    def test_counted_as_mapped_file(self):
+        def mapped_bytes():
+            by_origin = pybbmp_interop_test._bbmp_memory_stats()["by_origin"]
+            return by_origin.get("mapped_file", {}).get("float32", {"bytes": 0})["bytes"]
+
+        before = mapped_bytes()
+        mapped = pybbmp_interop_test.mapFloatFile(self.path, 3, len(self.HEADER), False)
+        self.assertEqual(before + 12000, mapped_bytes())
+        del mapped
+        self.assertEqual(before, mapped_bytes())
+
+    def test_invalid_layouts(self):
+        with self.assertRaises(ValueError):
+            pybbmp_interop_test.mapFloatFile(self.path, 0, 0, False)
+        with self.assertRaises(ValueError):
+            pybbmp_interop_test.mapFloatFile(self.path, 1, 2, False)
+        with self.assertRaises(RuntimeError):
+            pybbmp_interop_test.mapFloatFile(self.path + ".missing", 1, 0, False)
+
+    def test_separate_channels_copied(self):
+        ramp = pybbmp_interop_test.rampChannels(2, 5)
+        self.assertEqual(np.int32, ramp.dtype)
+        self.assertTrue(np.array_equal(np.arange(10).reshape(2, 5), ramp))
+        self.assertTrue(ramp.flags.writeable)
+
+
+class TestBlockFunction(unittest.TestCase):
+    def test_called_once_per_block(self):
+        data = np.ones((2, 1000), dtype=np.float32)
+        block_sizes = []
+
+        def double(block):
+            block_sizes.append(len(block))
+            return block * 2
+
+        pybbmp_interop_test.transformInBlocks(data, double, 256)
+        self.assertEqual([256, 256, 256, 232] * 2, block_sizes)
+        self.assertTrue(np.array_equal(np.full((2, 1000), 2, dtype=np.float32), data))
+
+    def test_block_is_read_only_view(self):
+        data = np.arange(10, dtype=np.float32)
+
+        def check_block(block):
+            self.assertEqual(np.float32, block.dtype)
+            self.assertFalse(block.flags.writeable)
+            with self.assertRaises(ValueError):
+                block[0] = 1
+            return block
+
+        pybbmp_interop_test.transformInBlocks(data, check_block, 4)
+        self.assertTrue(np.array_equal(np.arange(10, dtype=np.float32), data))
+
+    def test_result_converted(self):
+        data = np.zeros(3, dtype=np.float32)
+        pybbmp_interop_test.transformInBlocks(data, lambda block: [1, 2, 3], 3)
+        self.assertEqual([1, 2, 3], data.tolist())
+
+    def test_errors(self):
+        data = np.zeros(3, dtype=np.float32)
+        with self.assertRaises(ValueError):
+            pybbmp_interop_test.transformInBlocks(data, lambda block: block[:-1], 3)
+        kept = []
+        with self.assertRaises(ValueError):
+            pybbmp_interop_test.transformInBlocks(data, lambda block: kept.append(block) or block, 3)
+        with self.assertRaises(TypeError):
+            pybbmp_interop_test.transformInBlocks(data, 1.0, 3)
+
+        def raise_key_error(block):
+            raise KeyError("block")
+
+        with self.assertRaises(KeyError):
+            pybbmp_interop_test.transformInBlocks(data, raise_key_error, 3)
+
+    def test_dtype_dispatch(self):
+        data = np.full((2, 5), 4.0, dtype=np.float64)
+        pybbmp_interop_test.transformChannels(data, np.sqrt)
+        self.assertTrue(np.array_equal(np.full((2, 5), 2.0), data))
+
+
+class TestViewParameters(unittest.TestCase):
+    def test_byte_span_accepts_buffers(self):
+        for payload in [b"\x01\x02\x03", bytearray(b"\x01\x02\x03"), memoryview(b"\x00\x01\x02\x03")[1:]]:
+            self.assertEqual(6, pybbmp_interop_test.sumBytes(payload))
+
+    def test_typed_span_writes_into_ndarray(self):
+        values = np.zeros(4)
+        pybbmp_interop_test.fillSpan(values, 2.5)
+        self.assertTrue(np.array_equal(np.full(4, 2.5), values))
+
+    def test_typed_span_rejects_wrong_format(self):
+        with self.assertRaises(TypeError):
+            pybbmp_interop_test.fillSpan(np.zeros(4, dtype=np.float32), 2.5)
+
+    def test_bool_span_requires_bool_format(self):
+        self.assertEqual(2, pybbmp_interop_test.countTrue(np.array([True, False, True])))
+        for flags in [b"\x01\x02", np.ones(2, dtype=np.uint8)]:
+            with self.assertRaises(TypeError):
+                pybbmp_interop_test.countTrue(flags)
+
+    def test_writable_span_rejects_bytes(self):
+        with self.assertRaises(BufferError):
+            pybbmp_interop_test.fillSpan(b"\x00" * 8, 2.5)
+
+    def test_string_view_accepts_str_and_bytes(self):
+        self.assertEqual(2, pybbmp_interop_test.countCharacter("a,b,c", ","))
+        self.assertEqual(2, pybbmp_interop_test.countCharacter(b"a,b,c", ","))
+
+
+class TestCAbi(unittest.TestCase):
+    def get_function(self, name, restype, *argtypes):
+        address, _ = pybbmp_interop_test.__bbmp_c_abi__[name]
+        return ctypes.CFUNCTYPE(restype, *argtypes)(address)
+
+    def test_table_lists_supported_functions(self):
+        table = pybbmp_interop_test.__bbmp_c_abi__
+        self.assertEqual(
+            "void (*)(float*, size_t, size_t, float, float*, size_t, size_t)",
+            table["scaleInto"][1],
+        )
+        self.assertIn("test_namespace__add_to_array", table)
+        self.assertNotIn("hello", table)
+        self.assertNotIn("addAndSum", table)
+
+    def test_call_with_raw_pointers(self):
+        float_pointer = ctypes.POINTER(ctypes.c_float)
+        scale_into = self.get_function(
+            "scaleInto", None, float_pointer, ctypes.c_size_t, ctypes.c_size_t,
+            ctypes.c_float, float_pointer, ctypes.c_size_t, ctypes.c_size_t,
+        )
+        data = np.arange(6, dtype=np.float32).reshape(2, 3)
+        out = np.zeros_like(data)
+        scale_into(
+            data.ctypes.data_as(float_pointer), 2, 3, 2.0,
+            out.ctypes.data_as(float_pointer), 2, 3,
+        )
+        self.assertTrue(np.array_equal(2 * data, out))
+
+        count_character = self.get_function(
+            "countCharacter", ctypes.c_size_t, ctypes.c_char_p, ctypes.c_size_t, ctypes.c_char
+        )
+        self.assertEqual(2, count_character(b"a,b,c", 5, b","))
+
+        address, _ = pybbmp_interop_test.__bbmp_c_abi_last_error__
+        last_error = ctypes.CFUNCTYPE(ctypes.c_char_p)(address)
+        self.assertIsNone(last_error())
+
+
+class TestFastcall(unittest.TestCase):
+    def test_replaces_pybind11_function(self):
+        # The pybind11 function is kept for the calls the fast path doesn't handle
+        self.assertIsInstance(pybbmp_interop_test.checkedDivide.__self__, types.BuiltinFunctionType)
+        self.assertEqual("checkedDivide", pybbmp_interop_test.checkedDivide.__name__)
+        self.assertIn("checkedDivide(", pybbmp_interop_test.checkedDivide.__doc__)
+
+    def test_same_behavior_as_pybind11_function(self):
+        fast = pybbmp_interop_test.checkedDivide
+        fallback = fast.__self__
+        for args, kwargs in [((7, 2), {}), ((7,), {"divisor": 2}), ((np.int64(9), 3), {})]:
+            self.assertEqual(fallback(*args, **kwargs), fast(*args, **kwargs))
+        for args, exception in [((7, 0), ValueError), ((7.0, 2), TypeError), ((2 ** 40, 2), TypeError), ((7,), TypeError)]:
+            with self.assertRaises(exception) as fallback_error:
+                fallback(*args)
+            with self.assertRaises(exception) as fast_error:
+                fast(*args)
+            self.assertEqual(str(fallback_error.exception), str(fast_error.exception))
+
+    def test_string_return(self):
+        self.assertIsInstance(pybbmp_interop_test.hello.__self__, types.BuiltinFunctionType)
+        self.assertEqual("Hello from C++", pybbmp_interop_test.hello())
+
+
+class TestMemoryAccounting(unittest.TestCase):
+    def tearDown(self):
+        pybbmp_interop_test.releaseRetained()
+        pybbmp_interop_test._bbmp_configure_memory_accounting()
+
+    def get_counters(self, origin, dtype):
+        by_dtype = pybbmp_interop_test._bbmp_memory_stats()["by_origin"].get(origin, {})
+        return by_dtype.get(dtype, {"count": 0, "bytes": 0, "peak_bytes": 0})
+
+    def test_retained_buffers_counted_by_origin_and_dtype(self):
+        self.assertTrue(pybbmp_interop_test._bbmp_memory_stats()["enabled"])
+        ndarrays = self.get_counters("ndarray", "float32")
+        vectors = self.get_counters("vector", "float64")
+        total = pybbmp_interop_test._bbmp_memory_stats()["bytes"]
+
+        pybbmp_interop_test.retain(np.ones((2, 1000), dtype=np.float32))
+        pybbmp_interop_test.retainVectorChannels(3, 100)
+
+        self.assertEqual(ndarrays["count"] + 1, self.get_counters("ndarray", "float32")["count"])
+        self.assertEqual(ndarrays["bytes"] + 8000, self.get_counters("ndarray", "float32")["bytes"])
+        self.assertEqual(vectors["bytes"] + 2400, self.get_counters("vector", "float64")["bytes"])
+        self.assertEqual(total + 10400, pybbmp_interop_test._bbmp_memory_stats()["bytes"])
+
+        pybbmp_interop_test.releaseRetained()
+        self.assertEqual(vectors["bytes"], self.get_counters("vector", "float64")["bytes"])
+        self.assertLessEqual(vectors["bytes"] + 2400, self.get_counters("vector", "float64")["peak_bytes"])
+
+    def test_soft_limit_callback(self):
+        live_bytes = []
+        soft_limit = pybbmp_interop_test._bbmp_memory_stats()["bytes"] + 1000
+        pybbmp_interop_test._bbmp_configure_memory_accounting(
+            soft_limit=soft_limit, callback=live_bytes.append
+        )
+
+        pybbmp_interop_test.retain(np.ones(100, dtype=np.float32))
+        self.assertEqual([], live_bytes)
+        pybbmp_interop_test.retain(np.ones(1000, dtype=np.float32))
+        self.assertEqual([soft_limit - 1000 + 4400], live_bytes)
+        pybbmp_interop_test.retain(np.ones(10, dtype=np.float32))
+        self.assertEqual(1, len(live_bytes))
+
+
+@unittest.skipIf(subinterpreters is None, "requires the _xxsubinterpreters module of Python 3.8 to 3.12")
+class TestSubinterpreters(unittest.TestCase):
+    # NumPy can't be imported in more than one interpreter, so the kernels
+    # running in the sub-interpreters don't convert ndarrays
+    KERNELS = """
+import sys
+sys.path.insert(0, {module_directory!r})
+import pybbmp_interop_test
+for i in range(1000):
+    assert pybbmp_interop_test.checkedDivide(9 * i, 3) == 3 * i
+    assert pybbmp_interop_test.sumBytes(bytes([i % 256, 1])) == i % 256 + 1
+    assert pybbmp_interop_test.countCharacter("a,b,c", ",") == 2
+try:
+    pybbmp_interop_test.checkedDivide(1, 0)
+    raise AssertionError("ValueError not raised")
+except ValueError:
+    pass
+try:
+    pybbmp_interop_test._bbmp_configure_memory_accounting(callback=print)
+    raise AssertionError("RuntimeError not raised")
+except RuntimeError:
+    pass
+"""
+
+    def run_in_subinterpreters(self, script, count):
+        script = script.format(module_directory=os.path.dirname(pybbmp_interop_test.__file__))
+        interpreters = [subinterpreters.create() for _ in range(count)]
+        try:
+            with concurrent.futures.ThreadPoolExecutor(count) as executor:
+                for future in [executor.submit(subinterpreters.run_string, i, script) for i in interpreters]:
+                    future.result()
+        finally:
+            for interpreter in interpreters:
+                subinterpreters.destroy(interpreter)
+
+    def test_kernels_run_concurrently_in_subinterpreters(self):
+        self.run_in_subinterpreters(self.KERNELS, 4)
+        self.assertEqual(3, pybbmp_interop_test.checkedDivide(9, 3))
+
+    def test_names_and_docstrings_outlive_subinterpreters(self):
+        # MALLOC_PERTURB_ overwrites freed memory, so reading anything freed
+        # with a sub-interpreter fails
+        script = """
+import sys
+sys.path.insert(0, {module_directory!r})
+import _xxsubinterpreters as subinterpreters
+import pybbmp_interop_test
+for _ in range(3):
+    interpreter = subinterpreters.create()
+    subinterpreters.run_string(
+        interpreter, "import sys; sys.path.insert(0, {module_directory!r}); import pybbmp_interop_test"
+    )
+    subinterpreters.destroy(interpreter)
+assert pybbmp_interop_test.checkedDivide.__name__ == "checkedDivide"
+assert "checkedDivide(" in pybbmp_interop_test.checkedDivide.__doc__
+""".format(module_directory=os.path.dirname(pybbmp_interop_test.__file__))
+        subprocess.run(
+            [sys.executable, "-c", script], env=dict(os.environ, MALLOC_PERTURB_="165"), check=True
+        )
+
+
+class TestDtypeDispatch(unittest.TestCase):
+    def test_dispatches_on_dtype(self):
+        for dtype in [np.float32, np.float64, np.int16]:
+            actual = np.ones((2, 5)).astype(dtype)
+            result = pybbmp_interop_test.addAndSum(actual, 2)
+            self.assertTrue(np.array_equal(np.full((2, 5), 3, dtype=dtype), actual))
+            self.assertEqual(30, result)
+
+    def test_unsupported_dtype_raises_type_error(self):
+        with self.assertRaises(TypeError):
+            pybbmp_interop_test.addAndSum(np.ones((2, 5)).astype(np.int32), 2)
+
+
+def multiply_in_worker(data):
+    pybbmp_interop_test.multiplyValues(data, 2.0)
+
+
+class TestSharedMemory(unittest.TestCase):
+    def setUp(self):
+        self.pool = bbmp_shared_memory.SharedMemoryPool()
+        self.data = self.pool.copy(np.ones((4, 1000), dtype=np.float32))
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_exported_function_modifies_shared_memory(self):
+        pybbmp_interop_test.multiplyValues(self.data, 2.0)
+        self.assertTrue(np.array_equal(np.full((4, 1000), 2.0), self.data))
+
+    def test_pickled_without_data(self):
+        view = self.data[1:3]
+        pickled = pickle.dumps(view)
+        self.assertLess(len(pickled), view.nbytes)
+
+        pybbmp_interop_test.test_namespace__add_to_array(pickle.loads(pickled), 1.0)
+        self.assertTrue(np.array_equal(np.array([1, 2, 2, 1]), self.data[:, 0]))
+
+    @unittest.skipUnless(
+        "fork" in multiprocessing.get_all_start_methods(), "requires fork"
+    )
+    def test_workers_modify_shared_memory(self):
+        with multiprocessing.get_context("fork").Pool(2) as workers:
+            workers.map(multiply_in_worker, [self.data[i : i + 1] for i in range(4)])
+        self.assertTrue(np.array_equal(np.full((4, 1000), 2.0), self.data))
+
+    def test_close_unlinks_blocks(self):
+        name = self.data._bbmp_block.name
+        self.pool.close()
+        with self.assertRaises(FileNotFoundError):
+            bbmp_shared_memory.shared_memory.SharedMemory(name=name)
+
+
+class TestNamespaceSubmodules(unittest.TestCase):
+    def test_function_outside_namespace_in_top_level_module(self):
+        self.assertEqual("Hello from C++", pybbmp_interop_test_submodules.hello())
+
+    def test_namespace_is_a_submodule(self):
+        self.assertFalse(hasattr(pybbmp_interop_test_submodules, "test_namespace__add_to_array"))
+
+        expected = np.ones((4, 10)).astype(np.float32) + 1.2
+        actual = np.ones((4, 10)).astype(np.float32)
+        pybbmp_interop_test_submodules.test_namespace.add_to_array(actual, 1.2)
+        self.assertTrue(np.allclose(expected, actual))
+
+    def test_missing_function_in_submodule_raises_attribute_error(self):
+        with self.assertRaises(AttributeError):
+            pybbmp_interop_test_submodules.test_namespace.not_exported
+
+    def test_dir_lists_lazily_registered_functions(self):
+        self.assertIn("add_to_array", dir(pybbmp_interop_test_submodules.test_namespace))
+
+
 if __name__ == "__main__":
     logging.basicConfig()
     if len(sys.argv) < 2:
@@ -68,6 +636,8 @@ specify that directory"""
 
     sys.argv = sys.argv[:1]
     import pybbmp_interop_test
+    import pybbmp_interop_test_submodules
+    import bbmp_shared_memory
 
     print("Functions available in module pybbmp_interop_test:")
     for fs in get_member_functions(pybbmp_interop_test):
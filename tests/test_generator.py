@@ -5,8 +5,12 @@ All rights reserved. Use of this source code is governed the 3-Clause BSD
 License BSD-style license that can be found in the LICENSE file.
 '''
 
+import json
 import sys
 import os
+import socket
+import tempfile
+import threading
 import unittest
 
 
@@ -16,6 +20,8 @@ def rel_to_py(*paths):
 
 sys.path.append(rel_to_py("..", "cmake"))
 import generate_cpp_to_py_bindings as generator
+import bbmp_generator_client
+import bbmp_generator_server
 
 
 class TestFunctionSignatureParsing(unittest.TestCase):
@@ -30,6 +36,10 @@ class TestFunctionSignatureParsing(unittest.TestCase):
             "std::string& funcNotConstNoexcept(int, const std::string&&)"
         )
 
+    def test_template_argument_with_spaces(self):
+        signature = generator.FunctionSignature("size_t sum(bbmp::Span<const uint8_t> payload)")
+        self.assertEqual([("bbmp::Span<const uint8_t>", "payload")], signature.parameters)
+
     def test_return_type(self):
         self.assertEqual("const std::string", self.signature1.return_type)
         self.assertEqual("std::string", self.signature2.return_type)
@@ -62,6 +72,216 @@ class TestFunctionSignatureParsing(unittest.TestCase):
         self.assertEqual([], self.signature3.specifiers)
 
 
+class TestTypedExportParsing(unittest.TestCase):
+    def setUp(self):
+        code = """
+#define EXPORT_TO_PYTHON_TYPES(...)
+
+EXPORT_TO_PYTHON_TYPES(float, double, int16_t)
+template <typename T>
+T sum(const bbmp::OwnedChannelData<T>& data, T offset) {
+  return offset;
+}
+"""
+        self.function_signature_tuples = generator.extract_function_signatures_from_cpp(
+            code.splitlines()
+        )
+        self.signature = generator.FunctionSignature(*self.function_signature_tuples[0])
+
+    def test_typed_export_extracted(self):
+        self.assertEqual(1, len(self.function_signature_tuples))
+
+    def test_template_types(self):
+        self.assertEqual("T", self.signature.template_parameter)
+        self.assertEqual(["float", "double", "int16_t"], self.signature.template_types)
+
+    def test_signature(self):
+        self.assertEqual("sum", self.signature.name)
+        self.assertEqual(
+            "template <typename T> T sum(const bbmp::OwnedChannelData<T>& data, T offset)",
+            self.signature.get_signature(),
+        )
+        self.assertEqual(
+            "int16_t sum<int16_t>(const bbmp::OwnedChannelData<int16_t>&, int16_t)",
+            self.signature.get_instantiation_signature("int16_t"),
+        )
+
+    def test_single_dispatching_entry_point(self):
+        code_sections = generator.generate_code_sections(self.signature)
+        self.assertEqual(
+            (None, "sum"), code_sections.module_function_definitions[0][:2]
+        )
+        code = generator.generate_cpp(code_sections, "mod")
+        self.assertIn("pybind11::object sum_wrapper(pybind11::array data, pybind11::object offset)", code)
+        self.assertIn("table.add<int16_t>(&sum_wrapper_int16_t);", code)
+        self.assertIn("extern template float sum<float>(", code)
+
+
+class TestOutParameters(unittest.TestCase):
+    def setUp(self):
+        self.signature = generator.FunctionSignature(
+            "void scale(bbmp::OutChannelData<float>& result, const bbmp::OwnedChannelData<float>& data, float factor)"
+        )
+
+    def test_out_is_an_optional_last_keyword(self):
+        self.assertEqual(
+            ['pybind11::arg("data")', 'pybind11::arg("factor")', 'pybind11::arg("out") = pybind11::none()'],
+            generator.get_pybind11_arg_code(self.signature),
+        )
+
+    def test_wrapper_allocates_like_first_array_and_returns_out(self):
+        name, code = generator.create_wrapper_function_code(self.signature)
+        self.assertIn(f"pybind11::object {name}(pybind11::array_t<float, 0> data, float factor, pybind11::object result)", code)
+        self.assertIn("auto result_ndarray = bbmp::prepareOutNdarray<float>(result, &data);", code)
+        self.assertIn("scale(result_wrapper, std::move(data_wrapper), std::move(factor));", code)
+        self.assertIn("return std::move(result_ndarray);", code)
+
+
+class TestVectorReturn(unittest.TestCase):
+    def test_arithmetic_vector_returned_as_ndarray(self):
+        name, code = generator.create_wrapper_function_code(
+            generator.FunctionSignature("std::vector<int16_t> samples()")
+        )
+        self.assertIn(f"pybind11::object {name}()", code)
+        self.assertIn("auto result = bbmp::toNdarray(samples());", code)
+
+    def test_channel_data_returned_as_ndarray(self):
+        name, code = generator.create_wrapper_function_code(
+            generator.FunctionSignature(
+                "bbmp::OwnedChannelData<float> mapFile(const std::string& path, int num_channels)"
+            )
+        )
+        self.assertIn(f"pybind11::object {name}(const std::string& path, int num_channels)", code)
+        self.assertIn(
+            "auto result = bbmp::toNdarray(mapFile(std::move(path), std::move(num_channels)));", code
+        )
+        self.assertIn("return std::move(std::move(result));", code)
+
+    def test_other_vectors_not_wrapped(self):
+        self.assertIsNone(
+            generator.create_wrapper_function_code(
+                generator.FunctionSignature("std::vector<std::string> names()")
+            )
+        )
+
+
+class TestConvertingExport(unittest.TestCase):
+    def setUp(self):
+        code = """
+#define EXPORT_TO_PYTHON_CONVERTING
+
+EXPORT_TO_PYTHON_CONVERTING
+float scale(bbmp::OwnedChannelData<float>& data, const bbmp::OwnedChannelData<float>& factors);
+"""
+        self.signature = generator.FunctionSignature(
+            *generator.extract_function_signatures_from_cpp(code.splitlines())[0]
+        )
+
+    def test_annotation_parsed(self):
+        self.assertTrue(self.signature.convert_dtypes)
+        self.assertEqual(
+            "float scale(bbmp::OwnedChannelData<float>& data, const bbmp::OwnedChannelData<float>& factors)",
+            self.signature.get_signature(),
+        )
+
+    def test_arguments_converted_and_mutable_ones_copied_back(self):
+        name, code = generator.create_wrapper_function_code(self.signature)
+        self.assertIn(f"float {name}(pybind11::array data, pybind11::array factors)", code)
+        self.assertIn(
+            'bbmp::ConvertedNdarray<float> data_converted(std::move(data), "scale", "data", true);', code
+        )
+        self.assertIn(
+            'bbmp::ConvertedNdarray<float> factors_converted(std::move(factors), "scale", "factors", false);', code
+        )
+        self.assertIn(
+            os.linesep.join(
+                [
+                    "decltype(auto) result = scale(data_wrapper, std::move(factors_wrapper));",
+                    "data_converted.copyBack();",
+                    "return result;",
+                ]
+            ),
+            code,
+        )
+        self.assertNotIn("factors_converted.copyBack();", code)
+
+    def test_module_gets_conversion_stats(self):
+        code = generator.generate_cpp(generator.generate_code_sections(self.signature), "mod")
+        self.assertIn("bbmp::defineDtypeConversionFunctions(m);", code)
+
+
+class TestBlockFunction(unittest.TestCase):
+    def test_callable_converted_to_block_function(self):
+        name, code = generator.create_wrapper_function_code(
+            generator.FunctionSignature("void apply(const bbmp::BlockFunction<float>& function, int block_size)")
+        )
+        self.assertIn(f"void {name}(pybind11::object function, int block_size)", code)
+        self.assertIn(
+            "auto function_function = bbmp::createBlockFunction<float>(std::move(function));", code
+        )
+        self.assertIn("return apply(std::move(function_function), std::move(block_size));", code)
+
+    def test_block_function_gets_no_trampoline(self):
+        self.assertIsNone(
+            generator.create_c_abi_trampoline_code(
+                generator.FunctionSignature("void apply(bbmp::BlockFunction<float> function)")
+            )
+        )
+
+
+class TestCAbiTrampolines(unittest.TestCase):
+    def test_channel_data_and_references_become_pointers(self):
+        name, code, pointer_type = generator.create_c_abi_trampoline_code(
+            generator.FunctionSignature(
+                "double sum(const bbmp::OwnedChannelData<float>& data, int& count, bbmp::Span<const uint8_t> mask)"
+            )
+        )
+        self.assertEqual("bbmp_c_abi__sum", name)
+        self.assertEqual("double (*)(float*, size_t, size_t, int*, const uint8_t*, size_t)", pointer_type)
+        self.assertIn("return sum(std::move(data_wrapper), *count, bbmp::Span<const uint8_t>(mask, mask_size));", code)
+
+    def test_unsupported_types_get_no_trampoline(self):
+        for signature in ["std::string hello()", "void greet(const std::string& name)"]:
+            self.assertIsNone(
+                generator.create_c_abi_trampoline_code(generator.FunctionSignature(signature))
+            )
+
+    def test_table_only_written_with_c_abi(self):
+        code_sections = generator.generate_code_sections(
+            generator.FunctionSignature("int twice(int value)", "math")
+        )
+        self.assertNotIn("__bbmp_c_abi__", generator.generate_cpp(code_sections, "pyfoo"))
+        code = generator.generate_cpp(code_sections, "pyfoo", c_abi=True)
+        self.assertIn('c_abi_table["math__twice"]', code)
+        self.assertIn('"int (*)(int)"', code)
+
+
+class TestFastcall(unittest.TestCase):
+    def test_scalar_function_gets_fastcall(self):
+        name, code = generator.create_fastcall_code(
+            generator.FunctionSignature("double mix(const double& a, int32_t b)", "dsp")
+        )
+        self.assertEqual("dsp__mix_fastcall_def", name)
+        self.assertIn(
+            "bbmp::fastcall::call<double, int32_t>(self, args, nargs, kwnames, [](double arg0, int32_t arg1) { return dsp::mix(arg0, arg1); });",
+            code,
+        )
+
+    def test_other_types_use_pybind11_dispatch(self):
+        for signature in ["void f(int& result)", "void f(char c)", "std::string& f()", "void f(const std::string& s)"]:
+            self.assertIsNone(generator.create_fastcall_code(generator.FunctionSignature(signature)))
+
+    def test_installed_after_all_definitions_of_scope(self):
+        code_sections = generator.CodeSections()
+        for signature in ["int eight()", "int nine()"]:
+            code_sections.append(generator.generate_code_sections(generator.FunctionSignature(signature, "ns")))
+        for namespace_submodules in [False, True]:
+            code = generator.generate_cpp(code_sections, "pyfoo", namespace_submodules)
+            install = code.index("bbmp::fastcall::install(m, ")
+            self.assertLess(code.rindex("m.def("), install)
+        self.assertIn('bbmp::fastcall::install(m, "nine", &ns__nine_fastcall_def);', code)
+
+
 class TestCodeParsing(unittest.TestCase):
     def setUp(self):
         code = """
@@ -144,5 +364,388 @@ void add_to_array(bbmp::OwnedChannelData<float>& data, const float number) {
             self.function_signatures_set
         )
 
+
+class TestModuleLayout(unittest.TestCase):
+    def setUp(self):
+        self.code_sections = generator.CodeSections()
+        for signature, namespace in [
+            ("std::string hello()", None),
+            ("void add_to_array(bbmp::OwnedChannelData<float>& data, const float number)", "test_namespace"),
+            ("int deep()", "outer::inner"),
+        ]:
+            self.code_sections.append(
+                generator.generate_code_sections(
+                    generator.FunctionSignature(signature, namespace)
+                )
+            )
+
+    def test_flat_layout_uses_mangled_names(self):
+        code = generator.generate_cpp(self.code_sections, "mod")
+        self.assertIn('m.def("hello", &hello);', code)
+        self.assertIn('m.def("test_namespace__add_to_array", &test_namespace__add_to_array_wrapper', code)
+        self.assertIn('m.def("outer__inner__deep", &outer::inner::deep);', code)
+        self.assertNotIn("def_submodule", code)
+
+    def test_memory_accounting_functions(self):
+        code_sections = generator.generate_code_sections(generator.FunctionSignature("int eight()"))
+        self.assertNotIn("defineMemoryAccountingFunctions", generator.generate_cpp(code_sections, "mod"))
+        code = generator.generate_cpp(code_sections, "mod", memory_accounting=True)
+        self.assertIn('#include "bbmp_interop/conversions.hpp"', code)
+        self.assertIn("bbmp::defineMemoryAccountingFunctions(m);", code)
+
+    def test_multi_phase_init(self):
+        code_sections = generator.generate_code_sections(generator.FunctionSignature("int eight()"))
+        code = generator.generate_cpp(code_sections, "mod", multi_phase_init=True)
+        self.assertNotIn("PYBIND11_MODULE", code)
+        self.assertIn("static void bbmp_module_body(pybind11::module& m) {", code)
+        self.assertIn('PyModuleDef_HEAD_INIT, "mod"', code)
+        self.assertIn('extern "C" PYBIND11_EXPORT PyObject* PyInit_mod() {', code)
+        self.assertIn("return PyModuleDef_Init(&bbmp_module_def);", code)
+        self.assertIn("Py_MOD_MULTIPLE_INTERPRETERS_SUPPORTED", code)
+        self.assertNotIn("Py_MOD_PER_INTERPRETER_GIL_SUPPORTED", code)
+
+    def test_namespace_submodules_layout(self):
+        code = generator.generate_cpp(self.code_sections, "mod", namespace_submodules=True)
+        self.assertIn('m.def("hello", &hello);', code)
+        self.assertIn('auto submodule__test_namespace = m.def_submodule("test_namespace");', code)
+        self.assertIn('auto submodule__outer = m.def_submodule("outer");', code)
+        self.assertIn('auto submodule__outer__inner = submodule__outer.def_submodule("inner");', code)
+        self.assertNotIn("register__outer(", code)
+
+    def test_namespace_submodules_are_registered_lazily(self):
+        code = generator.generate_cpp(self.code_sections, "mod", namespace_submodules=True)
+        module_function = code[code.index("PYBIND11_MODULE"):]
+        self.assertNotIn('"deep"', module_function)
+        self.assertIn('m.def("deep", &outer::inner::deep);', code)
+        self.assertIn(
+            "bbmp_register_on_first_access(submodule__outer__inner, &register__outer__inner);",
+            module_function,
+        )
+
+
+class TestCppIndent(unittest.TestCase):
+    def test_braces_in_literals_and_comments_ignored(self):
+        code = generator.cpp_indent(
+            'void f() {\nauto s = "{";\nchar c = \'}\';\n// {\n/* }\n} */\nif (true) {\nreturn;\n} else {\n}\n}', 2
+        )
+        self.assertEqual(
+            'void f() {\n  auto s = "{";\n  char c = \'}\';\n  // {\n  /* }\n  } */\n  if (true) {\n    return;\n  } else {\n  }\n}\n',
+            code,
+        )
+
+
+class TestBatchGeneration(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.shared_source = os.path.join(self.directory.name, "shared.cpp")
+        with open(self.shared_source, "w") as file:
+            file.write("#define EXPORT_TO_PYTHON\nnamespace ns {\nEXPORT_TO_PYTHON\nint eight() { return 8; }\n}\n")
+        self.other_source = os.path.join(self.directory.name, "other.cpp")
+        with open(self.other_source, "w") as file:
+            file.write("#define EXPORT_TO_PYTHON\nEXPORT_TO_PYTHON\nint nine() { return 9; }\n")
+
+        self.outputs = [os.path.join(self.directory.name, f"module{i}_interop.cpp") for i in range(2)]
+        self.manifest = os.path.join(self.directory.name, "manifest.json")
+        with open(self.manifest, "w") as file:
+            json.dump(
+                {
+                    "modules": [
+                        {"module_name": "module0", "output": self.outputs[0], "sources": [self.shared_source]},
+                        {
+                            "module_name": "module1",
+                            "output": self.outputs[1],
+                            "sources": [self.shared_source, self.other_source],
+                            "namespace_submodules": True,
+                        },
+                    ]
+                },
+                file,
+            )
+
+        self.parsed_files = []
+        self.extract_function_signatures_from_cpp = generator.extract_function_signatures_from_cpp
+
+        def counting_extract(file):
+            self.parsed_files.append(file.name)
+            return self.extract_function_signatures_from_cpp(file)
+
+        generator.extract_function_signatures_from_cpp = counting_extract
+
+    def tearDown(self):
+        generator.extract_function_signatures_from_cpp = self.extract_function_signatures_from_cpp
+        self.directory.cleanup()
+
+    def generate(self, *options):
+        changes_cache = generator.ChangesCache(
+            generator.get_changes_cache_path(self.directory.name)
+        )
+        generator.generate(
+            generator.parse_arguments(["--manifest", self.manifest, *options]), changes_cache
+        )
+
+    def test_all_modules_generated(self):
+        self.generate()
+        with open(self.outputs[0], "r") as file:
+            self.assertIn('m.def("ns__eight", &ns::eight);', file.read())
+        with open(self.outputs[1], "r") as file:
+            code = file.read()
+            self.assertIn('m.def("eight", &ns::eight);', code)
+            self.assertIn('m.def("nine", &nine);', code)
+
+    def test_shared_source_parsed_once(self):
+        self.generate()
+        self.assertEqual(sorted([self.shared_source, self.other_source]), sorted(self.parsed_files))
+
+    def test_only_changed_source_rendered_again(self):
+        self.generate()
+
+        rendered = []
+        render_fragments = generator.render_fragments
+
+        def counting_render(code_sections):
+            rendered.append(code_sections.module_function_definitions)
+            return render_fragments(code_sections)
+
+        generator.render_fragments = counting_render
+        try:
+            # Body changes don't change the exported signatures
+            with open(self.shared_source, "a") as file:
+                file.write("// comment\n")
+            with open(self.other_source, "a") as file:
+                file.write("EXPORT_TO_PYTHON\nint ten() { return 10; }\n")
+            for path in [self.shared_source, self.other_source]:
+                os.utime(path, (os.path.getmtime(path) + 10,) * 2)
+
+            self.generate()
+        finally:
+            generator.render_fragments = render_fragments
+
+        self.assertEqual(
+            [[(None, "nine", "&nine", "nine_fastcall_def"), (None, "ten", "&ten", "ten_fastcall_def")]],
+            rendered,
+        )
+        with open(self.outputs[1], "r") as file:
+            code = file.read()
+            self.assertIn('m.def("eight", &ns::eight);', code)
+            self.assertIn('m.def("ten", &ten);', code)
+
+    def generate_report(self):
+        report_path = os.path.join(self.directory.name, "report.json")
+        self.generate("--report", report_path)
+        with open(report_path, "r") as file:
+            return json.load(file)
+
+    def test_report_counts_cache_misses_by_reason(self):
+        report = self.generate_report()
+        self.assertEqual(0, report["cache"]["hits"])
+        self.assertEqual(2, report["cache"]["misses"])
+        self.assertEqual(2, report["cache"]["miss_reasons"]["new"])
+        self.assertEqual(1, report["sources"][self.other_source]["functions"])
+        self.assertEqual([True, True], [m["generated"] for m in report["modules"]])
+        self.assertEqual(3, report["functions_emitted"])
+        self.assertLessEqual(
+            {"cache_load", "cache_validation", "parse", "emit", "write", "cache_save"},
+            set(report["phases"]),
+        )
+
+        with open(self.shared_source, "a") as file:
+            file.write("// comment\n")
+        os.utime(self.shared_source, (os.path.getmtime(self.shared_source) + 10,) * 2)
+        report = self.generate_report()
+        self.assertEqual("mtime", report["sources"][self.shared_source]["reason"])
+        self.assertEqual("hit", report["sources"][self.other_source]["cache"])
+        self.assertEqual([False, False], [m["generated"] for m in report["modules"]])
+        self.assertEqual(0, report["functions_emitted"])
+
+    def test_report_names_generator_change(self):
+        self.generate()
+        cache_path = generator.get_changes_cache_path(self.directory.name)
+        changes_cache = generator.ChangesCache(cache_path)
+        for path, entry in changes_cache.cache.items():
+            if path.endswith(generator.NAME_OF_THIS_FILE):
+                entry["last_modification_time"] -= 10
+        changes_cache.save_to_disk()
+
+        report = self.generate_report()
+        self.assertEqual(2, report["cache"]["miss_reasons"]["generator_changed"])
+
+    def test_modules_without_sources(self):
+        with open(self.manifest, "w") as file:
+            json.dump({"modules": [{"module_name": "module0", "output": self.outputs[0], "sources": []}]}, file)
+        self.generate()
+        changes_cache = generator.ChangesCache(generator.get_changes_cache_path(self.directory.name))
+        generator.generate(
+            generator.parse_arguments(["--output", self.outputs[1], "--sources", "", "--module_name", "module1"]),
+            changes_cache,
+        )
+        for i, output in enumerate(self.outputs):
+            with open(output, "r") as file:
+                self.assertIn(f"PYBIND11_MODULE(module{i}, m)", file.read())
+        self.assertEqual([], self.parsed_files)
+
+    def test_manifest_excludes_single_module_arguments(self):
+        with self.assertRaises(SystemExit):
+            generator.parse_arguments(["--manifest", self.manifest, "--module_name", "module0"])
+
+
+class TestExportManifest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.directory.name, "source.cpp")
+        with open(self.source, "w") as file:
+            file.write(
+                "#define EXPORT_TO_PYTHON\nnamespace ns {\nEXPORT_TO_PYTHON\n"
+                "void scale(bbmp::OwnedChannelData<float>& data, float factor) {}\n}\n"
+                "EXPORT_TO_PYTHON\nint nine() { return 9; }\n"
+            )
+        self.export_manifest = os.path.join(self.directory.name, "lib" + generator.EXPORT_MANIFEST_SUFFIX)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def generate(self, sources, output):
+        changes_cache = generator.ChangesCache(
+            generator.get_changes_cache_path(self.directory.name)
+        )
+        generator.generate(
+            generator.parse_arguments(
+                ["--output", output, "--sources", sources, "--module_name", "module"]
+            ),
+            changes_cache,
+        )
+        with open(output, "r") as file:
+            return file.read()
+
+    def write_export_manifest(self):
+        generator.main(
+            ["--export_manifest", self.export_manifest, "--sources", self.source, "--library_name", "lib"]
+        )
+
+    def test_manifest_records_signatures_and_requirements(self):
+        self.write_export_manifest()
+        with open(self.export_manifest, "r") as file:
+            manifest = json.load(file)
+        self.assertEqual("lib", manifest["library"])
+        self.assertEqual(
+            [(None, []), ("ns", ["channel_data"])],
+            [(f["namespace"], f["requirements"]) for f in manifest["functions"]],
+        )
+
+    def test_module_from_manifest_matches_module_from_sources(self):
+        self.write_export_manifest()
+        from_sources = self.generate(self.source, os.path.join(self.directory.name, "sources_interop.cpp"))
+
+        extract_function_signatures_from_cpp = generator.extract_function_signatures_from_cpp
+        generator.extract_function_signatures_from_cpp = None
+        try:
+            from_manifest = self.generate(
+                self.export_manifest, os.path.join(self.directory.name, "manifest_interop.cpp")
+            )
+        finally:
+            generator.extract_function_signatures_from_cpp = extract_function_signatures_from_cpp
+
+        self.assertEqual(from_sources, from_manifest)
+
+    def test_unchanged_manifest_not_rewritten(self):
+        self.write_export_manifest()
+        self.assertFalse(generator.write_export_manifest(self.export_manifest, [self.source], "lib"))
+
+    def test_unknown_requirements_rejected(self):
+        self.write_export_manifest()
+        with open(self.export_manifest, "r") as file:
+            manifest = json.load(file)
+        manifest["functions"][0]["requirements"].append("from_the_future")
+        with open(self.export_manifest, "w") as file:
+            json.dump(manifest, file)
+
+        with self.assertRaises(ValueError):
+            generator.read_export_manifest(self.export_manifest)
+
+    def test_export_manifest_excludes_module_arguments(self):
+        with self.assertRaises(SystemExit):
+            generator.parse_arguments(
+                ["--export_manifest", self.export_manifest, "--sources", self.source, "--module_name", "module"]
+            )
+
+
+class TestGeneratorServer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.directory.name, "source.cpp")
+        self.output = os.path.join(self.directory.name, "module_interop.cpp")
+        with open(self.source, "w") as file:
+            file.write("#define EXPORT_TO_PYTHON\nEXPORT_TO_PYTHON\nint eight() { return 8; }\n")
+
+        self.generator_argv = [
+            "--output", self.output, "--sources", self.source, "--module_name", "module",
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_unreachable_server_returns_none(self):
+        self.assertIsNone(
+            bbmp_generator_client.request_generation(
+                self.directory.name, self.generator_argv, cwd=self.directory.name
+            )
+        )
+
+    def start_server(self) -> threading.Thread:
+        server = bbmp_generator_server.GeneratorServer(self.directory.name, idle_timeout=0.5)
+        server_thread = threading.Thread(target=server.serve_forever)
+        server_thread.start()
+        for _ in range(100):
+            if bbmp_generator_client.read_address(self.directory.name) is not None:
+                break
+            server_thread.join(0.01)
+        return server_thread
+
+    def stop_server(self, server_thread: threading.Thread):
+        # The server changes into the working directory of each request
+        os.chdir(rel_to_py("."))
+        server_thread.join()
+
+    def send(self, request) -> dict:
+        address = bbmp_generator_client.read_address(self.directory.name)
+        with socket.create_connection(("127.0.0.1", address["port"]), timeout=5) as connection:
+            connection.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            with connection.makefile("rb") as response_stream:
+                return json.loads(response_stream.readline().decode("utf-8"))
+
+    def test_generation_through_server(self):
+        server_thread = self.start_server()
+        try:
+            response = bbmp_generator_client.request_generation(
+                self.directory.name, self.generator_argv, cwd=self.directory.name
+            )
+            self.assertEqual(0, response["returncode"])
+            with open(self.output, "r") as output_file:
+                self.assertIn('m.def("eight", &eight);', output_file.read())
+
+            response = bbmp_generator_client.request_generation(
+                self.directory.name, self.generator_argv, cwd=self.directory.name
+            )
+            self.assertEqual(0, response["returncode"])
+            self.assertIn("Skipping code generation", response["output"])
+        finally:
+            self.stop_server(server_thread)
+
+        self.assertIsNone(bbmp_generator_client.read_address(self.directory.name))
+
+    def test_malformed_requests_refused(self):
+        server_thread = self.start_server()
+        try:
+            token = bbmp_generator_client.read_address(self.directory.name)["token"]
+            for request in [[], {"token": token, "argv": self.generator_argv}]:
+                self.assertIsNone(self.send(request)["returncode"])
+
+            response = bbmp_generator_client.request_generation(
+                self.directory.name, self.generator_argv, cwd=self.directory.name
+            )
+            self.assertEqual(0, response["returncode"])
+        finally:
+            self.stop_server(server_thread)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,21 @@
+/*
+ * Copyright (c) 2020 Attila Szarvas <attila.szarvas@gmail.com>
+ *
+ * All rights reserved. Use of this source code is governed the 3-Clause BSD
+ * License BSD-style license that can be found in the LICENSE file.
+ */
+
+#include "bbmp_interop/types.hpp"
+
+#include <cstdint>
+#include <vector>
+
+#define EXPORT_TO_PYTHON
+
+// Addresses of the singletons seen by this shared library, which must be the
+// ones of the module linking it
+EXPORT_TO_PYTHON
+std::vector<uint64_t> sharedLibrarySingletonAddresses() {
+  return {reinterpret_cast<uint64_t>(&bbmp::MemoryAccounting::global()),
+          reinterpret_cast<uint64_t>(&bbmp::BufferPool::global())};
+}